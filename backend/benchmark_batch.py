@@ -0,0 +1,90 @@
+"""
+Benchmark de preguntas por lotes: search_answer en un ciclo vs. search_answer_batch
+Uso: python benchmark_batch.py --questions 2000 --chunks 64 256
+"""
+
+import time
+import argparse
+from typing import Dict, List
+
+from corpus_integration import integrated_corpus
+from qa_system import DiabetesKnowledgeBase
+from query_cache import QueryCache
+from benchmark_search import sample_queries
+
+
+def fresh_knowledge_base() -> DiabetesKnowledgeBase:
+    """Base de conocimiento sin caché de respuestas ni plazo (como un trabajo por lotes)"""
+    knowledge_base = DiabetesKnowledgeBase(corpus=integrated_corpus, deadline_ms=0)
+    knowledge_base.answer_cache = QueryCache(max_entries=0)
+    return knowledge_base
+
+
+def run_loop(questions: List[str], threshold: float) -> Dict:
+    """Una llamada a search_answer por pregunta"""
+    knowledge_base = fresh_knowledge_base()
+    start = time.perf_counter()
+    results = [knowledge_base.search_answer(question, threshold=threshold) for question in questions]
+    elapsed = time.perf_counter() - start
+    return {'results': results, 'qps': len(questions) / elapsed if elapsed else 0.0, 'seconds': elapsed}
+
+
+def run_batch(questions: List[str], threshold: float, chunk: int) -> Dict:
+    """search_answer_batch con bloques de chunk preguntas"""
+    knowledge_base = fresh_knowledge_base()
+    knowledge_base.BATCH_CHUNK = chunk
+    start = time.perf_counter()
+    first_answer = None
+    results = []
+    for result in knowledge_base.search_answer_batch(questions, threshold=threshold):
+        if first_answer is None:
+            first_answer = time.perf_counter() - start
+        results.append(result)
+    elapsed = time.perf_counter() - start
+    return {
+        'results': results,
+        'qps': len(questions) / elapsed if elapsed else 0.0,
+        'seconds': elapsed,
+        'first_ms': (first_answer or 0.0) * 1000
+    }
+
+
+def same_answers(a: List[Dict], b: List[Dict]) -> int:
+    """Preguntas con la misma respuesta, fuente y confianza en ambas corridas"""
+    keys = ('answer', 'source', 'confidence')
+    return sum(tuple(x[key] for key in keys) == tuple(y[key] for key in keys) for x, y in zip(a, b))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de search_answer por lotes')
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--chunks', type=int, nargs='+', default=[64, 256])
+    parser.add_argument('--threshold', type=float, default=0.35)
+    args = parser.parse_args()
+
+    integrated_corpus.load_status.wait()
+    if integrated_corpus.corpus_data is None:
+        print("[ERROR] No hay corpus cargado")
+        return
+
+    # Sin caché de consultas: cada corrida debe ejecutar la búsqueda completa
+    integrated_corpus.query_cache = QueryCache(max_entries=0)
+    questions = sample_queries(args.questions)
+    # Calienta las cascadas y la matriz de postings para no medir su construcción
+    list(fresh_knowledge_base().search_answer_batch(questions[:8], threshold=args.threshold))
+
+    print(f"Corpus: {len(integrated_corpus.corpus_data)} registros, {len(questions)} preguntas\n")
+    print(f"{'modo':<10}{'bloque':>8}{'preguntas/s':>14}{'total s':>10}{'1ª resp. ms':>13}{'iguales':>10}")
+
+    baseline = run_loop(questions, args.threshold)
+    print(f"{'ciclo':<10}{'-':>8}{baseline['qps']:>14.1f}{baseline['seconds']:>10.2f}{'-':>13}{'-':>10}")
+
+    for chunk in args.chunks:
+        batch = run_batch(questions, args.threshold, chunk)
+        same = same_answers(baseline['results'], batch['results'])
+        print(f"{'lote':<10}{chunk:>8}{batch['qps']:>14.1f}{batch['seconds']:>10.2f}"
+              f"{batch['first_ms']:>13.1f}{same:>6}/{len(questions)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark de la búsqueda del corpus: proceso único vs. búsqueda repartida en procesos
+Uso: python benchmark_search.py --workers 2 4 8 --modes sequence bm25 tfidf
+"""
+
+import time
+import random
+import argparse
+from typing import Dict, List
+
+from corpus_integration import integrated_corpus
+from query_cache import QueryCache
+
+DEFAULT_QUERIES = [
+    'qué síntomas tiene la diabetes',
+    'glucosa elevada en ayunas',
+    'tipos de insulina',
+    'qué alimentos puedo comer',
+    'complicaciones de la diabetes',
+    'what are the symptoms of diabetes',
+    'high blood sugar after eating',
+    'metformin side effects'
+]
+
+
+def sample_queries(count: int, seed: int = 7) -> List[str]:
+    """Consultas fijas más preguntas del corpus recortadas (como las escribe un usuario)"""
+    rng = random.Random(seed)
+    questions = integrated_corpus.corpus_data.questions
+    queries = list(DEFAULT_QUERIES)
+    while len(queries) < count:
+        words = questions[rng.randrange(len(questions))].split()
+        queries.append(' '.join(words[:rng.randint(3, 10)]))
+    return queries[:count]
+
+
+def run(queries: List[str], mode: str, threshold: float, top_k: int) -> Dict:
+    """Ejecuta todas las consultas y mide la latencia"""
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(integrated_corpus.search(query, threshold=threshold, top_k=top_k, mode=mode))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'results': results,
+        'qps': len(queries) / total if total else 0.0,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de búsqueda repartida del corpus')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--modes', nargs='+', default=['sequence', 'bm25'])
+    parser.add_argument('--queries', type=int, default=40)
+    parser.add_argument('--threshold', type=float, default=0.3)
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+
+    integrated_corpus.load_status.wait()
+    if integrated_corpus.corpus_data is None:
+        print("[ERROR] No hay corpus cargado")
+        return
+
+    # Sin caché de consultas: cada corrida debe ejecutar la búsqueda completa
+    integrated_corpus.query_cache = QueryCache(max_entries=0)
+    queries = sample_queries(args.queries)
+    print(f"Corpus: {len(integrated_corpus.corpus_data)} registros, {len(queries)} consultas\n")
+    print(f"{'modo':<10}{'procesos':>10}{'consultas/s':>14}{'p50 ms':>10}{'p95 ms':>10}{'iguales':>10}")
+
+    for mode in args.modes:
+        integrated_corpus.disable_sharding()
+        baseline = run(queries, mode, args.threshold, args.top_k)
+        print(f"{mode:<10}{1:>10}{baseline['qps']:>14.2f}{baseline['p50_ms']:>10.1f}{baseline['p95_ms']:>10.1f}{'-':>10}")
+
+        for workers in args.workers:
+            integrated_corpus.enable_sharding(workers)
+            sharded = run(queries, mode, args.threshold, args.top_k)
+            same = 'sí' if sharded['results'] == baseline['results'] else 'no'
+            print(f"{mode:<10}{workers:>10}{sharded['qps']:>14.2f}{sharded['p50_ms']:>10.1f}{sharded['p95_ms']:>10.1f}{same:>10}")
+
+    integrated_corpus.disable_sharding()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Eliminación de duplicados entre las fuentes del corpus
+- Duplicados exactos: misma pregunta normalizada (su clave de búsqueda)
+- Casi duplicados: MinHash sobre bigramas de palabras con LSH por bandas;
+  cada par candidato se confirma con la similitud de Jaccard exacta
+Se conserva la fila más temprana de cada grupo, con la unión de las fuentes del grupo
+"""
+
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+NEAR_DUPLICATE_THRESHOLD = 0.8
+NUM_BANDS = 16
+ROWS_PER_BAND = 6
+# Solo las primeras palabras de preguntas largas (ChatDoctor) entran a la firma
+MAX_TOKENS = 100
+_SEED = 20240
+
+
+def _shingles(questions: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Bigramas de palabras de cada pregunta como enteros de 64 bits (formato CSR)"""
+    vocabulary: Dict[str, int] = {}
+    keys = array('q')
+    offsets = array('q', [0])
+
+    for question in questions:
+        ids = [vocabulary.setdefault(tok, len(vocabulary)) for tok in question.split()[:MAX_TOKENS]]
+        if len(ids) == 1:
+            # Parte baja en cero: no coincide con ningún bigrama
+            keys.append(ids[0] << 32)
+        else:
+            keys.extend(sorted({(a << 32) | (b + 1) for a, b in zip(ids, ids[1:])}))
+        offsets.append(len(keys))
+
+    return np.frombuffer(keys, dtype=np.int64).view(np.uint64), np.frombuffer(offsets, dtype=np.int64)
+
+
+def _band_keys(keys: np.ndarray, offsets: np.ndarray) -> List[np.ndarray]:
+    """Para cada banda, un hash de sus ROWS_PER_BAND mínimos de MinHash por fila"""
+    rng = np.random.default_rng(_SEED)
+    starts = offsets[:-1]
+    bands = []
+    for _ in range(NUM_BANDS):
+        band = np.zeros(len(starts), dtype=np.uint64)
+        for _ in range(ROWS_PER_BAND):
+            # Hash multiplicativo (a impar), con aritmética módulo 2^64
+            a, b, mix = rng.integers(1, 2 ** 63, size=3, dtype=np.uint64) | np.uint64(1)
+            hashed = (keys * a + b) >> np.uint64(32)
+            band = band * mix + np.minimum.reduceat(hashed, starts)
+        bands.append(band)
+    return bands
+
+
+class _DisjointSet:
+    """Unión por mínimo: la raíz de cada grupo es su fila más temprana"""
+
+    def __init__(self, size: int):
+        self.parent = np.arange(size, dtype=np.int64)
+
+    def find(self, row: int) -> int:
+        root = row
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[row] != root:
+            self.parent[row], row = root, self.parent[row]
+        return int(root)
+
+    def union(self, first: int, second: int):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+def deduplicate(keys: Sequence[str], source_codes: np.ndarray, source_names: List[str],
+                threshold: float = NEAR_DUPLICATE_THRESHOLD) -> Tuple[np.ndarray, np.ndarray, Dict, np.ndarray]:
+    """
+    keys son las preguntas ya normalizadas (las claves de text_normalization, calculadas
+    al ingerir). Retorna (filas_conservadas, máscara_de_fuentes, reporte, representantes).
+    máscara_de_fuentes[i] tiene el bit 1 << código encendido por cada fuente que
+    aportó la pregunta de filas_conservadas[i] (incluida la propia).
+    representantes[j] es la fila conservada que reemplaza a la fila de entrada j.
+    """
+    num_rows = len(keys)
+    normalized = list(keys)
+    groups = _DisjointSet(num_rows)
+
+    # Duplicados exactos; las preguntas sin palabras no se agrupan
+    codes, _ = pd.factorize(pd.Series(normalized), sort=False)
+    first_rows = np.full(codes.max() + 1 if num_rows else 0, num_rows, dtype=np.int64)
+    np.minimum.at(first_rows, codes, np.arange(num_rows))
+    has_words = np.array([bool(text) for text in normalized], dtype=bool)
+    groups.parent[has_words] = first_rows[codes[has_words]]
+    unique_rows = np.flatnonzero(has_words & (groups.parent == np.arange(num_rows)))
+    exact_duplicates = int(has_words.sum() - len(unique_rows))
+
+    # Casi duplicados entre las preguntas únicas
+    near_duplicates = 0
+    if len(unique_rows) > 1:
+        keys, offsets = _shingles([normalized[row] for row in unique_rows])
+        shingle_sets = {}
+
+        def shingle_set(position: int) -> set:
+            if position not in shingle_sets:
+                shingle_sets[position] = set(keys[offsets[position]:offsets[position + 1]].tolist())
+            return shingle_sets[position]
+
+        for band in _band_keys(keys, offsets):
+            order = np.argsort(band, kind='stable')
+            boundaries = np.flatnonzero(np.diff(band[order])) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(order)]))
+            shared = ends - starts > 1
+            for start, end in zip(starts[shared].tolist(), ends[shared].tolist()):
+                # Cada fila se compara con un representante de cada grupo ya visto en la
+                # cubeta, no solo con la primera: dos filas parecidas entre sí pero no a
+                # la primera también se agrupan
+                anchors = []
+                for position in order[start:end].tolist():
+                    row = int(unique_rows[position])
+                    joined = False
+                    for anchor in anchors:
+                        if groups.find(row) == groups.find(int(unique_rows[anchor])):
+                            joined = True
+                            continue
+                        first, second = shingle_set(anchor), shingle_set(position)
+                        if len(first & second) >= threshold * len(first | second):
+                            groups.union(int(unique_rows[anchor]), row)
+                            near_duplicates += 1
+                            joined = True
+                    if not joined:
+                        anchors.append(position)
+
+    # Cada fila apunta a una fila anterior de su grupo: se salta hasta la raíz
+    roots = groups.parent
+    while True:
+        parents = roots[roots]
+        if np.array_equal(parents, roots):
+            break
+        roots = parents
+    kept = np.flatnonzero(roots == np.arange(num_rows))
+    masks = np.zeros(num_rows, dtype=np.uint32)
+    np.bitwise_or.at(masks, roots, np.left_shift(np.uint32(1), np.asarray(source_codes, dtype=np.uint32)))
+
+    removed_codes = np.asarray(source_codes)[roots != np.arange(num_rows)]
+    report = {
+        'input_records': num_rows,
+        'exact_duplicates': exact_duplicates,
+        'near_duplicates': near_duplicates,
+        'removed_records': num_rows - len(kept),
+        'output_records': len(kept),
+        'near_duplicate_threshold': threshold,
+        'removed_by_source': {
+            source_names[code]: int(count) for code, count in zip(*np.unique(removed_codes, return_counts=True))
+        }
+    }
+    return kept, masks[kept], report, roots
@@ -4,73 +4,750 @@ Integra múltiples archivos CSV en un sistema de búsqueda unificado
 """
 
 import pandas as pd
+import numpy as np
 import os
 import json
-from typing import Dict, List, Tuple
-from difflib import SequenceMatcher
+import time
+import logging
+import heapq
+import itertools
+import threading
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+from search_index import BM25Index, CharNgramIndex, KeywordIndex, TagIndex
+from sequence_cascade import SequenceMatchCascade, cascade_arrays
+from sharded_search import ShardedSearch
+from query_cache import QueryCache
+from text_normalization import REMOVE_STOPWORDS, normalization_signature, normalize_text
+from language_detection import LANGUAGE_CODES, LANGUAGES, detect_language, resolve_language
+from corpus_tiers import COLD_TIER_THRESHOLD, HOT_MIN_SCORE, TIER_CODES, TIERS, tier_of
+from corpus_dedup import deduplicate
+from corpus_statistics import corpus_statistics
+from memory_usage import current_rss, peak_rss, private_memory, to_mb
+from corpus_store import CompressedStrings, CorpusStore, PackedStrings
+from load_status import ERROR, LoadStatus, run_in_background
+from read_write_lock import ReadWriteLock
+from corpus_partitions import SourcePartition
+from corpus_snapshot import (
+    CorpusSnapshot, StringColumnBuilder, ARTIFACTS_HELP, StaleIndexError, artifact_settings,
+    artifacts_lock, content_hash, file_fingerprints, read_index_file, write_index_file
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CorpusIngestionError(RuntimeError):
+    """Uno o más CSV del corpus no se pudieron ingerir; failed: {archivo: error}"""
+
+    def __init__(self, failed: Dict[str, str]):
+        self.failed = failed
+        super().__init__(
+            "No se pudieron ingerir: " + '; '.join(f"{filename} ({error})" for filename, error in failed.items())
+        )
+
 
 class CorpusIntegration:
     """Integra múltiples corpus médicos en un sistema de búsqueda unificado"""
     
-    def __init__(self):
+    # Modos de búsqueda disponibles en search()
+    SEARCH_MODES = ('bm25', 'tfidf', 'sequence')
+    
+    def __init__(self, search_mode: str = 'bm25', search_workers: int = None, memory_limit_mb: int = None,
+                 background: bool = False, watch_interval: float = None,
+                 remove_stopwords: bool = REMOVE_STOPWORDS, cold_threshold: float = COLD_TIER_THRESHOLD,
+                 data_dir: str = None, artifacts_dir: str = None, artifacts_only: bool = None,
+                 shared_memory: bool = None):
+        # CSV de entrada, directorio de artefactos (snapshots, particiones e índice) y
+        # modo solo artefactos: abre lo construido con "python -m corpus_integration build"
+        self.data_dir, self.artifacts_dir, self.artifacts_only = artifact_settings(
+            data_dir, artifacts_dir, artifacts_only
+        )
+        self.partitions_dir = os.path.join(self.artifacts_dir, 'partitions')
+        self.index_file = os.path.join(self.artifacts_dir, 'corpus_index.bin')
         self.corpus_data = None
+        self.search_index = None
+        self.ngram_index = None
+        # Fila de corpus_data que corresponde a cada documento de los índices
+        self.index_row_ids = None
+        # Cascada de SequenceMatcher de cada nivel, construida al primer uso
+        self.sequence_cascades = {}
+        self.keyword_index = None
+        # Filas de cada etiqueta; se arma al cargar el corpus
+        self.tag_index = None
+        # Filas de cada conjunto de fuentes consultado con best_match o search_by_tag
+        self.source_rows = {}
+        # Cascada de best_match sobre las filas de un conjunto de fuentes en cada nivel
+        self.source_cascades = {}
+        self.partition_ranges = None
+        self.sharded_search = None
+        self.search_mode = search_mode
+        # Procesos para la búsqueda repartida (0 = buscar en el proceso actual)
+        if search_workers is None:
+            search_workers = int(os.environ.get('CORPUS_SEARCH_WORKERS', '0'))
+        self.search_workers = search_workers
+        # Límite de RSS durante la carga de los CSV (0 = sin límite)
+        if memory_limit_mb is None:
+            memory_limit_mb = int(os.environ.get('CORPUS_MEMORY_LIMIT_MB', '0'))
+        self.memory_limit_mb = memory_limit_mb
+        # Normalización de claves y consultas (text_normalization)
+        self.remove_stopwords = remove_stopwords
+        # Similitud del mejor resultado caliente por debajo de la cual se consulta el nivel frío
+        self.cold_threshold = cold_threshold
+        # Varios workers de uvicorn: corpus e índices solo se leen de los archivos mapeados
+        # (páginas compartidas entre procesos) y el nivel caliente no se copia a cada worker
+        if shared_memory is None:
+            shared_memory = os.environ.get(
+                'CORPUS_SHARED_MEMORY', '1' if int(os.environ.get('WEB_CONCURRENCY', '1')) > 1 else '0'
+            ) == '1'
+        self.shared_memory = shared_memory
+        self.tier_searches = {'hot_only': 0, 'with_cold': 0}
+        self.source_fingerprints = {}
+        # Resultados de search() por consulta normalizada; se vacía al recargar el corpus
+        self.query_cache = QueryCache()
+        # Aumenta en cada carga, para que otras cachés detecten una recarga
+        self.corpus_version = 0
         self.corpus_metadata = {
             'total_records': 0,
             'sources': {},
             'loaded_files': []
         }
-        self.load_all_corpus()
+        # Las búsquedas leen con este candado; la recarga incremental reemplaza el corpus con él
+        self._swap_lock = ReadWriteLock()
+        self._refresh_lock = threading.Lock()
+        # Un candado por caché perezosa: varias búsquedas (con el candado de lectura) no la
+        # construyen a la vez; las que la encuentran ya armada no lo toman
+        self._cache_locks = {
+            name: threading.Lock()
+            for name in ('cascade_arrays', 'sequence_cascades', 'keyword_index', 'source_rows', 'source_cascades',
+                         'partition_ranges')
+        }
+        self._counter_lock = threading.Lock()
+        self.refresh_status = LoadStatus()
+        self.last_refresh = None
+        self._watcher_stop = None
+        # Con background=True la carga corre en un hilo; search() retorna [] hasta que termine
+        self.load_status = LoadStatus()
+        if background:
+            run_in_background('corpus', self.load_all_corpus)
+        else:
+            self.load_all_corpus()
+        # Revisión periódica de los CSV en segundos (0 = desactivada)
+        if watch_interval is None:
+            watch_interval = float(os.environ.get('CORPUS_WATCH_INTERVAL', '0'))
+        if watch_interval > 0 and not self.artifacts_only:
+            self.start_watcher(watch_interval)
+    
+    # Archivos CSV integrados y nombre de la fuente de cada uno
+    CORPUS_FILES = [
+        ('data_general.csv', 'general'),
+        ('data_medical.csv', 'medical'),
+        ('ChatDoctor_HealthCareMagic_train.csv', 'healthcare'),
+        ('DiabetesQA_train.csv', 'diabetes_qa'),
+        ('diabetes_qa_train.csv', 'diabetes_qa_v2'),
+        ('medicine_qa_diabetes_train.csv', 'medicine_qa'),
+        ('train.csv', 'generic_train')
+    ]
+    
+    # Nombres de la columna (opcional) de etiquetas, p. ej. 'tags' en data_general.csv
+    TAG_COLUMNS = ('tags', 'tag', 'keywords')
+    
+    # Filas por bloque al leer los CSV; se reduce hasta MIN_CHUNK_ROWS si se supera el límite de memoria
+    CHUNK_ROWS = 20000
+    MIN_CHUNK_ROWS = 1000
     
     def load_all_corpus(self):
-        """Carga y integra todos los corpus disponibles"""
-        data_dir = 'data'
-        corpus_files = [
-            ('data_general.csv', 'general'),
-            ('data_medical.csv', 'medical'),
-            ('ChatDoctor_HealthCareMagic_train.csv', 'healthcare'),
-            ('DiabetesQA_train.csv', 'diabetes_qa'),
-            ('diabetes_qa_train.csv', 'diabetes_qa_v2'),
-            ('medicine_qa_diabetes_train.csv', 'medicine_qa'),
-            ('train.csv', 'generic_train')
-        ]
+        """Carga y integra todos los corpus disponibles (desde snapshot si está vigente)"""
+        self.load_status.start(stage='snapshot', files_loaded=0, files_total=len(self.CORPUS_FILES))
+        try:
+            self._load_all_corpus()
+        except Exception as e:
+            self.load_status.fail(e)
+            raise
+        self.load_status.finish(records=len(self.corpus_data) if self.corpus_data is not None else 0)
+    
+    def _load_all_corpus(self):
+        snapshot = CorpusSnapshot(os.path.join(self.artifacts_dir, 'corpus'))
+        self._reset_derived()
+        if self.artifacts_only:
+            self._load_artifacts(snapshot)
+            if self.search_workers > 0:
+                self.load_status.update(stage='sharding')
+                self.enable_sharding(self.search_workers)
+            return
+        
+        fingerprints = file_fingerprints(self.data_dir, [filename for filename, _ in self.CORPUS_FILES])
+        
+        # Camino rápido: snapshot e índices del corpus completo vigentes
+        loaded = self._load_current_snapshot(snapshot, fingerprints)
         
-        all_data = []
+        # Si no, se une el corpus desde las particiones por fuente (solo se ingieren las que cambiaron).
+        # Con varios workers solo uno construye: los demás esperan el candado y abren lo que escribió
+        if not loaded:
+            with artifacts_lock(self.artifacts_dir):
+                if not self._load_current_snapshot(snapshot, fingerprints):
+                    self.load_status.update(stage='partitions')
+                    state = self._build_corpus(fingerprints, self.load_status)
+                    if state is not None:
+                        self._install(state)
+                        self._save_corpus(state)
+                        self._map_from_snapshot()
         
-        for filename, source_name in corpus_files:
-            filepath = os.path.join(data_dir, filename)
+        if self.search_workers > 0:
+            self.load_status.update(stage='sharding')
+            self.enable_sharding(self.search_workers)
+    
+    def _load_current_snapshot(self, snapshot: CorpusSnapshot, fingerprints: Dict) -> bool:
+        """Abre snapshot e índice si se construyeron con los archivos actuales"""
+        if not snapshot.is_current(self._snapshot_fingerprints(fingerprints)):
+            return False
+        try:
+            self._load_snapshot(snapshot)
+            self.source_fingerprints = fingerprints
+            self.load_status.update(stage='index')
+            return self.load_search_index()
+        except Exception as e:
+            print(f"[WARN] Snapshot del corpus inválido, se reconstruye desde las particiones: {e}")
+            return False
+    
+    def _load_artifacts(self, snapshot: CorpusSnapshot):
+        """Modo solo artefactos: abre snapshot e índice construidos offline, sin leer los CSV"""
+        stored = snapshot.stored_fingerprints()
+        if stored is None:
+            raise FileNotFoundError(f"No hay artefactos del corpus vigentes en {self.artifacts_dir}; {ARTIFACTS_HELP}")
+        if stored.get('normalization') != normalization_signature(self.remove_stopwords):
+            raise ValueError("Los artefactos del corpus se construyeron con otra normalización de textos")
+        
+        self._load_snapshot(snapshot)
+        self.source_fingerprints = {key: value for key, value in stored.items() if key != 'normalization'}
+        self.load_status.update(stage='index')
+        if not self.load_search_index():
+            raise FileNotFoundError(f"Falta o no corresponde el índice {self.index_file}; {ARTIFACTS_HELP}")
+    
+    def _reset_derived(self):
+        """Descarta lo que depende del corpus cargado (cachés e índices perezosos)"""
+        self.sequence_cascades = {}
+        self.keyword_index = None
+        self.source_rows = {}
+        self.source_cascades = {}
+        self.partition_ranges = None
+        self.query_cache.clear()
+        self.corpus_version += 1
+    
+    def _build_corpus(self, fingerprints: Dict, status: LoadStatus) -> Optional[Dict]:
+        """
+        Arma corpus e índices uniendo las particiones por fuente, sin modificar el estado
+        actual. Las particiones cuyo archivo no cambió se reutilizan desde disco; la
+        eliminación de duplicados siempre corre sobre todas las filas, porque un cambio
+        en una fuente puede cambiar qué filas de otras fuentes se conservan.
+        Si algún archivo existente no se puede ingerir lanza CorpusIngestionError.
+        """
+        metadata = {
+            'total_records': 0,
+            'sources': {},
+            'loaded_files': [],
+            'ingestion': {
+                'chunk_rows': self.CHUNK_ROWS,
+                'memory_limit_mb': self.memory_limit_mb or None
+            }
+        }
+        partitions = []
+        reingested = []
+        # Archivos que no se pudieron ingerir (límite de memoria, CSV ilegible...)
+        failed = {}
+        # Huellas de lo que sí entró al corpus (None: el archivo no existe); son las que
+        # se guardan con el snapshot, separadas de las huellas en disco
+        ingested_fingerprints = {}
+        
+        for position, (filename, source_name) in enumerate(self.CORPUS_FILES):
+            status.update(file=filename, files_loaded=position)
+            if fingerprints.get(filename) is None:
+                ingested_fingerprints[filename] = None
+                continue
             try:
-                if os.path.exists(filepath):
-                    df = pd.read_csv(filepath)
-                    
-                    # Normalizar columnas
-                    normalized_df = self._normalize_dataframe(df, source_name)
-                    
-                    if len(normalized_df) > 0:
-                        all_data.append(normalized_df)
-                        
-                        self.corpus_metadata['sources'][source_name] = {
-                            'filename': filename,
-                            'records': len(normalized_df),
-                            'columns': list(df.columns)
-                        }
-                        self.corpus_metadata['loaded_files'].append(filename)
-                        
-                        print(f"[OK] {source_name}: {len(normalized_df)} registros")
+                partition, ingested = self._get_partition(filename, source_name, fingerprints[filename])
             except Exception as e:
-                print(f"[WARN] Error cargando {filename}: {e}")
+                logger.error("Error ingiriendo %s: %s", filename, e)
+                failed[filename] = str(e)
+                continue
+            ingested_fingerprints[filename] = fingerprints[filename]
+            if ingested:
+                reingested.append(source_name)
         
-        if all_data:
-            self.corpus_data = pd.concat(all_data, ignore_index=True)
-            self.corpus_metadata['total_records'] = len(self.corpus_data)
-            print(f"\n[OK] Corpus integrado: {self.corpus_metadata['total_records']} registros totales")
-            print(f"[OK] Fuentes: {', '.join(self.corpus_metadata['sources'].keys())}")
-        else:
+            if len(partition) > 0:
+                partitions.append(partition)
+                metadata['sources'][source_name] = {
+                    'filename': filename,
+                    'records': len(partition),
+                    'columns': partition.metadata.get('columns', []),
+                    'peak_rss_mb': partition.metadata.get('peak_rss_mb')
+                }
+                metadata['loaded_files'].append(filename)
+                origin = 'ingerido' if ingested else 'partición guardada'
+                peak = metadata['sources'][source_name]['peak_rss_mb']
+                if peak is not None:
+                    # Pico de RSS medido al ingerir el archivo (guardado con la partición)
+                    origin += f", pico RSS: {peak} MB"
+                print(f"[OK] {source_name}: {len(partition)} registros ({origin})")
+        
+        # Un corpus sin alguna fuente no se sirve ni se guarda: el snapshot quedaría vigente
+        # para esos archivos y la fuente faltante no volvería hasta borrar los artefactos
+        if failed:
+            raise CorpusIngestionError(failed)
+        
+        if not partitions:
             print("[WARN] No se cargaron corpus")
+            return None
+        
+        status.update(stage='deduplication', files_loaded=len(self.CORPUS_FILES))
+        sizes = [len(partition) for partition in partitions]
+        # Las fuentes sin columna de etiquetas aportan etiquetas vacías
+        tags = None
+        if any(partition.tags is not None for partition in partitions):
+            tags = PackedStrings.concat([
+                partition.tags if partition.tags is not None else PackedStrings.empty(len(partition))
+                for partition in partitions
+            ])
+        combined = CorpusStore(
+            PackedStrings.concat([partition.questions for partition in partitions]),
+            PackedStrings.concat([partition.answers for partition in partitions]),
+            np.repeat(np.arange(len(partitions), dtype=np.uint8), sizes),
+            list(metadata['sources']),
+            keys=PackedStrings.concat([partition.keys for partition in partitions]),
+            language_codes=np.concatenate([partition.language_codes for partition in partitions]),
+            tier_codes=np.concatenate([partition.tier_codes for partition in partitions]),
+            tags=tags
+        )
+        kept, masks, report, representatives = deduplicate(
+            combined.keys, combined.source_codes, combined.source_names
+        )
+        
+        # Filas agrupadas por nivel y luego por idioma (orden estable dentro de cada grupo):
+        # el nivel caliente es un prefijo y cada idioma un rango contiguo dentro de su nivel
+        order = np.lexsort((combined.language_codes[kept], combined.tier_codes[kept]))
+        corpus_data = combined.take(kept[order])
+        corpus_data.source_masks = np.ascontiguousarray(masks[order])
+        del combined
+        # Arreglos de la cascada de SequenceMatcher: van al snapshot y los workers solo los mapean
+        corpus_data.key_lengths, corpus_data.key_histograms = cascade_arrays(corpus_data.keys)
+        
+        # Mapa de duplicados: fila del corpus que reemplaza a cada fila de entrada (por fuente)
+        bounds = np.concatenate(([0], np.cumsum(sizes)))
+        corpus_rows = np.empty(len(kept), dtype=np.int64)
+        corpus_rows[order] = np.arange(len(kept))
+        dedup_map = {
+            'input_offsets': bounds.astype(np.int64),
+            'corpus_rows': corpus_rows[np.searchsorted(kept, representatives)].astype(np.int32)
+        }
+        
+        # Las respuestas solo se leen para las filas devueltas: se guardan comprimidas
+        # (su longitud para las estadísticas se mide antes)
+        status.update(stage='compression')
+        answer_lengths = corpus_data.answers.char_lengths()
+        corpus_data.answers = CompressedStrings.compress(corpus_data.answers)
+        compression = corpus_data.answers.get_statistics()
+        print(f"[OK] Respuestas comprimidas: {compression['raw_mb']} MB -> "
+              f"{compression['compressed_mb']} MB (x{compression['ratio']})")
+        metadata['deduplication'] = report
+        metadata['total_records'] = len(corpus_data)
+        metadata['language_partitions'], metadata['tier_partitions'] = self._partition_counts(corpus_data)
+        metadata['ingestion']['peak_rss_mb'] = to_mb(peak_rss())
+        print(f"[OK] Duplicados eliminados: {report['exact_duplicates']} exactos, "
+              f"{report['near_duplicates']} casi duplicados")
+        
+        # Índices del corpus completo: unión de los índices parciales sobre las filas conservadas
+        status.update(stage='index')
+        local_rows = [
+            kept[(kept >= start) & (kept < end)] - start for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        search_index = BM25Index.merge([
+            (partition.bm25, rows) for partition, rows in zip(partitions, local_rows)
+        ], order=order)
+        ngram_index = CharNgramIndex.merge([
+            (partition.ngram_vocabulary, partition.ngram_counts, rows)
+            for partition, rows in zip(partitions, local_rows)
+        ], order=order)
+        stats = search_index.get_statistics()
+        print(f"[OK] Índice BM25: {stats['vocabulary']} términos, {stats['postings']} postings")
+        stats = ngram_index.get_statistics()
+        print(f"[OK] Índice TF-IDF de n-gramas: {stats['features']} n-gramas, {stats['nonzeros']} no nulos")
+        
+        # Estadísticas para /corpus-stats: se guardan con el snapshot y no se recalculan por consulta
+        metadata['statistics'] = corpus_statistics(corpus_data, answer_lengths, report, search_index, ngram_index)
+        status.update(stage='tags')
+        tag_index = self._build_tag_index(corpus_data)
+        
+        print(f"\n[OK] Corpus integrado: {metadata['total_records']} registros totales")
+        print(f"[OK] Fuentes: {', '.join(metadata['sources'].keys())}")
+        print(f"[OK] Particiones por idioma: {metadata['language_partitions']}")
+        print(f"[OK] Niveles: {metadata['tier_partitions']}")
+        return {
+            'corpus_data': corpus_data,
+            'corpus_metadata': metadata,
+            'search_index': search_index,
+            'ngram_index': ngram_index,
+            'index_row_ids': np.arange(len(corpus_data), dtype=np.int32),
+            'tag_index': tag_index,
+            'fingerprints': ingested_fingerprints,
+            'reingested_sources': reingested,
+            'dedup_map': dedup_map
+        }
     
-    def _normalize_dataframe(self, df: pd.DataFrame, source_name: str) -> pd.DataFrame:
-        """Normaliza un DataFrame al formato estándar"""
-        normalized = pd.DataFrame()
+    def _get_partition(self, filename: str, source_name: str, fingerprint: Dict) -> Tuple[SourcePartition, bool]:
+        """
+        Retorna (partición, reingerida). La partición guardada se reutiliza si el archivo
+        tiene el mismo tamaño y mtime o, si difieren, el mismo contenido (SHA-256), y sus
+        claves se calcularon con la misma normalización; en otro caso el archivo se
+        vuelve a ingerir e indexar.
+        """
+        filepath = os.path.join(self.data_dir, filename)
+        stored = SourcePartition.stored_fingerprint(filename, self.partitions_dir)
+        normalization = normalization_signature(self.remove_stopwords)
+        if stored is not None and stored.get('normalization') != normalization:
+            stored = None
+        same_stat = stored is not None and all(stored.get(key) == fingerprint[key] for key in ('size', 'mtime_ns'))
+        current = dict(
+            fingerprint,
+            sha256=stored.get('sha256') if same_stat else content_hash(filepath),
+            normalization=normalization
+        )
+        
+        if stored is not None and stored.get('sha256') == current['sha256']:
+            try:
+                partition = SourcePartition.load(filename, self.partitions_dir)
+                if not same_stat:
+                    # Solo cambió el mtime: se actualiza la huella para no volver a calcular el hash
+                    SourcePartition.snapshot(filename, self.partitions_dir).update_fingerprints(current)
+                return partition, False
+            except Exception as e:
+                print(f"[WARN] Partición de {filename} inválida, se vuelve a ingerir: {e}")
+        
+        partition = self._ingest_partition(filepath, filename, source_name)
+        try:
+            partition.write(current, self.partitions_dir)
+        except Exception as e:
+            print(f"[WARN] No se pudo guardar la partición de {filename}: {e}")
+        return partition, True
+    
+    def _ingest_partition(self, filepath: str, filename: str, source_name: str) -> SourcePartition:
+        """Lee un CSV por bloques y construye su partición con índices parciales"""
+        questions = StringColumnBuilder()
+        answers = StringColumnBuilder()
+        keys = StringColumnBuilder()
+        tags = StringColumnBuilder()
+        languages = array('B')
+        tiers = array('B')
+        columns, peak = self._ingest_file(filepath, source_name, questions, answers, keys, languages, tiers, tags)
+        return SourcePartition.build(
+            filename, source_name,
+            PackedStrings(*questions.to_arrays()),
+            PackedStrings(*answers.to_arrays()),
+            PackedStrings(*keys.to_arrays()),
+            np.frombuffer(languages, dtype=np.uint8).copy(),
+            np.frombuffer(tiers, dtype=np.uint8).copy(),
+            {'columns': columns, 'peak_rss_mb': to_mb(peak)},
+            PackedStrings(*tags.to_arrays()) if len(tags) else None
+        )
+    
+    def _install(self, state: Dict, sharded_search: ShardedSearch = None) -> Optional[ShardedSearch]:
+        """
+        Reemplaza corpus, índices y búsqueda repartida de una sola vez. Espera a que
+        terminen las búsquedas en curso (que usan la versión anterior completa) y retorna
+        la búsqueda repartida anterior para cerrarla fuera del candado.
+        """
+        with self._swap_lock.writing():
+            previous = self.sharded_search
+            self.corpus_data = state['corpus_data']
+            self.corpus_metadata = state['corpus_metadata']
+            self.search_index = state['search_index']
+            self.ngram_index = state['ngram_index']
+            self.index_row_ids = state['index_row_ids']
+            self.tag_index = state['tag_index']
+            self.source_fingerprints = state['fingerprints']
+            self.sharded_search = sharded_search
+            self._reset_derived()
+        return previous
+    
+    def _snapshot_fingerprints(self, fingerprints: Dict) -> Dict:
+        """
+        Huellas del snapshot completo: archivos fuente y normalización de las claves.
+        Al guardar se pasan las huellas de los archivos ingeridos y al comprobar, las de
+        disco: un archivo en disco que no se ingirió deja el snapshot desactualizado.
+        """
+        return dict(fingerprints, normalization=normalization_signature(self.remove_stopwords))
+    
+    def _open_snapshot(self, fingerprints: Dict, tag_index: TagIndex = None) -> Dict:
+        """
+        Estado con el snapshot y el índice construidos para fingerprints, mapeados en
+        memoria: solo el nivel caliente se copia a RAM (salvo con memoria compartida).
+        tag_index reutiliza un índice de etiquetas ya armado sobre las mismas filas.
+        """
+        arrays, metadata = CorpusSnapshot(os.path.join(self.artifacts_dir, 'corpus')).load()
+        corpus_data = CorpusStore.from_arrays(arrays, metadata['source_names'])
+        index_arrays, _ = read_index_file(self.index_file, {
+            'corpus': self._corpus_signature(corpus_data, fingerprints)
+        })
+        state = {
+            'corpus_data': corpus_data,
+            'corpus_metadata': metadata['corpus_metadata'],
+            'search_index': BM25Index.from_arrays(index_arrays),
+            'ngram_index': CharNgramIndex.from_arrays(index_arrays) if 'ngram_data' in index_arrays else None,
+            'index_row_ids': index_arrays['bm25_row_ids'],
+            'tag_index': tag_index if tag_index is not None else self._build_tag_index(corpus_data),
+            'fingerprints': fingerprints,
+            'reingested_sources': []
+        }
+        self._pin_hot_tier(corpus_data)
+        return state
+    
+    def _map_from_snapshot(self):
+        """
+        Reemplaza el corpus recién construido en RAM por su snapshot e índice mapeados
+        en memoria: el nivel frío queda en disco. Si no se pueden abrir, el corpus sigue en RAM.
+        """
+        try:
+            # Mismas filas que el corpus en RAM: el índice de etiquetas se conserva
+            state = self._open_snapshot(self.source_fingerprints, self.tag_index)
+        except Exception as e:
+            print(f"[WARN] No se pudo mapear el snapshot del corpus, se mantiene en RAM: {e}")
+            return
+        self._install(state, self.sharded_search)
+    
+    def _save_corpus(self, state: Dict):
+        """Guarda snapshot, índices y mapa de duplicados del corpus completo para el próximo arranque"""
+        fingerprints = self._snapshot_fingerprints(self.source_fingerprints)
+        self._write_snapshot(CorpusSnapshot(os.path.join(self.artifacts_dir, 'corpus')), fingerprints)
+        self.export_search_index()
+        try:
+            CorpusSnapshot(os.path.join(self.artifacts_dir, 'dedup')).write(state['dedup_map'], fingerprints, {
+                'sources': self.corpus_data.source_names,
+                'report': self.corpus_metadata.get('deduplication')
+            })
+        except Exception as e:
+            print(f"[WARN] No se pudo guardar el mapa de duplicados: {e}")
+    
+    def refresh_changed_sources(self) -> Dict:
+        """
+        Recarga solo las fuentes cuyos CSV cambiaron (tamaño, mtime o contenido).
+        Las particiones modificadas se vuelven a ingerir e indexar, las demás se
+        reutilizan, y el corpus nuevo reemplaza al anterior de forma atómica.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return {'success': False, 'message': 'Ya hay una recarga del corpus en curso'}
+        try:
+            if self.artifacts_only:
+                return {'success': False, 'message': 'Modo solo artefactos: el corpus se reconstruye offline'}
+            if self.load_status.state == ERROR:
+                return self._retry_failed_load()
+            if not self.load_status.is_ready:
+                return {'success': False, 'message': 'El corpus aún no termina de cargar'}
+        
+            # Se compara contra lo ingerido: un archivo que falló no figura y se reintenta
+            fingerprints = file_fingerprints(self.data_dir, [filename for filename, _ in self.CORPUS_FILES])
+            changed = [
+                filename for filename, _ in self.CORPUS_FILES
+                if fingerprints[filename] != self.source_fingerprints.get(filename)
+            ]
+            if not changed:
+                return {'success': True, 'reloaded': False, 'changed_files': [], 'reingested_sources': []}
+        
+            started = time.perf_counter()
+            self.refresh_status.start(stage='partitions', changed_files=changed)
+            try:
+                with artifacts_lock(self.artifacts_dir):
+                    # Con varios workers, otro pudo reconstruir ya el corpus para estos archivos
+                    state = self._open_current_artifacts(fingerprints)
+                    built = state is None
+                    if built:
+                        state = self._build_corpus(fingerprints, self.refresh_status)
+                    if state is None:
+                        raise ValueError("Ningún archivo del corpus tiene registros")
+        
+                    # Los procesos de la búsqueda repartida se preparan antes del reemplazo
+                    sharded_search = None
+                    if self.sharded_search is not None:
+                        self.refresh_status.update(stage='sharding')
+                        sharded_search = ShardedSearch(
+                            list(state['corpus_data'].keys), self.search_workers,
+                            state['search_index'], state['ngram_index']
+                        )
+        
+                    self.refresh_status.update(stage='swap')
+                    previous = self._install(state, sharded_search)
+                    if previous is not None:
+                        previous.close()
+                    if built:
+                        self._save_corpus(state)
+                        self._map_from_snapshot()
+            except Exception as e:
+                self.refresh_status.fail(e)
+                logger.error("Falló la recarga del corpus: %s", e)
+                # El corpus anterior sigue en uso; los archivos que fallaron se reintentan en la próxima recarga
+                return {'success': False, 'error': str(e), 'changed_files': changed,
+                        'failed_files': getattr(e, 'failed', {})}
+        
+            result = {
+                'success': True,
+                'reloaded': True,
+                'changed_files': changed,
+                'reingested_sources': state['reingested_sources'],
+                'total_records': len(state['corpus_data']),
+                'corpus_version': self.corpus_version,
+                'elapsed_seconds': round(time.perf_counter() - started, 2)
+            }
+            self.refresh_status.finish(records=result['total_records'])
+            self.last_refresh = result
+            print(f"[OK] Corpus recargado en {result['elapsed_seconds']} s; "
+                  f"fuentes reingeridas: {', '.join(result['reingested_sources']) or 'ninguna'}")
+            return result
+        finally:
+            self._refresh_lock.release()
+    
+    def _open_current_artifacts(self, fingerprints: Dict) -> Optional[Dict]:
+        """Estado mapeado desde los artefactos si ya corresponden a fingerprints; si no, None"""
+        snapshot = CorpusSnapshot(os.path.join(self.artifacts_dir, 'corpus'))
+        if not snapshot.is_current(self._snapshot_fingerprints(fingerprints)):
+            return None
+        try:
+            return self._open_snapshot(fingerprints)
+        except Exception as e:
+            print(f"[WARN] Artefactos del corpus inválidos, se reconstruyen: {e}")
+            return None
+    
+    def _retry_failed_load(self) -> Dict:
+        """Vuelve a intentar la carga inicial del corpus, que terminó con error"""
+        started = time.perf_counter()
+        try:
+            self.load_all_corpus()
+        except Exception as e:
+            logger.error("Falló de nuevo la carga del corpus: %s", e)
+            return {'success': False, 'error': str(e), 'failed_files': getattr(e, 'failed', {})}
+        
+        result = {
+            'success': True,
+            'reloaded': True,
+            'changed_files': [filename for filename, _ in self.CORPUS_FILES],
+            'reingested_sources': self.corpus_data.source_names if self.corpus_data is not None else [],
+            'total_records': len(self.corpus_data) if self.corpus_data is not None else 0,
+            'corpus_version': self.corpus_version,
+            'elapsed_seconds': round(time.perf_counter() - started, 2)
+        }
+        self.last_refresh = result
+        print(f"[OK] Corpus cargado al reintentar, en {result['elapsed_seconds']} s")
+        return result
+    
+    def start_watcher(self, interval_seconds: float):
+        """Revisa los CSV cada interval_seconds (en un hilo) y recarga las fuentes modificadas"""
+        self.stop_watcher()
+        stop = threading.Event()
+        
+        def watch():
+            # Si la carga inicial falla, la revisión periódica la reintenta
+            self.load_status.wait()
+            while not stop.wait(interval_seconds):
+                try:
+                    self.refresh_changed_sources()
+                except Exception as e:
+                    print(f"[WARN] Error revisando los archivos del corpus: {e}")
+        
+        self._watcher_stop = stop
+        threading.Thread(target=watch, name='corpus-watcher', daemon=True).start()
+        print(f"[OK] Revisión de archivos del corpus cada {interval_seconds} s")
+    
+    def stop_watcher(self):
+        if self._watcher_stop is not None:
+            self._watcher_stop.set()
+            self._watcher_stop = None
+    
+    def _ingest_file(self, filepath: str, source_name: str, questions: StringColumnBuilder,
+                     answers: StringColumnBuilder, keys: StringColumnBuilder,
+                     languages: array, tiers: array,
+                     tags: StringColumnBuilder = None) -> Tuple[List[str], Optional[int]]:
+        """
+        Agrega las filas normalizadas de un CSV a los buffers, con la clave de búsqueda,
+        el código de idioma y el nivel (caliente/frío) de cada fila, leyendo solo las columnas
+        de pregunta y respuesta (y la de etiquetas, si existe y se pasa tags) en bloques.
+        Si el RSS supera memory_limit_mb el bloque se reduce a la mitad; con el bloque
+        mínimo lanza MemoryError.
+        Retorna (columnas del archivo, pico de RSS observado durante la lectura).
+        """
+        columns = list(pd.read_csv(filepath, nrows=0).columns)
+        question_col, answer_col = self._find_columns(columns)
+        if not question_col or not answer_col:
+            return columns, current_rss()
+        
+        tag_col = self._find_tag_column(columns) if tags is not None else None
+        
+        limit = self.memory_limit_mb * 1024 * 1024 if self.memory_limit_mb else None
+        chunk_rows = self.CHUNK_ROWS
+        peak = current_rss()
+        usecols = [col for col in dict.fromkeys([question_col, answer_col, tag_col]) if col]
+        reader = pd.read_csv(filepath, usecols=usecols, iterator=True)
+        with reader:
+            while True:
+                try:
+                    chunk = reader.get_chunk(chunk_rows)
+                except StopIteration:
+                    break
+                normalized = self._normalize_dataframe(chunk, source_name, question_col, answer_col, tag_col)
+                questions.extend(normalized['question'])
+                answers.extend(normalized['answer'])
+                if tag_col:
+                    tags.extend(normalized['tags'])
+                chunk_keys = [normalize_text(question, self.remove_stopwords) for question in normalized['question']]
+                keys.extend(chunk_keys)
+                # Sin palabras vacías la clave ya no sirve para detectar el idioma
+                languages.extend(
+                    LANGUAGE_CODES[detect_language(question, None if self.remove_stopwords else key)]
+                    for question, key in zip(normalized['question'], chunk_keys)
+                )
+                tiers.extend(
+                    TIER_CODES[tier_of(question, answer)]
+                    for question, answer in zip(normalized['question'], normalized['answer'])
+                )
+                
+                rss = current_rss()
+                if rss is not None:
+                    peak = max(peak or 0, rss)
+                    if limit and rss > limit:
+                        if chunk_rows <= self.MIN_CHUNK_ROWS:
+                            raise MemoryError(
+                                f"RSS de {to_mb(rss)} MB supera el límite de {self.memory_limit_mb} MB"
+                            )
+                        chunk_rows = max(self.MIN_CHUNK_ROWS, chunk_rows // 2)
+                del chunk, normalized
         
+        return columns, peak
+    
+    def get_sources(self, idx: int) -> List[str]:
+        """Fuentes que aportaron la pregunta de la fila idx (la propia primero)"""
+        return self.corpus_data.sources(idx)
+    
+    def _load_snapshot(self, snapshot: CorpusSnapshot):
+        """Carga las columnas normalizadas desde el snapshot binario (memory mapping)"""
+        arrays, metadata = snapshot.load()
+        
+        # Los textos se quedan en los arreglos mapeados; no se crean str hasta devolver una fila
+        self.corpus_data = CorpusStore.from_arrays(arrays, metadata['source_names'])
+        self.corpus_metadata = metadata['corpus_metadata']
+        self.tag_index = self._build_tag_index(self.corpus_data)
+        self._pin_hot_tier(self.corpus_data)
+        
+        print(f"[OK] Corpus cargado desde snapshot: {self.corpus_metadata['total_records']} registros")
+        print(f"[OK] Fuentes: {', '.join(self.corpus_metadata['sources'].keys())}")
+    
+    def _write_snapshot(self, snapshot: CorpusSnapshot, fingerprints: Dict):
+        """Compila las columnas normalizadas en un snapshot binario"""
+        try:
+            snapshot.write(self.corpus_data.to_arrays(), fingerprints, {
+                'corpus_metadata': self.corpus_metadata,
+                'source_names': self.corpus_data.source_names
+            })
+            print(f"[OK] Snapshot del corpus guardado en {snapshot.directory}")
+        except Exception as e:
+            print(f"[WARN] No se pudo guardar el snapshot del corpus: {e}")
+    
+    def _find_columns(self, columns: List[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Encuentra las columnas de pregunta y respuesta entre los nombres de columnas"""
         # Mapeo flexible de columnas
         question_cols = ['question', 'short_question', 'query', 'input', 'text', 'query_text']
         answer_cols = ['answer', 'short_answer', 'response', 'output', 'label', 'diagnosis']
@@ -79,7 +756,7 @@ class CorpusIntegration:
         question_col = None
         answer_col = None
         
-        for col in df.columns:
+        for col in columns:
             col_lower = col.lower()
             if not question_col and any(q in col_lower for q in question_cols):
                 question_col = col
@@ -87,15 +764,34 @@ class CorpusIntegration:
                 answer_col = col
         
         # Si no se encuentran, usar las primeras dos columnas
-        if not question_col and len(df.columns) > 0:
-            question_col = df.columns[0]
-        if not answer_col and len(df.columns) > 1:
-            answer_col = df.columns[1]
+        if not question_col and len(columns) > 0:
+            question_col = columns[0]
+        if not answer_col and len(columns) > 1:
+            answer_col = columns[1]
+        
+        return question_col, answer_col
+    
+    def _find_tag_column(self, columns: List[str]) -> Optional[str]:
+        """Columna de etiquetas entre los nombres de columnas; None si el CSV no tiene"""
+        for col in columns:
+            if col.strip().lower() in self.TAG_COLUMNS:
+                return col
+        return None
+    
+    def _normalize_dataframe(self, df: pd.DataFrame, source_name: str, question_col: str = None,
+                             answer_col: str = None, tag_col: str = None) -> pd.DataFrame:
+        """Normaliza un DataFrame al formato estándar"""
+        normalized = pd.DataFrame()
+        
+        if not question_col or not answer_col:
+            question_col, answer_col = self._find_columns(list(df.columns))
         
         if question_col and answer_col:
             normalized['question'] = df[question_col].astype(str)
             normalized['answer'] = df[answer_col].astype(str)
             normalized['source'] = source_name
+            if tag_col:
+                normalized['tags'] = df[tag_col].fillna('').astype(str)
             
             # Limpiar datos vacíos
             normalized = normalized[normalized['question'].str.strip() != '']
@@ -103,57 +799,499 @@ class CorpusIntegration:
         
         return normalized
     
-    def search(self, query: str, threshold: float = 0.3, top_k: int = 5) -> List[Dict]:
-        """Busca en todos los corpus integrados"""
-        if self.corpus_data is None or len(self.corpus_data) == 0:
+    def enable_sharding(self, num_workers: int):
+        """Reparte la búsqueda entre num_workers procesos que mantienen su fragmento residente"""
+        self.disable_sharding()
+        if self.corpus_data is None or num_workers <= 0:
+            return
+        if self.shared_memory:
+            print("[WARN] Con memoria compartida cada worker de uvicorn crea sus propios procesos de "
+                  "búsqueda repartida, cada uno con una copia de su fragmento")
+        
+        self.sharded_search = ShardedSearch(
+            list(self.corpus_data.keys), num_workers, self.search_index, self.ngram_index
+        )
+        self.search_workers = num_workers
+        print(f"[OK] Búsqueda repartida en {num_workers} procesos")
+    
+    def disable_sharding(self):
+        """Vuelve a la búsqueda en el proceso actual"""
+        if self.sharded_search is not None:
+            self.sharded_search.close()
+            self.sharded_search = None
+    
+    def search(self, query: str, threshold: float = 0.3, top_k: int = 5, mode: str = None,
+               stats: Dict = None, language: str = None) -> List[Dict]:
+        """
+        Busca en todos los corpus integrados.
+        En modo 'sequence', stats (si se pasa) recibe cuántas filas podó cada etapa de la cascada.
+        La consulta pasa por la misma normalización que las claves del corpus (sin acentos
+        ni puntuación). Solo se recorre la partición del idioma de la consulta (más las filas
+        de idioma desconocido): language='es'/'en' lo fija, 'all' busca en todo el corpus y
+        None lo detecta; si no se reconoce el idioma se busca en todo el corpus.
+        Los resultados se guardan en query_cache por (consulta normalizada, threshold,
+        top_k, modo, idioma); en un acierto de caché stats queda vacío.
+        """
+        if not self.load_status.is_ready:
             return []
         
-        query_lower = query.lower()
-        results = []
+        # Una recarga incremental no reemplaza el corpus mientras la búsqueda lo está usando
+        with self._swap_lock.reading():
+            if self.corpus_data is None or len(self.corpus_data) == 0:
+                return []
+            
+            mode = mode or self.search_mode
+            if mode not in ('bm25', 'tfidf') or (mode == 'bm25' and self.search_index is None) \
+                    or (mode == 'tfidf' and self.ngram_index is None):
+                mode = 'sequence'
+            
+            # El idioma se detecta sobre la consulta original (con acentos y signos)
+            language = resolve_language(query, language)
+            query = normalize_text(query, self.remove_stopwords)
+            cache_key = (query, threshold, top_k, mode, language)
+            found, results = self.query_cache.get(cache_key)
+            if not found:
+                results = self._search_tiers(mode, query, threshold, top_k, stats, language)
+                self.query_cache.put(cache_key, results)
+            return results
+    
+    def search_batch(self, queries: List[str], threshold: float = 0.3, top_k: int = 5, mode: str = None,
+                     languages: List[str] = None) -> List[List[Dict]]:
+        """
+        search() para muchas consultas a la vez, con resultados en el orden de entrada.
+        En modo 'bm25' (sin búsqueda repartida) las consultas que no están en caché se
+        puntúan juntas con BM25Index.search_batch: un producto de matrices por nivel, con
+        el mismo criterio que search() para consultar el nivel frío. Los otros modos
+        ejecutan search() por consulta. languages[i] fija el idioma de la consulta i.
+        """
+        languages = languages if languages is not None else [None] * len(queries)
+        mode = mode or self.search_mode
+        if not self.load_status.is_ready:
+            return [[] for _ in queries]
+        if mode != 'bm25' or self.search_index is None or self.sharded_search is not None:
+            return [
+                self.search(query, threshold, top_k, mode, language=language)
+                for query, language in zip(queries, languages)
+            ]
         
-        for idx, row in self.corpus_data.iterrows():
-            question = str(row['question']).lower()
-            similarity = SequenceMatcher(None, query_lower, question).ratio()
+        with self._swap_lock.reading():
+            if self.corpus_data is None or len(self.corpus_data) == 0:
+                return [[] for _ in queries]
+            
+            results = [None] * len(queries)
+            misses = []
+            for position, (query, language) in enumerate(zip(queries, languages)):
+                language = resolve_language(query, language)
+                key = normalize_text(query, self.remove_stopwords)
+                cache_key = (key, threshold, top_k, mode, language)
+                found, cached = self.query_cache.get(cache_key)
+                if found:
+                    results[position] = cached
+                else:
+                    misses.append((position, key, language, cache_key))
+            
+            # Nivel caliente para todas; el frío solo para las que no alcanzan cold_threshold
+            tier_results = {position: [] for position, _, _, _ in misses}
+            for tier in TIERS:
+                batch = []
+                for position, key, language, _ in misses:
+                    if tier == 'cold':
+                        hot = tier_results[position]
+                        best = hot[0][0]['similarity'] if hot and hot[0] else 0.0
+                        if best >= self.cold_threshold:
+                            self._count_tier_search('hot_only')
+                            continue
+                        self._count_tier_search('with_cold')
+                    first, last = self._row_ranges(language)[tier]
+                    if first < last:
+                        batch.append((position, key, (first, last)))
+                if not batch:
+                    continue
+                hits = self.search_index.search_batch([key for _, key, _ in batch], top_k,
+                                                      [doc_range for _, _, doc_range in batch])
+                for (position, _, _), doc_hits in zip(batch, hits):
+                    tier_results[position].append([
+                        self._format_result(int(self.index_row_ids[doc_id]), similarity, score)
+                        for doc_id, score, similarity in doc_hits if similarity > threshold
+                    ])
             
+            for position, _, _, cache_key in misses:
+                parts = tier_results[position]
+                if len(parts) == 1:
+                    merged = parts[0]
+                else:
+                    merged = list(itertools.islice(heapq.merge(
+                        *parts, key=lambda result: (-result.get('score', result['similarity']), result['index'])
+                    ), top_k))
+                self.query_cache.put(cache_key, merged)
+                results[position] = merged
+            return results
+    
+    def _search_tiers(self, mode: str, query: str, threshold: float, top_k: int,
+                      stats: Dict = None, language: str = 'all') -> List[Dict]:
+        """
+        Busca primero en el nivel caliente; el frío solo se consulta si el mejor resultado
+        caliente no alcanza cold_threshold, y entonces se combinan ambos con el orden del modo
+        """
+        row_ranges = self._row_ranges(language)
+        tier_results = []
+        for tier in TIERS:
+            if tier == 'cold':
+                best = tier_results[0][0]['similarity'] if tier_results and tier_results[0] else 0.0
+                if best >= self.cold_threshold:
+                    self._count_tier_search('hot_only')
+                    break
+                self._count_tier_search('with_cold')
+            
+            first, last = row_ranges[tier]
+            if first >= last:
+                continue
+            tier_stats = {}
+            tier_results.append(self._search_mode(mode, query, threshold, top_k, tier_stats, (first, last)))
+            if stats is not None:
+                for stage, count in tier_stats.items():
+                    stats[stage] = stats.get(stage, 0) + count
+        
+        if len(tier_results) == 1:
+            return tier_results[0]
+        merged = heapq.merge(*tier_results, key=lambda result: (-result.get('score', result['similarity']), result['index']))
+        return list(itertools.islice(merged, top_k))
+    
+    def _count_tier_search(self, kind: str):
+        with self._counter_lock:
+            self.tier_searches[kind] += 1
+    
+    def _tier_search_counts(self) -> Dict[str, int]:
+        with self._counter_lock:
+            return dict(self.tier_searches)
+    
+    def _get_partition_ranges(self) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        """Rango de filas de cada (nivel, idioma); se calcula una vez por versión del corpus"""
+        ranges = self.partition_ranges
+        if ranges is None:
+            with self._cache_locks['partition_ranges']:
+                if self.partition_ranges is None:
+                    self.partition_ranges = self.corpus_data.partition_ranges(TIERS, LANGUAGES)
+                ranges = self.partition_ranges
+        return ranges
+    
+    def _tier_range(self, tier: str) -> Tuple[int, int]:
+        ranges = self._get_partition_ranges()
+        return ranges[(tier, LANGUAGES[0])][0], ranges[(tier, LANGUAGES[-1])][1]
+    
+    def _row_ranges(self, language: str) -> Dict[str, Tuple[int, int]]:
+        """
+        Filas a recorrer en cada nivel: las del idioma más las de idioma desconocido
+        (contiguas por el orden de LANGUAGES), o todo el nivel con 'all'
+        """
+        ranges = self._get_partition_ranges()
+        wanted = (language, 'unknown') if language in ('es', 'en') else LANGUAGES
+        row_ranges = {}
+        for tier in TIERS:
+            spans = [ranges[(tier, name)] for name in wanted]
+            row_ranges[tier] = (min(start for start, _ in spans), max(end for _, end in spans))
+        return row_ranges
+    
+    def _partition_counts(self, corpus_data: CorpusStore) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Filas por idioma y por nivel"""
+        languages = dict.fromkeys(LANGUAGES, 0)
+        tiers = dict.fromkeys(TIERS, 0)
+        for (tier, language), (start, end) in corpus_data.partition_ranges(TIERS, LANGUAGES).items():
+            languages[language] += end - start
+            tiers[tier] += end - start
+        return languages, tiers
+    
+    def _pin_hot_tier(self, corpus_data: CorpusStore):
+        """
+        Copia a RAM los textos del nivel caliente (prefijo de filas); el frío sigue mapeado.
+        Con memoria compartida no se copia: las páginas mapeadas las comparten todos los workers.
+        """
+        if corpus_data.tier_codes is None or self.shared_memory:
+            return
+        hot_rows = int(np.count_nonzero(np.asarray(corpus_data.tier_codes) == TIER_CODES['hot']))
+        corpus_data.pin(hot_rows)
+        print(f"[OK] Nivel caliente en RAM: {hot_rows} filas ({to_mb(corpus_data.pinned_nbytes)} MB)")
+    
+    def _search_mode(self, mode: str, query: str, threshold: float, top_k: int,
+                     stats: Dict = None, row_range: Tuple[int, int] = None) -> List[Dict]:
+        """Ejecuta la búsqueda en el modo indicado (sin caché), solo sobre row_range si se indica"""
+        if self.sharded_search is not None and mode in self.sharded_search.modes:
+            return self._search_sharded(mode, query, threshold, top_k, stats, row_range)
+        if mode == 'bm25':
+            return self._search_bm25(query, threshold, top_k, row_range)
+        if mode == 'tfidf':
+            return self._search_tfidf(query, threshold, top_k, row_range)
+        return self._search_sequence(query, threshold, top_k, stats, row_range)
+    
+    def _format_result(self, idx: int, similarity: float, score: float = None) -> Dict:
+        """Arma el resultado de búsqueda para la fila idx del corpus"""
+        result = self.corpus_data.row(idx)
+        result.update({
+            'sources': self.get_sources(idx),
+            'similarity': round(similarity, 2),
+            'index': idx
+        })
+        if score is not None:
+            result['score'] = round(score, 4)
+        return result
+    
+    def _search_sharded(self, mode: str, query: str, threshold: float, top_k: int,
+                        stats: Dict = None, row_range: Tuple[int, int] = None) -> List[Dict]:
+        """Consulta los fragmentos (los que cortan row_range) y arma los resultados combinados"""
+        results = []
+        
+        for idx, similarity, score in self.sharded_search.search(mode, query, threshold, top_k, stats, row_range):
+            if mode == 'sequence':
+                results.append(self._format_result(idx, similarity))
+            else:
+                results.append(self._format_result(int(self.index_row_ids[idx]), similarity, score))
+        
+        return results
+    
+    def _search_bm25(self, query: str, threshold: float, top_k: int,
+                     row_range: Tuple[int, int] = None) -> List[Dict]:
+        """Búsqueda BM25: solo puntúa filas que comparten términos con la consulta"""
+        results = []
+        
+        for doc_id, score, similarity in self.search_index.search(query, top_k=top_k, doc_range=row_range):
             if similarity > threshold:
-                results.append({
-                    'question': row['question'],
-                    'answer': row['answer'],
-                    'source': row['source'],
-                    'similarity': round(similarity, 2),
-                    'index': idx
-                })
+                results.append(self._format_result(int(self.index_row_ids[doc_id]), similarity, score))
+        
+        return results
+    
+    def _search_tfidf(self, query: str, threshold: float, top_k: int,
+                      row_range: Tuple[int, int] = None) -> List[Dict]:
+        """Búsqueda por similitud coseno de n-gramas de caracteres (tolera errores)"""
+        results = []
+        
+        for doc_id, similarity in self.ngram_index.search(query, top_k=top_k, min_score=threshold,
+                                                          doc_range=row_range):
+            results.append(self._format_result(int(self.index_row_ids[doc_id]), similarity, similarity))
+        
+        return results
+    
+    def _search_sequence(self, query: str, threshold: float, top_k: int, stats: Dict = None,
+                         row_range: Tuple[int, int] = None) -> List[Dict]:
+        """Búsqueda por similitud de SequenceMatcher; la cascada descarta filas sin posibilidad"""
+        row_range = row_range or (0, len(self.corpus_data))
+        cascade, start = self._get_sequence_cascade(row_range)
+        local_range = (row_range[0] - start, row_range[1] - start)
+        
+        results = []
+        
+        for idx, similarity in cascade.matches(query, threshold, stats, local_range):
+            results.append(self._format_result(start + idx, similarity))
         
         # Ordenar por similitud
         results.sort(key=lambda x: x['similarity'], reverse=True)
         return results[:top_k]
     
+    def _cascade_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Longitudes e histogramas de las claves de todo el corpus. Vienen del snapshot
+        (mapeados y compartidos entre workers); solo se calculan si el corpus no los trae.
+        """
+        corpus_data = self.corpus_data
+        if corpus_data.key_histograms is None:
+            with self._cache_locks['cascade_arrays']:
+                if corpus_data.key_histograms is None:
+                    corpus_data.key_lengths, corpus_data.key_histograms = cascade_arrays(corpus_data.keys)
+        return corpus_data.key_lengths, corpus_data.key_histograms
+    
+    def _get_sequence_cascade(self, row_range: Tuple[int, int]) -> Tuple[SequenceMatchCascade, int]:
+        """
+        Cascada del nivel que contiene row_range y la primera fila del nivel: vistas de
+        las claves y de los arreglos del corpus (mapeados), sin copiar ni decodificar textos.
+        """
+        tier, start, end = None, 0, len(self.corpus_data)
+        for name in TIERS:
+            first, last = self._tier_range(name)
+            if first <= row_range[0] and row_range[1] <= last:
+                tier, start, end = name, first, last
+                break
+        cascade = self.sequence_cascades.get(tier)
+        if cascade is None:
+            with self._cache_locks['sequence_cascades']:
+                if tier not in self.sequence_cascades:
+                    lengths, histograms = self._cascade_arrays()
+                    self.sequence_cascades[tier] = SequenceMatchCascade(
+                        self.corpus_data.keys.slice(start, end), lengths[start:end], histograms[start:end]
+                    )
+                cascade = self.sequence_cascades[tier]
+        return cascade, start
+    
+    def _get_keyword_index(self) -> KeywordIndex:
+        """Índice de tokens de preguntas y respuestas; se construye en la primera consulta"""
+        keyword_index = self.keyword_index
+        if keyword_index is None:
+            with self._cache_locks['keyword_index']:
+                if self.keyword_index is None:
+                    index = KeywordIndex().build([self.corpus_data.questions, self.corpus_data.answers])
+                    stats = index.get_statistics()
+                    print(f"[OK] Índice de palabras clave: {stats['vocabulary']} términos, {stats['postings']} postings")
+                    self.keyword_index = index
+                keyword_index = self.keyword_index
+        return keyword_index
+    
+    def _format_keyword_result(self, idx: int, matches: int) -> Dict:
+        """Arma el resultado de búsqueda por palabras clave para la fila idx"""
+        result = self.corpus_data.row(idx)
+        result.update({
+            'keyword_matches': matches,
+            'index': idx
+        })
+        return result
+    
     def search_by_keywords(self, keywords: List[str], top_k: int = 10) -> List[Dict]:
-        """Busca registros que contengan palabras clave"""
-        if self.corpus_data is None:
+        """Busca registros que contengan palabras clave (en la pregunta o en la respuesta)"""
+        if not self.load_status.is_ready:
             return []
         
-        results = []
+        with self._swap_lock.reading():
+            if self.corpus_data is None:
+                return []
+            return [
+                self._format_keyword_result(idx, matches)
+                for idx, matches in self._get_keyword_index().search(keywords, top_k)
+            ]
+    
+    def search_by_keywords_batch(self, keyword_sets: List[List[str]], top_k: int = 10) -> List[List[Dict]]:
+        """search_by_keywords para varios conjuntos de palabras clave en una sola llamada"""
+        if not self.load_status.is_ready:
+            return [[] for _ in keyword_sets]
+        
+        with self._swap_lock.reading():
+            if self.corpus_data is None:
+                return [[] for _ in keyword_sets]
+            return [
+                [self._format_keyword_result(idx, matches) for idx, matches in hits]
+                for hits in self._get_keyword_index().search_batch(keyword_sets, top_k)
+            ]
+    
+    def _source_rows(self, sources: List[str]) -> np.ndarray:
+        """
+        Filas (ordenadas) que aportó alguna de las fuentes, incluidas las que se conservaron
+        como representante de un duplicado de esas fuentes; se calcula una vez por corpus
+        """
+        key = tuple(sorted(sources))
+        rows = self.source_rows.get(key)
+        if rows is None:
+            with self._cache_locks['source_rows']:
+                if key not in self.source_rows:
+                    bits = 0
+                    for code, name in enumerate(self.corpus_data.source_names):
+                        if name in key:
+                            bits |= 1 << code
+                    masks = np.asarray(self.corpus_data.source_masks)
+                    self.source_rows[key] = np.flatnonzero(masks & masks.dtype.type(bits))
+                rows = self.source_rows[key]
+        return rows
+    
+    def _get_source_cascade(self, sources: List[str], tier: str) -> Tuple[SequenceMatchCascade, np.ndarray]:
+        """
+        Cascada sobre las filas de esas fuentes dentro del nivel y esas filas (ordenadas).
+        Usa las claves y los arreglos del corpus a través de las filas, sin copiarlos: armarla
+        solo calcula las filas, y los textos se decodifican únicamente para las candidatas.
+        """
+        key = (tier, tuple(sorted(sources)))
+        cached = self.source_cascades.get(key)
+        if cached is None:
+            with self._cache_locks['source_cascades']:
+                if key not in self.source_cascades:
+                    first, last = self._tier_range(tier)
+                    rows = self._source_rows(sources)
+                    rows = rows[np.searchsorted(rows, first):np.searchsorted(rows, last)]
+                    lengths, histograms = self._cascade_arrays()
+                    cascade = SequenceMatchCascade(self.corpus_data.keys, lengths, histograms, rows=rows)
+                    self.source_cascades[key] = (cascade, rows)
+                cached = self.source_cascades[key]
+        return cached
+    
+    def best_match(self, query: str, threshold: float, sources: List[str] = None,
+                   stats: Dict = None, should_stop: Callable[[], bool] = None) -> Optional[Dict]:
+        """
+        Fila cuya pregunta normalizada tiene el mayor ratio() de SequenceMatcher con la
+        consulta (la primera si empatan), si supera threshold. Con sources solo se recorren
+        las filas de esas fuentes, con una cascada por nivel armada solo con ellas. stats
+        acumula las filas descartadas por cada etapa de la cascada. Si should_stop()
+        retorna True durante el recorrido se lanza SearchInterrupted.
+        """
+        if not self.load_status.is_ready:
+            return None
         
-        for idx, row in self.corpus_data.iterrows():
-            question = str(row['question']).lower()
-            answer = str(row['answer']).lower()
+        query_key = normalize_text(query, self.remove_stopwords)
+        stats = {} if stats is None else stats
+        with self._swap_lock.reading():
+            if self.corpus_data is None:
+                return None
+            best = None
             
-            # Contar coincidencias de palabras clave
-            matches = sum(1 for kw in keywords if kw.lower() in question or kw.lower() in answer)
+            for tier in TIERS:
+                first, last = self._tier_range(tier)
+                if first == last:
+                    continue
+                # Con sources la cascada cubre solo las filas de esas fuentes en el nivel
+                if sources is not None:
+                    cascade, rows = self._get_source_cascade(sources, tier)
+                    if not len(rows):
+                        continue
+                    row_range = None
+                else:
+                    cascade, start = self._get_sequence_cascade((first, last))
+                    row_range = (first - start, last - start)
+                # Las filas del nivel frío solo reemplazan al mejor si lo superan estrictamente
+                tier_stats = {}
+                match = cascade.best_match(query_key, best[1] if best else threshold, tier_stats,
+                                           row_range, should_stop)
+                for stage, count in tier_stats.items():
+                    stats[stage] = stats.get(stage, 0) + count
+                if match:
+                    idx = int(rows[match[0]]) if sources is not None else start + match[0]
+                    best = (idx, match[1])
             
-            if matches > 0:
-                results.append({
-                    'question': row['question'],
-                    'answer': row['answer'],
-                    'source': row['source'],
-                    'keyword_matches': matches,
-                    'index': idx
-                })
-        
-        # Ordenar por número de coincidencias
-        results.sort(key=lambda x: x['keyword_matches'], reverse=True)
-        return results[:top_k]
+            return self._format_result(*best) if best else None
+    
+    def _build_tag_index(self, corpus_data: CorpusStore) -> Optional[TagIndex]:
+        """Interpreta una sola vez las etiquetas de todas las filas; None si el corpus no tiene"""
+        if corpus_data.tags is None:
+            return None
+        tag_index = TagIndex().build(corpus_data.tags)
+        stats = tag_index.get_statistics()
+        print(f"[OK] Índice de etiquetas: {stats['tags']} etiquetas, {stats['postings']} postings")
+        return tag_index
+    
+    def _format_tag_result(self, idx: int, matches: int) -> Dict:
+        """Arma el resultado de búsqueda por etiquetas para la fila idx"""
+        result = self.corpus_data.row(idx)
+        result.update({
+            'tag_matches': matches,
+            'index': idx
+        })
+        return result
+    
+    def search_by_tag(self, tags: List[str], top_k: int = 10, sources: List[str] = None,
+                      partial: bool = False) -> List[Dict]:
+        """
+        Registros con alguna de las etiquetas (de las fuentes indicadas), de más a menos
+        etiquetas coincidentes; a igual número, en el orden del corpus (nivel caliente primero).
+        Con partial=True, si ninguna fila tiene las etiquetas exactas, cada etiqueta pedida
+        vale por todas las del vocabulario que la contienen ('alimento' encuentra 'alimentos').
+        """
+        if not self.load_status.is_ready:
+            return []
+        
+        with self._swap_lock.reading():
+            if self.corpus_data is None or self.tag_index is None:
+                return []
+            rows = self._source_rows(sources) if sources is not None else None
+            hits = self.tag_index.search(tags, top_k, rows)
+            if partial and not hits:
+                contained = [match for tag in tags for match in self.tag_index.tags_containing(tag)]
+                hits = self.tag_index.search(contained, top_k, rows)
+            return [
+                self._format_tag_result(idx, matches)
+                for idx, matches in hits
+            ]
     
     def get_statistics(self) -> Dict:
         """Retorna estadísticas del corpus integrado"""
@@ -161,23 +1299,64 @@ class CorpusIntegration:
             'total_records': self.corpus_metadata['total_records'],
             'sources': self.corpus_metadata['sources'],
             'loaded_files': self.corpus_metadata['loaded_files'],
-            'unique_sources': len(self.corpus_metadata['sources'])
+            'unique_sources': len(self.corpus_metadata['sources']),
+            'load_status': self.load_status.as_dict(),
+            'refresh': {
+                'status': self.refresh_status.as_dict(),
+                'last_result': self.last_refresh
+            },
+            'deduplication': self.corpus_metadata.get('deduplication'),
+            'statistics': self.get_corpus_statistics(),
+            'language_partitions': self.corpus_metadata.get('language_partitions'),
+            'tiers': {
+                'partitions': self.corpus_metadata.get('tier_partitions'),
+                'hot_min_score': HOT_MIN_SCORE,
+                'cold_threshold': self.cold_threshold,
+                'searches': self._tier_search_counts(),
+                'hot_pinned_mb': to_mb(self.corpus_data.pinned_nbytes) if self.corpus_data is not None else 0
+            },
+            'storage': {
+                'corpus_mb': to_mb(self.corpus_data.nbytes) if self.corpus_data is not None else 0,
+                'shared_memory': self.shared_memory,
+                'process_rss_mb': to_mb(current_rss()),
+                'process_private_mb': to_mb(private_memory()),
+                'answers': (
+                    self.corpus_data.answers.get_statistics()
+                    if self.corpus_data is not None and isinstance(self.corpus_data.answers, CompressedStrings)
+                    else None
+                )
+            },
+            'search_index': self.search_index.get_statistics() if self.search_index else None,
+            'ngram_index': self.ngram_index.get_statistics() if self.ngram_index else None,
+            'keyword_index': self.keyword_index.get_statistics() if self.keyword_index else None,
+            'tag_index': self.tag_index.get_statistics() if self.tag_index else None,
+            'query_cache': self.query_cache.get_statistics()
         }
     
-    def export_search_index(self, output_file: str = 'corpus_index.json'):
-        """Exporta un índice de búsqueda para acceso rápido"""
-        if self.corpus_data is None:
+    def _corpus_signature(self, corpus_data: CorpusStore = None, fingerprints: Dict = None) -> Dict:
+        """Identifica el corpus sobre el que se construyó un índice (por defecto, el cargado)"""
+        corpus_data = corpus_data if corpus_data is not None else self.corpus_data
+        return {
+            'fingerprints': fingerprints if fingerprints is not None else self.source_fingerprints,
+            'normalization': normalization_signature(self.remove_stopwords),
+            'languages': list(LANGUAGES),
+            'tiers': list(TIERS),
+            'total_records': len(corpus_data) if corpus_data is not None else 0
+        }
+    
+    def export_search_index(self, output_file: str = None):
+        """Exporta vocabulario, postings, longitudes y filas de los índices a un archivo binario"""
+        output_file = output_file or self.index_file
+        if self.corpus_data is None or self.search_index is None:
             return False
         
         try:
-            index = {
-                'metadata': self.corpus_metadata,
-                'total_entries': len(self.corpus_data),
-                'sample_queries': self.corpus_data['question'].head(100).tolist()
-            }
+            arrays = self.search_index.to_arrays()
+            arrays['bm25_row_ids'] = self.index_row_ids
+            if self.ngram_index is not None:
+                arrays.update(self.ngram_index.to_arrays())
             
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(index, f, ensure_ascii=False, indent=2)
+            write_index_file(output_file, arrays, {'corpus': self._corpus_signature()})
             
             print(f"[OK] Índice exportado a {output_file}")
             return True
@@ -185,62 +1364,92 @@ class CorpusIntegration:
             print(f"[ERROR] No se pudo exportar índice: {e}")
             return False
     
-    def get_source_breakdown(self) -> Dict:
-        """Retorna desglose de registros por fuente"""
-        if self.corpus_data is None:
-            return {}
-        
-        breakdown = {}
-        for source, group in self.corpus_data.groupby('source'):
-            breakdown[source] = {
-                'count': len(group),
-                'percentage': round(len(group) / len(self.corpus_data) * 100, 2)
-            }
+    def load_search_index(self, index_file: str = None) -> bool:
+        """Carga un índice exportado; rechaza archivos dañados o de otro corpus"""
+        index_file = index_file or self.index_file
+        if self.corpus_data is None or not os.path.exists(index_file):
+            return False
+        
+        try:
+            arrays, _ = read_index_file(index_file, {'corpus': self._corpus_signature()})
+            search_index = BM25Index.from_arrays(arrays)
+            ngram_index = CharNgramIndex.from_arrays(arrays) if 'ngram_data' in arrays else None
+        except StaleIndexError as e:
+            print(f"[WARN] Índice rechazado ({index_file}): {e}")
+            return False
+        except Exception as e:
+            print(f"[WARN] No se pudo cargar índice ({index_file}): {e}")
+            return False
         
-        return breakdown
+        self.search_index = search_index
+        self.ngram_index = ngram_index
+        self.index_row_ids = arrays['bm25_row_ids']
+        print(f"[OK] Índice cargado desde {index_file}: {search_index.num_docs} documentos")
+        return True
+    
+    def get_source_breakdown(self) -> Dict:
+        """Retorna desglose de registros por fuente (precalculado al armar el corpus)"""
+        return self.get_corpus_statistics().get('sources', {})
+    
+    def get_corpus_statistics(self) -> Dict:
+        """
+        Estadísticas calculadas al armar el corpus: fuentes, longitudes de preguntas y
+        respuestas, vocabulario, duplicados y tamaño de los índices. Solo cambian al
+        recargar el corpus, así que leerlas no recorre las filas.
+        """
+        return self.corpus_metadata.get('statistics') or {}
 
-# Instancia global del corpus integrado
-integrated_corpus = CorpusIntegration()
+def build_artifacts(data_dir: str, out_dir: str) -> Dict:
+    """
+    Construye offline todos los artefactos de búsqueda en out_dir: particiones por fuente,
+    corpus normalizado (snapshot), índices BM25 y TF-IDF, mapa de duplicados y
+    statistics.json. Un servidor con CORPUS_ARTIFACTS_ONLY=1 y CORPUS_ARTIFACTS_DIR=out_dir
+    solo los mapea en memoria.
+    """
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = CorpusIntegration(search_workers=0, watch_interval=0, data_dir=data_dir,
+                               artifacts_dir=out_dir, artifacts_only=False)
+    if corpus.load_status.error or corpus.corpus_data is None:
+        raise RuntimeError(f"No se pudo construir el corpus desde {data_dir}")
+    
+    stats = corpus.get_statistics()
+    stats.pop('query_cache', None)
+    stats.pop('refresh', None)
+    stats['build'] = {
+        'data_dir': os.path.abspath(data_dir),
+        'source_fingerprints': corpus.source_fingerprints,
+        'normalization': normalization_signature(corpus.remove_stopwords),
+        'elapsed_seconds': round(time.perf_counter() - started, 2),
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    with open(os.path.join(out_dir, 'statistics.json'), 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2, default=str)
+    
+    print(f"[OK] Artefactos construidos en {out_dir} ({stats['build']['elapsed_seconds']} s)")
+    return stats
+
+# Instancia global del corpus integrado (se carga en segundo plano). No se crea al correr
+# este módulo como constructor offline ni con CORPUS_AUTOLOAD=0
+integrated_corpus = (
+    CorpusIntegration(background=True)
+    if __name__ != '__main__' and os.environ.get('CORPUS_AUTOLOAD', '1') == '1' else None
+)
 
 if __name__ == '__main__':
-    print("\n" + "="*60)
-    print("SISTEMA DE CORPUS INTEGRADO")
-    print("="*60)
-    
-    # Mostrar estadísticas
-    stats = integrated_corpus.get_statistics()
-    print(f"\n📊 Total de registros: {stats['total_records']}")
-    print(f"📁 Fuentes cargadas: {stats['unique_sources']}")
-    
-    # Mostrar desglose
-    breakdown = integrated_corpus.get_source_breakdown()
-    print("\n📈 Desglose por fuente:")
-    for source, data in breakdown.items():
-        print(f"  • {source}: {data['count']} registros ({data['percentage']}%)")
-    
-    # Ejemplos de búsqueda
-    print("\n" + "="*60)
-    print("EJEMPLOS DE BÚSQUEDA")
-    print("="*60)
-    
-    test_queries = [
-        "síntomas de diabetes",
-        "glucosa elevada",
-        "insulina",
-        "alimentos diabetes",
-        "complicaciones"
-    ]
+    import argparse
     
-    for query in test_queries:
-        print(f"\n🔍 Buscando: '{query}'")
-        results = integrated_corpus.search(query, threshold=0.25, top_k=2)
-        
-        for i, result in enumerate(results, 1):
-            print(f"\n  Resultado {i}:")
-            print(f"  ├─ Fuente: {result['source']}")
-            print(f"  ├─ Similitud: {result['similarity']:.0%}")
-            print(f"  ├─ Pregunta: {result['question'][:80]}...")
-            print(f"  └─ Respuesta: {result['answer'][:100]}...")
+    parser = argparse.ArgumentParser(prog='python -m corpus_integration',
+                                     description='Herramientas offline del corpus integrado')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Construye todos los artefactos de búsqueda')
+    build.add_argument('--data', default='data', help='Directorio con los CSV (por defecto: data)')
+    build.add_argument('--out', default='artifacts', help='Directorio de salida (por defecto: artifacts)')
+    args = parser.parse_args()
     
-    # Exportar índice
-    integrated_corpus.export_search_index()
+    if args.command == 'build':
+        try:
+            build_artifacts(args.data, args.out)
+        except Exception as e:
+            print(f"[ERROR] Falló la construcción de artefactos: {e}")
+            raise SystemExit(1)
@@ -0,0 +1,119 @@
+"""
+Particiones del corpus por archivo fuente
+Cada CSV tiene su propio snapshot con sus filas normalizadas (antes de eliminar
+duplicados), sus claves de búsqueda, el idioma y el nivel (caliente/frío) de cada
+fila, sus etiquetas (si el CSV tiene esa columna) y sus índices parciales sobre las claves:
+BM25 y conteos de n-gramas de caracteres.
+Cuando un archivo cambia solo se vuelve a ingerir e indexar su partición; el corpus
+completo se arma uniendo particiones (BM25Index.merge, CharNgramIndex.merge).
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from corpus_snapshot import CorpusSnapshot, SNAPSHOT_ROOT, pack_strings, unpack_strings
+from corpus_store import PackedStrings
+from search_index import BM25Index, CharNgramIndex
+
+PARTITIONS_ROOT = os.path.join(SNAPSHOT_ROOT, 'partitions')
+
+
+class SourcePartition:
+    """Filas normalizadas de un archivo fuente con sus índices parciales"""
+
+    def __init__(self, filename: str, source_name: str, questions: PackedStrings, answers: PackedStrings,
+                 keys: PackedStrings, language_codes: np.ndarray, tier_codes: np.ndarray, bm25: BM25Index,
+                 ngram_vocabulary: List[str], ngram_counts: csr_matrix, metadata: Dict = None,
+                 tags: PackedStrings = None):
+        self.filename = filename
+        self.source_name = source_name
+        self.questions = questions
+        self.answers = answers
+        self.keys = keys
+        # Código (índice en LANGUAGES) del idioma detectado de cada fila
+        self.language_codes = language_codes
+        # Código (índice en TIERS) del nivel de cada fila
+        self.tier_codes = tier_codes
+        self.bm25 = bm25
+        # Vocabulario ordenado de n-gramas y conteos crudos por fila (sin min_df ni IDF)
+        self.ngram_vocabulary = ngram_vocabulary
+        self.ngram_counts = ngram_counts
+        self.metadata = metadata or {}
+        # Etiquetas de cada fila; None si el CSV no tiene columna de etiquetas
+        self.tags = tags
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    @classmethod
+    def build(cls, filename: str, source_name: str, questions: PackedStrings, answers: PackedStrings,
+              keys: PackedStrings, language_codes: np.ndarray, tier_codes: np.ndarray,
+              metadata: Dict = None, tags: PackedStrings = None) -> 'SourcePartition':
+        """Indexa las claves de búsqueda de la partición"""
+        bm25 = BM25Index().build(keys)
+        ngram_vocabulary, ngram_counts = CharNgramIndex().partial_counts(keys)
+        return cls(filename, source_name, questions, answers, keys, language_codes, tier_codes,
+                   bm25, ngram_vocabulary, ngram_counts, metadata, tags)
+
+    @staticmethod
+    def snapshot(filename: str, root: str = PARTITIONS_ROOT) -> CorpusSnapshot:
+        return CorpusSnapshot(os.path.join(root, os.path.splitext(filename)[0]))
+
+    def write(self, fingerprint: Dict, root: str = PARTITIONS_ROOT):
+        """Guarda la partición junto con la huella (tamaño, mtime y SHA-256) de su archivo"""
+        vocab_buffer, vocab_offsets = pack_strings(self.ngram_vocabulary)
+        arrays = {
+            'question_buffer': self.questions.buffer,
+            'question_offsets': self.questions.offsets,
+            'answer_buffer': self.answers.buffer,
+            'answer_offsets': self.answers.offsets,
+            'key_buffer': self.keys.buffer,
+            'key_offsets': self.keys.offsets,
+            'language_codes': self.language_codes,
+            'tier_codes': self.tier_codes,
+            'ngram_vocab_buffer': vocab_buffer,
+            'ngram_vocab_offsets': vocab_offsets,
+            'ngram_data': self.ngram_counts.data,
+            'ngram_indices': self.ngram_counts.indices,
+            'ngram_indptr': self.ngram_counts.indptr
+        }
+        if self.tags is not None:
+            arrays['tag_buffer'] = self.tags.buffer
+            arrays['tag_offsets'] = self.tags.offsets
+        arrays.update(self.bm25.to_arrays())
+        self.snapshot(self.filename, root).write(arrays, fingerprint, {
+            'source_name': self.source_name,
+            'metadata': self.metadata
+        })
+
+    @classmethod
+    def load(cls, filename: str, root: str = PARTITIONS_ROOT) -> 'SourcePartition':
+        """Abre una partición guardada (textos y postings mapeados en memoria)"""
+        arrays, metadata = cls.snapshot(filename, root).load()
+        ngram_vocabulary = unpack_strings(arrays['ngram_vocab_buffer'], arrays['ngram_vocab_offsets'])
+        ngram_counts = csr_matrix(
+            (arrays['ngram_data'], arrays['ngram_indices'], arrays['ngram_indptr']),
+            shape=(len(arrays['question_offsets']) - 1, len(ngram_vocabulary))
+        )
+        return cls(
+            filename,
+            metadata['source_name'],
+            PackedStrings(arrays['question_buffer'], arrays['question_offsets']),
+            PackedStrings(arrays['answer_buffer'], arrays['answer_offsets']),
+            PackedStrings(arrays['key_buffer'], arrays['key_offsets']),
+            arrays['language_codes'],
+            arrays['tier_codes'],
+            BM25Index.from_arrays(arrays),
+            ngram_vocabulary,
+            ngram_counts,
+            metadata.get('metadata', {}),
+            PackedStrings(arrays['tag_buffer'], arrays['tag_offsets']) if 'tag_buffer' in arrays else None
+        )
+
+    @classmethod
+    def stored_fingerprint(cls, filename: str, root: str = PARTITIONS_ROOT) -> Optional[Dict]:
+        """Huella del archivo con la que se guardó la partición; None si no hay partición"""
+        return cls.snapshot(filename, root).stored_fingerprints()
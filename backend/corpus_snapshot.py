@@ -0,0 +1,324 @@
+"""
+Snapshot binario del corpus
+- Columnas normalizadas como arreglos .npy que se cargan con memory mapping,
+  para no volver a parsear los CSV en cada arranque
+- Archivo de índice de búsqueda versionado y con checksum SHA-256
+"""
+
+import os
+import json
+import mmap
+import shutil
+import struct
+import hashlib
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: candado con msvcrt
+    fcntl = None
+    import msvcrt
+
+SNAPSHOT_VERSION = 11
+SNAPSHOT_ROOT = os.path.join('data', 'snapshot')
+
+ARTIFACTS_HELP = "constrúyalos con: python -m corpus_integration build --data data --out <directorio>"
+
+
+def artifact_settings(data_dir: str = None, artifacts_dir: str = None,
+                      artifacts_only: bool = None) -> Tuple[str, str, bool]:
+    """
+    (directorio de CSV, directorio de artefactos, modo solo artefactos). Lo que no se pasa
+    se toma de CORPUS_DATA_DIR, CORPUS_ARTIFACTS_DIR y CORPUS_ARTIFACTS_ONLY=1; en modo
+    solo artefactos el servidor abre snapshots e índices ya construidos y no lee los CSV.
+    """
+    if data_dir is None:
+        data_dir = os.environ.get('CORPUS_DATA_DIR', 'data')
+    if artifacts_dir is None:
+        artifacts_dir = os.environ.get('CORPUS_ARTIFACTS_DIR', SNAPSHOT_ROOT)
+    if artifacts_only is None:
+        artifacts_only = os.environ.get('CORPUS_ARTIFACTS_ONLY', '0') == '1'
+    return data_dir, artifacts_dir, artifacts_only
+
+
+# Archivo de candado dentro del directorio de artefactos
+ARTIFACTS_LOCK = '.build.lock'
+
+
+@contextmanager
+def artifacts_lock(directory: str):
+    """
+    Candado exclusivo entre procesos sobre un directorio de artefactos. Con varios
+    workers de uvicorn solo uno construye snapshots e índices; los demás esperan y
+    después abren (mapeados y compartidos) los archivos que ese escribió.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ARTIFACTS_LOCK), 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK se rinde tras 10 intentos; la construcción puede tardar más
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+INDEX_MAGIC = b'CIDX'
+INDEX_VERSION = 1
+_INDEX_PREAMBLE = struct.Struct('<4sIQ')
+_ALIGNMENT = 64
+
+
+def file_fingerprints(data_dir: str, filenames: List[str]) -> Dict:
+    """Huella (tamaño y mtime) de cada archivo fuente; None si no existe"""
+    fingerprints = {}
+    for filename in filenames:
+        path = os.path.join(data_dir, filename)
+        try:
+            stat = os.stat(path)
+            fingerprints[filename] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        except OSError:
+            fingerprints[filename] = None
+    return fingerprints
+
+
+def pack_strings(values) -> Tuple[np.ndarray, np.ndarray]:
+    """Codifica textos como un buffer UTF-8 contiguo más offsets (n + 1)"""
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return buffer, offsets
+
+
+def unpack_strings(buffer: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """Decodifica un buffer UTF-8 con offsets a una lista de str"""
+    data = buffer.tobytes()
+    bounds = offsets.tolist()
+    return [data[start:end].decode('utf-8') for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def content_hash(path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 del contenido de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StringColumnBuilder:
+    """Acumula textos directamente en el formato de pack_strings (buffer UTF-8 + offsets)"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offsets = array('q', [0])
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets)
+
+    def extend(self, values):
+        for value in values:
+            self._buffer += str(value).encode('utf-8')
+            self._offsets.append(len(self._buffer))
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (buffer, offsets) sin copiar el buffer; después no se debe seguir agregando"""
+        return np.frombuffer(self._buffer, dtype=np.uint8), np.frombuffer(self._offsets, dtype=np.int64)
+
+
+class CorpusSnapshot:
+    """Directorio con un manifiesto JSON y arreglos .npy de solo lectura"""
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.directory, self.MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_current(self, fingerprints: Dict) -> bool:
+        """True si el snapshot existe y fue compilado a partir de los mismos archivos"""
+        manifest = self._read_manifest()
+        return (
+            manifest is not None
+            and manifest.get('version') == SNAPSHOT_VERSION
+            and manifest.get('fingerprints') == fingerprints
+        )
+
+    def stored_fingerprints(self) -> Optional[Dict]:
+        """Huellas con las que se compiló el snapshot; None si no existe o es de otra versión"""
+        manifest = self._read_manifest()
+        if manifest is None or manifest.get('version') != SNAPSHOT_VERSION:
+            return None
+        return manifest.get('fingerprints')
+
+    def update_fingerprints(self, fingerprints: Dict):
+        """Reemplaza solo las huellas del manifiesto (los arreglos no cambian)"""
+        manifest = self._read_manifest()
+        if manifest is None:
+            raise FileNotFoundError(f"No existe snapshot en {self.directory}")
+        manifest['fingerprints'] = fingerprints
+        staging = os.path.join(self.directory, self.MANIFEST + '.tmp')
+        with open(staging, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(staging, os.path.join(self.directory, self.MANIFEST))
+
+    def load(self) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """Abre los arreglos con memory mapping y retorna (arreglos, metadata)"""
+        manifest = self._read_manifest()
+        if manifest is None:
+            raise FileNotFoundError(f"No existe snapshot en {self.directory}")
+
+        arrays = {
+            name: np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode='r')
+            for name in manifest['arrays']
+        }
+        return arrays, manifest.get('metadata', {})
+
+    def write(self, arrays: Dict[str, np.ndarray], fingerprints: Dict, metadata: Dict = None):
+        """Escribe el snapshot en un directorio temporal y lo reemplaza de forma atómica"""
+        # Nombres propios de cada escritor: dos cargas simultáneas no comparten directorio temporal
+        suffix = f"{os.getpid()}-{threading.get_ident()}"
+        staging = f"{self.directory}.tmp-{suffix}"
+        previous = f"{self.directory}.old-{suffix}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'fingerprints': fingerprints,
+            'arrays': sorted(arrays),
+            'metadata': metadata or {}
+        }
+        with open(os.path.join(staging, self.MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        # Los procesos que ya mapearon el snapshot anterior siguen leyendo sus archivos
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(self.directory):
+            os.replace(self.directory, previous)
+        os.replace(staging, self.directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+class StaleIndexError(ValueError):
+    """El archivo de índice está dañado o no corresponde al corpus actual"""
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def write_index_file(path: str, arrays: Dict[str, np.ndarray], metadata: Dict):
+    """
+    Escribe arreglos en un único archivo binario:
+    magic | versión | largo del encabezado | encabezado JSON | arreglos alineados a 64 bytes.
+    El encabezado guarda dtype, forma y offset de cada arreglo y el SHA-256 del contenido.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    specs = []
+    payload_size = 0
+    for name, array in arrays.items():
+        payload_size = _aligned(payload_size)
+        specs.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': payload_size})
+        payload_size += array.nbytes
+
+    digest = hashlib.sha256()
+    position = 0
+    for spec in specs:
+        digest.update(b'\0' * (spec['offset'] - position))
+        digest.update(memoryview(arrays[spec['name']]).cast('B'))
+        position = spec['offset'] + arrays[spec['name']].nbytes
+
+    header = json.dumps({
+        'metadata': metadata,
+        'arrays': specs,
+        'payload_size': payload_size,
+        'sha256': digest.hexdigest()
+    }, ensure_ascii=False).encode('utf-8')
+    payload_start = _aligned(_INDEX_PREAMBLE.size + len(header))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    staging = path + '.tmp'
+    with open(staging, 'wb') as f:
+        f.write(_INDEX_PREAMBLE.pack(INDEX_MAGIC, INDEX_VERSION, len(header)))
+        f.write(header)
+        f.write(b'\0' * (payload_start - _INDEX_PREAMBLE.size - len(header)))
+        position = 0
+        for spec in specs:
+            f.write(b'\0' * (spec['offset'] - position))
+            f.write(memoryview(arrays[spec['name']]).cast('B'))
+            position = spec['offset'] + arrays[spec['name']].nbytes
+    os.replace(staging, path)
+
+
+def read_index_file(path: str, expected_metadata: Dict = None) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Abre un archivo de índice con memory mapping y valida versión, checksum y,
+    si se indica, que su metadata coincida con expected_metadata.
+    Lanza StaleIndexError si el archivo no debe usarse.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapped) < _INDEX_PREAMBLE.size:
+        raise StaleIndexError("archivo de índice truncado")
+    magic, version, header_size = _INDEX_PREAMBLE.unpack_from(mapped, 0)
+    if magic != INDEX_MAGIC:
+        raise StaleIndexError("el archivo no es un índice del corpus")
+    if version != INDEX_VERSION:
+        raise StaleIndexError(f"versión de índice {version}, se esperaba {INDEX_VERSION}")
+
+    header = json.loads(mapped[_INDEX_PREAMBLE.size:_INDEX_PREAMBLE.size + header_size].decode('utf-8'))
+    payload_start = _aligned(_INDEX_PREAMBLE.size + header_size)
+    payload_end = payload_start + header['payload_size']
+    if len(mapped) < payload_end:
+        raise StaleIndexError("archivo de índice truncado")
+
+    digest = hashlib.sha256(memoryview(mapped)[payload_start:payload_end]).hexdigest()
+    if digest != header['sha256']:
+        raise StaleIndexError("checksum inválido, el archivo de índice está dañado")
+    if expected_metadata is not None:
+        for key, value in expected_metadata.items():
+            if header['metadata'].get(key) != value:
+                raise StaleIndexError(f"el índice fue construido con otro corpus ('{key}' no coincide)")
+
+    arrays = {}
+    for spec in header['arrays']:
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        arrays[spec['name']] = np.frombuffer(
+            mapped, dtype=dtype, count=count, offset=payload_start + spec['offset']
+        ).reshape(spec['shape'])
+    return arrays, header['metadata']
@@ -0,0 +1,68 @@
+"""
+Estadísticas del corpus integrado calculadas una vez al armarlo
+Se guardan en la metadata del snapshot, así que /corpus-stats las lee sin
+recorrer el corpus; solo cambian cuando el corpus se construye o se recarga.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+from corpus_store import CorpusStore
+from memory_usage import to_mb
+from search_index import BM25Index, CharNgramIndex
+
+# Percentiles de las distribuciones de longitud (en caracteres)
+LENGTH_PERCENTILES = (50, 90, 99)
+
+
+def length_distribution(lengths: np.ndarray) -> Dict:
+    """Mínimo, media, percentiles y máximo de longitudes en caracteres"""
+    if len(lengths) == 0:
+        return {'min': 0, 'mean': 0.0, **{f'p{p}': 0 for p in LENGTH_PERCENTILES}, 'max': 0}
+    percentiles = np.percentile(lengths, LENGTH_PERCENTILES)
+    return {
+        'min': int(lengths.min()),
+        'mean': round(float(lengths.mean()), 1),
+        **{f'p{p}': int(round(value)) for p, value in zip(LENGTH_PERCENTILES, percentiles)},
+        'max': int(lengths.max())
+    }
+
+
+def source_breakdown(corpus_data: CorpusStore) -> Dict[str, Dict]:
+    """Registros y porcentaje del corpus de cada fuente"""
+    total = len(corpus_data)
+    return {
+        source: {'count': count, 'percentage': round(count / total * 100, 2)}
+        for source, count in corpus_data.source_counts().items()
+    }
+
+
+def corpus_statistics(corpus_data: CorpusStore, answer_lengths: np.ndarray, deduplication: Dict,
+                      search_index: BM25Index, ngram_index: Optional[CharNgramIndex]) -> Dict:
+    """
+    Estadísticas del corpus recién armado. answer_lengths se mide antes de comprimir
+    las respuestas, para no tener que descomprimirlas aquí.
+    """
+    bm25 = search_index.get_statistics()
+    ngrams = ngram_index.get_statistics() if ngram_index is not None else None
+    return {
+        'total_records': len(corpus_data),
+        'sources': source_breakdown(corpus_data),
+        'lengths': {
+            'question': length_distribution(corpus_data.questions.char_lengths()),
+            'answer': length_distribution(answer_lengths)
+        },
+        'vocabulary': {
+            'bm25_terms': bm25['vocabulary'],
+            'ngram_features': ngrams['features'] if ngrams else 0
+        },
+        'deduplication': {
+            key: deduplication.get(key)
+            for key in ('input_records', 'exact_duplicates', 'near_duplicates', 'removed_records')
+        },
+        'indexes': {
+            'bm25': dict(bm25, size_mb=to_mb(search_index.nbytes)),
+            'ngram': dict(ngrams, size_mb=to_mb(ngram_index.nbytes)) if ngrams else None
+        }
+    }
@@ -0,0 +1,392 @@
+"""
+Almacenamiento compacto del corpus integrado
+- Textos en un buffer UTF-8 contiguo con offsets (el mismo formato del snapshot,
+  así que pueden ser arreglos mapeados en memoria y compartidos entre procesos)
+- Fuente como códigos uint8 más la lista de nombres
+- Clave de búsqueda de cada pregunta (text_normalization), calculada una vez al ingerir
+- Idioma de cada pregunta (language_detection) y nivel caliente/frío (corpus_tiers)
+  como códigos uint8: las filas se ordenan por nivel y luego por idioma
+- Respuestas comprimidas con zlib en bloques de pocas filas y un diccionario
+  tomado de las propias respuestas; solo se descomprimen las filas devueltas
+Los str de Python solo se crean al pedir una fila o al recorrer una columna
+"""
+
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Sequence, Union
+
+import numpy as np
+
+from corpus_snapshot import pack_strings
+
+# Filas que se decodifican juntas al recorrer una columna completa
+_ITER_BLOCK_ROWS = 4096
+
+# Respuestas por bloque comprimido y tamaño del diccionario de zlib (máximo 32 KB)
+ANSWER_BLOCK_ROWS = 4
+_ZDICT_BYTES = 32 * 1024
+_ZDICT_SAMPLES = 2000
+
+
+class PackedStrings:
+    """Columna de textos: textos[i] = buffer[offsets[i]:offsets[i + 1]] en UTF-8"""
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+        # Copia en RAM del prefijo de buffer de las filas fijadas con pin()
+        self.pinned = np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def from_strings(cls, values) -> 'PackedStrings':
+        return cls(*pack_strings(values))
+
+    @classmethod
+    def empty(cls, rows: int) -> 'PackedStrings':
+        """Columna de rows textos vacíos"""
+        return cls(np.zeros(0, dtype=np.uint8), np.zeros(rows + 1, dtype=np.int64))
+
+    @classmethod
+    def concat(cls, columns: Sequence['PackedStrings']) -> 'PackedStrings':
+        """Une varias columnas en una sola, una a continuación de otra"""
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for column in columns:
+            offsets.append(np.asarray(column.offsets[1:], dtype=np.int64) + base)
+            base += int(column.offsets[-1])
+        buffers = [column.buffer for column in columns]
+        buffer = np.concatenate(buffers) if buffers else np.zeros(0, dtype=np.uint8)
+        return cls(buffer, np.concatenate(offsets))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        buffer = self.pinned if end <= len(self.pinned) else self.buffer
+        return buffer[start:end].tobytes().decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        """Decodifica por bloques: una sola copia de bytes por bloque de filas"""
+        for first in range(0, len(self), _ITER_BLOCK_ROWS):
+            last = min(first + _ITER_BLOCK_ROWS, len(self))
+            bounds = (self.offsets[first:last + 1] - self.offsets[first]).tolist()
+            buffer = self.pinned if self.offsets[last] <= len(self.pinned) else self.buffer
+            data = buffer[self.offsets[first]:self.offsets[last]].tobytes()
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                yield data[start:end].decode('utf-8')
+
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes + self.offsets.nbytes
+
+    def char_lengths(self) -> np.ndarray:
+        """Caracteres de cada texto (bytes UTF-8 que no son de continuación), sin decodificar"""
+        lengths = np.empty(len(self), dtype=np.int64)
+        for first in range(0, len(self), _ITER_BLOCK_ROWS):
+            last = min(first + _ITER_BLOCK_ROWS, len(self))
+            start, end = int(self.offsets[first]), int(self.offsets[last])
+            data = np.asarray(self.buffer[start:end])
+            starts = np.concatenate(([0], np.cumsum((data & 0xC0) != 0x80)))
+            bounds = np.asarray(self.offsets[first:last + 1], dtype=np.int64) - start
+            lengths[first:last] = starts[bounds[1:]] - starts[bounds[:-1]]
+        return lengths
+
+    def pin(self, rows: int):
+        """Copia en RAM los textos de las primeras rows filas; el resto sigue en buffer (p. ej. mapeado)"""
+        self.pinned = np.array(self.buffer[:int(self.offsets[rows])])
+
+    def slice(self, start: int, end: int) -> 'PackedStrings':
+        """Columna con las filas [start, end); comparte buffer (o su copia fijada en RAM)"""
+        first, last = int(self.offsets[start]), int(self.offsets[end])
+        buffer = self.pinned if last <= len(self.pinned) else self.buffer
+        return PackedStrings(buffer[first:last], np.asarray(self.offsets[start:end + 1], dtype=np.int64) - first)
+
+    def take(self, indices: np.ndarray) -> 'PackedStrings':
+        """Nueva columna con las filas indicadas (en orden ascendente), copiando tramos contiguos"""
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.offsets[indices + 1] - self.offsets[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+        run_starts = np.concatenate(([0], breaks)).tolist()
+        run_ends = np.concatenate((breaks, [len(indices)])).tolist()
+        pieces = [
+            self.buffer[self.offsets[indices[start]]:self.offsets[indices[end - 1] + 1]]
+            for start, end in zip(run_starts, run_ends) if end > start
+        ]
+        buffer = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.uint8)
+        return PackedStrings(buffer, offsets)
+
+
+class CompressedStrings:
+    """
+    Columna de textos comprimida en bloques de block_rows filas con zlib y un diccionario
+    común (zdict). offsets son los de los textos sin comprimir; block_offsets delimitan
+    cada bloque en buffer. Leer una fila descomprime solo su bloque.
+    """
+
+    def __init__(self, buffer: np.ndarray, block_offsets: np.ndarray, offsets: np.ndarray,
+                 zdict: np.ndarray, block_rows: int = ANSWER_BLOCK_ROWS):
+        self.buffer = buffer
+        self.block_offsets = block_offsets
+        self.offsets = offsets
+        self.zdict = zdict
+        self.block_rows = int(block_rows)
+        self._zdict_bytes = np.asarray(zdict).tobytes()
+        self.pinned = np.zeros(0, dtype=np.uint8)
+        # Filas descomprimidas y tiempo total, para medir la latencia agregada por resultado
+        self.decompressed_rows = 0
+        self.decompress_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def compress(cls, column: PackedStrings, block_rows: int = ANSWER_BLOCK_ROWS,
+                 level: int = 6) -> 'CompressedStrings':
+        """Comprime una columna; el diccionario son fragmentos de una muestra de sus textos"""
+        num_rows = len(column)
+        step = max(1, num_rows // _ZDICT_SAMPLES)
+        sample = b''.join(column[idx].encode('utf-8')[:256] for idx in range(0, num_rows, step))
+        zdict = sample[-_ZDICT_BYTES:]
+
+        blocks = []
+        for first in range(0, num_rows, block_rows):
+            last = min(first + block_rows, num_rows)
+            data = column.buffer[column.offsets[first]:column.offsets[last]].tobytes()
+            compressor = zlib.compressobj(level, zdict=zdict) if zdict else zlib.compressobj(level)
+            blocks.append(compressor.compress(data) + compressor.flush())
+
+        block_offsets = np.zeros(len(blocks) + 1, dtype=np.int64)
+        np.cumsum([len(block) for block in blocks], out=block_offsets[1:])
+        buffer = np.frombuffer(b''.join(blocks), dtype=np.uint8).copy()
+        return cls(buffer, block_offsets, np.asarray(column.offsets, dtype=np.int64),
+                   np.frombuffer(zdict, dtype=np.uint8).copy(), block_rows)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _block(self, block: int) -> bytes:
+        start, end = int(self.block_offsets[block]), int(self.block_offsets[block + 1])
+        buffer = self.pinned if end <= len(self.pinned) else self.buffer
+        decompressor = zlib.decompressobj(zdict=self._zdict_bytes) if self._zdict_bytes else zlib.decompressobj()
+        return decompressor.decompress(buffer[start:end].tobytes())
+
+    def __getitem__(self, idx: int) -> str:
+        started = time.perf_counter()
+        block = idx // self.block_rows
+        base = int(self.offsets[block * self.block_rows])
+        start, end = int(self.offsets[idx]) - base, int(self.offsets[idx + 1]) - base
+        text = self._block(block)[start:end].decode('utf-8')
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.decompressed_rows += 1
+            self.decompress_seconds += elapsed
+        return text
+
+    def __iter__(self) -> Iterator[str]:
+        """Descomprime bloque por bloque (para construir índices sobre toda la columna)"""
+        for block in range(len(self.block_offsets) - 1):
+            first = block * self.block_rows
+            last = min(first + self.block_rows, len(self))
+            data = self._block(block)
+            bounds = (self.offsets[first:last + 1] - self.offsets[first]).tolist()
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                yield data[start:end].decode('utf-8')
+
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes + self.block_offsets.nbytes + self.offsets.nbytes + self.zdict.nbytes
+
+    @property
+    def raw_nbytes(self) -> int:
+        """Tamaño de los textos sin comprimir"""
+        return int(self.offsets[-1]) if len(self.offsets) else 0
+
+    def pin(self, rows: int):
+        """Copia en RAM los bloques comprimidos que contienen las primeras rows filas"""
+        blocks = -(-rows // self.block_rows)
+        self.pinned = np.array(self.buffer[:int(self.block_offsets[blocks])])
+
+    def take(self, indices: np.ndarray) -> 'CompressedStrings':
+        """Nueva columna comprimida con las filas indicadas"""
+        return CompressedStrings.compress(PackedStrings.from_strings(self[int(idx)] for idx in indices),
+                                          self.block_rows)
+
+    def get_statistics(self) -> Dict:
+        """Relación de compresión y latencia media de descompresión por fila devuelta"""
+        with self._stats_lock:
+            decompressed_rows, decompress_seconds = self.decompressed_rows, self.decompress_seconds
+        return {
+            'codec': 'zlib',
+            'block_rows': self.block_rows,
+            'dictionary_bytes': int(self.zdict.nbytes),
+            'raw_mb': round(self.raw_nbytes / (1024 * 1024), 1),
+            'compressed_mb': round(self.nbytes / (1024 * 1024), 1),
+            'ratio': round(self.raw_nbytes / self.nbytes, 2) if self.nbytes else None,
+            'decompressed_rows': decompressed_rows,
+            'avg_decompress_us': (
+                round(decompress_seconds / decompressed_rows * 1e6, 1)
+                if decompressed_rows else None
+            )
+        }
+
+
+class CorpusStore:
+    """Preguntas, respuestas y fuentes del corpus integrado en arreglos contiguos"""
+
+    def __init__(self, questions: PackedStrings, answers: Union[PackedStrings, CompressedStrings], source_codes: np.ndarray,
+                 source_names: Sequence[str], source_masks: np.ndarray = None, keys: PackedStrings = None,
+                 language_codes: np.ndarray = None, tier_codes: np.ndarray = None, tags: PackedStrings = None,
+                 key_lengths: np.ndarray = None, key_histograms: np.ndarray = None):
+        self.questions = questions
+        self.answers = answers
+        # Pregunta normalizada: la columna sobre la que se indexa y se compara
+        self.keys = keys
+        self.source_codes = source_codes
+        self.source_names = list(source_names)
+        # Bit 1 << código por cada fuente que aportó la fila (ver corpus_dedup)
+        if source_masks is None:
+            source_masks = np.left_shift(np.uint32(1), np.asarray(source_codes, dtype=np.uint32))
+        self.source_masks = source_masks
+        # Índice en LANGUAGES del idioma de cada fila
+        self.language_codes = language_codes
+        # Índice en TIERS del nivel de cada fila (caliente = relevante para diabetes)
+        self.tier_codes = tier_codes
+        # Etiquetas de la fila tal como vienen en su CSV ('' si la fuente no tiene columna de etiquetas)
+        self.tags = tags
+        # Longitud e histograma de clases de caracteres de cada clave (sequence_cascade.cascade_arrays)
+        self.key_lengths = key_lengths
+        self.key_histograms = key_histograms
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def source(self, idx: int) -> str:
+        return self.source_names[self.source_codes[idx]]
+
+    def sources(self, idx: int) -> List[str]:
+        """Fuentes de la fila idx, la propia primero"""
+        own = int(self.source_codes[idx])
+        mask = int(self.source_masks[idx])
+        return [self.source_names[own]] + [
+            name for code, name in enumerate(self.source_names) if mask >> code & 1 and code != own
+        ]
+
+    def row(self, idx: int) -> Dict:
+        """Materializa una sola fila como diccionario"""
+        return {
+            'question': self.questions[idx],
+            'answer': self.answers[idx],
+            'source': self.source(idx)
+        }
+
+    def take(self, indices: np.ndarray) -> 'CorpusStore':
+        """Nuevo almacén con las filas indicadas"""
+        return CorpusStore(
+            self.questions.take(indices),
+            self.answers.take(indices),
+            np.ascontiguousarray(self.source_codes[indices]),
+            self.source_names,
+            np.ascontiguousarray(self.source_masks[indices]),
+            self.keys.take(indices) if self.keys is not None else None,
+            np.ascontiguousarray(self.language_codes[indices]) if self.language_codes is not None else None,
+            np.ascontiguousarray(self.tier_codes[indices]) if self.tier_codes is not None else None,
+            self.tags.take(indices) if self.tags is not None else None,
+            np.ascontiguousarray(self.key_lengths[indices]) if self.key_lengths is not None else None,
+            np.asfortranarray(self.key_histograms[indices]) if self.key_histograms is not None else None
+        )
+
+    def source_counts(self) -> Dict[str, int]:
+        """Filas por fuente, en el orden de las fuentes"""
+        counts = np.bincount(self.source_codes, minlength=len(self.source_names))
+        return {name: int(count) for name, count in zip(self.source_names, counts) if count}
+
+    def partition_ranges(self, tiers: Sequence[str], languages: Sequence[str]) -> Dict[tuple, tuple]:
+        """
+        Rango de filas [inicio, fin) de cada (nivel, idioma). Las filas están ordenadas
+        por nivel y luego por idioma (en el orden de tiers y languages), así que cada
+        partición es contigua. Sin códigos, todas las filas son del primer nivel o idioma.
+        """
+        tier_codes = self.tier_codes if self.tier_codes is not None else np.zeros(len(self), dtype=np.uint8)
+        language_codes = self.language_codes if self.language_codes is not None else np.zeros(len(self), dtype=np.uint8)
+        groups = np.asarray(tier_codes, dtype=np.int64) * len(languages) + language_codes
+        counts = np.bincount(groups, minlength=len(tiers) * len(languages))
+        bounds = np.concatenate(([0], np.cumsum(counts))).tolist()
+        return {
+            (tier, language): (bounds[group], bounds[group + 1])
+            for group, (tier, language) in enumerate((tier, language) for tier in tiers for language in languages)
+        }
+
+    def pin(self, rows: int):
+        """Deja en RAM los textos de las primeras rows filas (el nivel caliente)"""
+        for column in (self.questions, self.answers, self.keys):
+            if column is not None:
+                column.pin(rows)
+
+    @property
+    def pinned_nbytes(self) -> int:
+        return sum(len(column.pinned) for column in (self.questions, self.answers, self.keys) if column is not None)
+
+    @property
+    def nbytes(self) -> int:
+        columns = sum(column.nbytes for column in (self.keys, self.tags) if column is not None)
+        codes = sum(codes.nbytes for codes in (self.language_codes, self.tier_codes, self.key_lengths,
+                                                self.key_histograms) if codes is not None)
+        return (self.questions.nbytes + self.answers.nbytes + columns + codes
+                + self.source_codes.nbytes + self.source_masks.nbytes)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arreglos planos para el snapshot"""
+        arrays = {
+            'question_buffer': self.questions.buffer,
+            'question_offsets': self.questions.offsets,
+            'answer_buffer': self.answers.buffer,
+            'answer_offsets': self.answers.offsets,
+            'source_codes': self.source_codes,
+            'source_mask': self.source_masks
+        }
+        if isinstance(self.answers, CompressedStrings):
+            arrays['answer_block_offsets'] = self.answers.block_offsets
+            arrays['answer_zdict'] = self.answers.zdict
+            arrays['answer_block_rows'] = np.array([self.answers.block_rows], dtype=np.int64)
+        if self.keys is not None:
+            arrays['key_buffer'] = self.keys.buffer
+            arrays['key_offsets'] = self.keys.offsets
+        if self.tags is not None:
+            arrays['tag_buffer'] = self.tags.buffer
+            arrays['tag_offsets'] = self.tags.offsets
+        if self.language_codes is not None:
+            arrays['language_codes'] = self.language_codes
+        if self.tier_codes is not None:
+            arrays['tier_codes'] = self.tier_codes
+        if self.key_lengths is not None:
+            arrays['key_lengths'] = self.key_lengths
+            # Por clase de caracteres (traspuesto): cada clase es contigua, como la lee la cascada
+            arrays['key_histograms'] = self.key_histograms.T
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], source_names: Sequence[str]) -> 'CorpusStore':
+        """Usa los arreglos tal cual (admite arreglos mapeados en memoria)"""
+        if 'answer_block_offsets' in arrays:
+            answers = CompressedStrings(
+                arrays['answer_buffer'], arrays['answer_block_offsets'], arrays['answer_offsets'],
+                arrays['answer_zdict'], int(arrays['answer_block_rows'][0])
+            )
+        else:
+            answers = PackedStrings(arrays['answer_buffer'], arrays['answer_offsets'])
+        return cls(
+            PackedStrings(arrays['question_buffer'], arrays['question_offsets']),
+            answers,
+            arrays['source_codes'],
+            source_names,
+            arrays['source_mask'],
+            PackedStrings(arrays['key_buffer'], arrays['key_offsets']) if 'key_buffer' in arrays else None,
+            arrays.get('language_codes'),
+            arrays.get('tier_codes'),
+            PackedStrings(arrays['tag_buffer'], arrays['tag_offsets']) if 'tag_buffer' in arrays else None,
+            arrays.get('key_lengths'),
+            arrays['key_histograms'].T if 'key_histograms' in arrays else None
+        )
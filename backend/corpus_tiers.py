@@ -0,0 +1,39 @@
+"""
+Niveles de almacenamiento del corpus: caliente (diabetes) y frío (resto)
+Cada fila recibe al ingerir un puntaje de relevancia para diabetes según los
+términos de su pregunta y de su respuesta. Las filas calientes se guardan al
+principio del corpus, con sus textos y su cascada en RAM, y se buscan primero;
+las frías quedan mapeadas en memoria desde el snapshot y solo se consultan
+cuando el mejor resultado caliente no alcanza COLD_TIER_THRESHOLD.
+"""
+
+import os
+import re
+
+# Orden de los niveles dentro del corpus (el caliente es el prefijo de filas)
+TIERS = ('hot', 'cold')
+TIER_CODES = {tier: code for code, tier in enumerate(TIERS)}
+
+# Puntaje mínimo para que una fila quede en el nivel caliente
+HOT_MIN_SCORE = 2
+
+# Similitud mínima del mejor resultado caliente para no consultar el nivel frío
+COLD_TIER_THRESHOLD = float(os.environ.get('CORPUS_COLD_THRESHOLD', '0.5'))
+
+# Raíces de términos de diabetes en español e inglés (con y sin acentos)
+_DIABETES_TERMS = re.compile(
+    r'diabet|gluc|glyc|insulin|metformin|az[uú]car|sugar|a1c|'
+    r'p[aá]ncrea|ketoacid|cetoacid|neuropat|retinopat|nefropat'
+)
+
+
+def diabetes_score(question: str, answer: str) -> int:
+    """Coincidencias en la pregunta (valen doble) más las de la respuesta (máximo 3)"""
+    question_hits = len(_DIABETES_TERMS.findall(str(question).lower()))
+    answer_hits = len(_DIABETES_TERMS.findall(str(answer).lower()))
+    return 2 * question_hits + min(answer_hits, 3)
+
+
+def tier_of(question: str, answer: str) -> str:
+    """Nivel de una fila: 'hot' si es relevante para diabetes, 'cold' si no"""
+    return 'hot' if diabetes_score(question, answer) >= HOT_MIN_SCORE else 'cold'
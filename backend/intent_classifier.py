@@ -0,0 +1,75 @@
+"""
+Clasificador de intenciones y tópicos por palabras clave
+Compila todas las palabras clave una sola vez en una expresión regular y devuelve
+todas las intenciones presentes en una sola pasada por el texto. Sin distinguir
+mayúsculas ni acentos ("sintoma" coincide con "síntoma"). Como en 'palabra in texto',
+una palabra clave coincide si aparece como subcadena del texto.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+from text_normalization import strip_accents
+
+
+def fold_text(text: str) -> str:
+    """Minúsculas y sin acentos; el resto de los caracteres se conserva"""
+    return strip_accents(str(text).lower())
+
+
+class IntentClassifier:
+    """
+    Intenciones con sus palabras clave, en orden de prioridad. La expresión compilada
+    alterna las palabras de mayor a menor longitud: en cada coincidencia toma la más
+    larga que empieza ahí, y como las demás que empiezan en esa posición son prefijos
+    de ella, su máscara ya incluye sus intenciones. La búsqueda sigue desde el carácter
+    siguiente, así que también se encuentran palabras que se solapan.
+    """
+
+    def __init__(self, intents: Dict[str, Iterable[str]]):
+        self.intents = list(intents)
+        # Máscara de bits de intenciones por palabra clave (ya sin acentos)
+        masks = {}
+        for bit, intent in enumerate(self.intents):
+            for keyword in intents[intent]:
+                keyword = fold_text(keyword)
+                if keyword:
+                    masks[keyword] = masks.get(keyword, 0) | (1 << bit)
+
+        for keyword in masks:
+            for prefix_end in range(1, len(keyword)):
+                masks[keyword] |= masks.get(keyword[:prefix_end], 0)
+        self._masks = masks
+
+        alternatives = '|'.join(re.escape(keyword) for keyword in sorted(masks, key=len, reverse=True))
+        self._pattern = re.compile(alternatives) if masks else None
+
+    def match_mask(self, text: str) -> int:
+        """Máscara de bits (según el orden de self.intents) de las intenciones del texto"""
+        if self._pattern is None:
+            return 0
+        text = fold_text(text)
+        search = self._pattern.search
+        mask = 0
+        match = search(text)
+        while match is not None:
+            mask |= self._masks[match.group()]
+            match = search(text, match.start() + 1)
+        return mask
+
+    def classify(self, text: str) -> List[str]:
+        """Todas las intenciones presentes en el texto, en orden de prioridad"""
+        mask = self.match_mask(text)
+        return [intent for bit, intent in enumerate(self.intents) if mask >> bit & 1]
+
+    def first(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        """Intención de mayor prioridad presente en el texto, o default"""
+        mask = self.match_mask(text)
+        if not mask:
+            return default
+        return self.intents[(mask & -mask).bit_length() - 1]
+
+
+def topic_classifier(topics: Iterable[str]) -> IntentClassifier:
+    """Clasificador de tópicos cuyas palabras clave son las partes del nombre ('tipos_diabetes')"""
+    return IntentClassifier({topic: topic.split('_') for topic in topics})
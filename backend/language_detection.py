@@ -0,0 +1,59 @@
+"""
+Detección barata del idioma de un texto (español / inglés)
+Cuenta palabras funcionales de cada idioma sobre la clave normalizada y suma
+las marcas propias del español (acentos, ñ, ¿, ¡). Se usa una vez por fila al
+ingerir el corpus (clave de partición) y una vez por consulta al buscar.
+"""
+
+import re
+from typing import Optional
+
+from text_normalization import normalize_text
+
+# Orden de las particiones por idioma dentro del corpus: 'unknown' queda en medio
+# para que "idioma detectado + desconocido" sea siempre un rango contiguo de filas
+LANGUAGES = ('es', 'unknown', 'en')
+LANGUAGE_CODES = {language: code for code, language in enumerate(LANGUAGES)}
+
+_SPANISH_MARKS = re.compile(r'[áéíóúñü¿¡]')
+
+# Palabras funcionales frecuentes y exclusivas de cada idioma, ya sin acentos
+_SPANISH_WORDS = frozenset("""
+    el la los las del al un una unos unas es son esta estan este esto que de en y o
+    por para con sin como cual cuales cuando donde porque pero mas muy tengo tiene
+    puedo puede debo debe hay mi mis su sus se lo le les nos yo usted ser estar
+    azucar sangre nivel niveles dieta comer comida dolor tipo insulina glucosa
+""".split())
+_ENGLISH_WORDS = frozenset("""
+    the an is are was were be been this that these those what which who whom how
+    why when where of in on at to for with without from by and or but not do does
+    did can could should would will my your his her their our i you he she it we
+    they have has had blood sugar level levels diet eat food pain type glucose
+""".split())
+
+
+def detect_language(text: str, key: Optional[str] = None) -> str:
+    """
+    Idioma ('es', 'en' o 'unknown') de un texto. key es su clave normalizada,
+    si ya se calculó; si no, se calcula aquí (sin quitar palabras vacías).
+    """
+    tokens = (normalize_text(text, remove_stopwords=False) if key is None else key).split()
+    spanish = sum(token in _SPANISH_WORDS for token in tokens)
+    english = sum(token in _ENGLISH_WORDS for token in tokens)
+    spanish += 2 * len(_SPANISH_MARKS.findall(str(text).lower()))
+
+    if spanish > english:
+        return 'es'
+    if english > spanish:
+        return 'en'
+    return 'unknown'
+
+
+def resolve_language(query: str, language: Optional[str] = None) -> str:
+    """
+    Partición a consultar: 'es', 'en' o 'all'. language fija el idioma ('es', 'en'
+    o 'all'); con None se detecta y, si no se reconoce, se busca en todo el corpus.
+    """
+    if language is None:
+        language = detect_language(query)
+    return language if language in ('es', 'en') else 'all'
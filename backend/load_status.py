@@ -0,0 +1,91 @@
+"""
+Estado de carga de los subsistemas que se inicializan en segundo plano
+(corpus integrado, base de conocimiento), consultado por /ready
+"""
+
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+ERROR = 'error'
+
+
+class LoadStatus:
+    """Estado, etapa y progreso de una carga; seguro entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        # Se activa al terminar, con éxito o con error
+        self._done = threading.Event()
+        self.state = PENDING
+        self.progress: Dict = {}
+        self.error: Optional[str] = None
+        self._started_at = None
+        self._finished_at = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self, **progress):
+        with self._lock:
+            self._ready.clear()
+            self._done.clear()
+            self.state = LOADING
+            self.progress = dict(progress)
+            self.error = None
+            self._started_at = time.time()
+            self._finished_at = None
+
+    def update(self, **progress):
+        """Actualiza etapa y contadores (por ejemplo stage='index', files_loaded=3)"""
+        with self._lock:
+            self.progress.update(progress)
+
+    def finish(self, **progress):
+        with self._lock:
+            self.progress.update(progress)
+            self.progress['stage'] = 'done'
+            self.state = READY
+            self._finished_at = time.time()
+        self._ready.set()
+        self._done.set()
+
+    def fail(self, error: Exception):
+        with self._lock:
+            self.state = ERROR
+            self.error = str(error)
+            self._finished_at = time.time()
+        self._done.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Bloquea hasta que la carga termine; True solo si terminó con éxito"""
+        self._done.wait(timeout)
+        return self.is_ready
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            end = self._finished_at or time.time()
+            return {
+                'state': self.state,
+                'progress': dict(self.progress),
+                'error': self.error,
+                'elapsed_seconds': round(end - self._started_at, 2) if self._started_at else None
+            }
+
+
+def run_in_background(name: str, target: Callable) -> threading.Thread:
+    """Ejecuta target en un hilo daemon; los errores se informan sin detener el servidor"""
+    def runner():
+        try:
+            target()
+        except Exception as e:
+            print(f"[ERROR] Falló la carga en segundo plano de {name}: {e}")
+
+    thread = threading.Thread(target=runner, name=f"load-{name}", daemon=True)
+    thread.start()
+    return thread
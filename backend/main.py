@@ -1,13 +1,20 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List
 import os
 import sys
+import hmac
+import json
 from train_model import DiabetesInsulinPredictor
 from nlp_parser import NaturalLanguageProcessor
 from database import db
 from rag_system import rag_system
-from qa_system import knowledge_base
+from qa_system import knowledge_base, CORPUS_AVAILABLE
+from load_status import run_in_background
+from corpus_snapshot import artifact_settings
+from intent_classifier import IntentClassifier
 
 app = FastAPI()
 
@@ -27,13 +34,18 @@ print("="*60)
 
 insulin_model = DiabetesInsulinPredictor()
 
+# Con CORPUS_ARTIFACTS_ONLY=1 el servidor solo abre artefactos ya construidos y no lee CSV
+ARTIFACTS_ONLY = artifact_settings()[2]
+
 # Intentar cargar modelo entrenado
-if not insulin_model.load_model('models'):
+if insulin_model.load_model('models'):
+    print("[OK] Modelo cargado correctamente")
+elif ARTIFACTS_ONLY:
+    print("\n[WARN] Modelo no encontrado; en modo solo artefactos no se entrena desde los CSV")
+else:
     print("\n[WARN] Modelo no encontrado, entrenando nuevo modelo...")
     insulin_model.train()
     insulin_model.save_model()
-else:
-    print("[OK] Modelo cargado correctamente")
 
 print("[OK] Base de datos inicializada")
 print("\n[OK] Backend listo en http://localhost:5000")
@@ -56,6 +68,15 @@ class NLPRequest(BaseModel):
     description: str
     patient_name: str = None
     patient_age: int = None
+    # Idioma del corpus a consultar en /ask: 'es', 'en' o 'all' (por defecto se detecta)
+    language: str = None
+    # Tiempo máximo de búsqueda en /ask en milisegundos (por defecto QA_DEADLINE_MS; 0 = sin límite)
+    deadline_ms: float = None
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str]
+    # Idioma del corpus para todas las preguntas: 'es', 'en' o 'all' (por defecto se detecta en cada una)
+    language: str = None
 
 class PatientRequest(BaseModel):
     name: str
@@ -233,6 +254,44 @@ def parse_combined(request: NLPRequest):
             "message": "Error al procesar información"
         }
 
+# Tipos de pregunta de /ask con sus palabras clave, en orden de prioridad
+QUESTION_TYPES = IntentClassifier({
+    "síntomas": ['síntoma', 'señal', 'signo', 'complicación'],
+    "alimentación": ['comida', 'alimento', 'comer', 'puedo', 'nutrición'],
+    "ejercicio": ['ejercicio', 'deporte', 'actividad', 'física', 'entrenar'],
+    "medicamentos": ['medicamento', 'insulina', 'droga', 'fármaco'],
+    "monitoreo": ['glucosa', 'azúcar', 'monitoreo', 'medición'],
+    "tipos": ['tipo', 'tipo1', 'tipo2', 'gestacional', 'prediabetes']
+})
+
+def _ask_response(query: str, result: dict) -> dict:
+    """Respuesta de /ask (y de cada línea de /ask/batch) para el resultado de search_answer"""
+    # Determinar el tipo de pregunta
+    question_type = QUESTION_TYPES.first(query, default="general")
+    
+    # Obtener tópicos relacionados para sugerencias
+    related_topics = knowledge_base.get_related_topics(query)
+    
+    return {
+        "success": True,
+        "question": query,
+        "question_type": question_type,
+        "answer": result['answer'],
+        "confidence": float(result['confidence']),
+        "source": result['source'],
+        "language": result.get('language'),
+        "related_topics": related_topics[:3],
+        "pruning": result.get('pruning', {}),
+        "strategies": result.get('strategies'),
+        "timed_out": result.get('timed_out', False),
+        "cached": result.get('cached', False),
+        "corpus_loading": result.get('loading', False),
+        "message": (
+            "Corpus médico aún cargando: respuesta basada en conocimiento local"
+            if result.get('loading') else "Respuesta basada en base de datos médica"
+        )
+    }
+
 @app.post("/ask")
 def ask_question(request: NLPRequest):
     """
@@ -251,36 +310,10 @@ def ask_question(request: NLPRequest):
         query = request.description
         
         # Buscar respuesta en knowledge base
-        result = knowledge_base.search_answer(query, threshold=0.35)
-        
-        # Determinar el tipo de pregunta
-        question_type = "general"
-        if any(word in query.lower() for word in ['síntoma', 'señal', 'signo', 'complicación']):
-            question_type = "síntomas"
-        elif any(word in query.lower() for word in ['comida', 'alimento', 'comer', 'puedo', 'nutrición']):
-            question_type = "alimentación"
-        elif any(word in query.lower() for word in ['ejercicio', 'deporte', 'actividad', 'física', 'entrenar']):
-            question_type = "ejercicio"
-        elif any(word in query.lower() for word in ['medicamento', 'insulina', 'droga', 'fármaco']):
-            question_type = "medicamentos"
-        elif any(word in query.lower() for word in ['glucosa', 'azúcar', 'monitoreo', 'medición']):
-            question_type = "monitoreo"
-        elif any(word in query.lower() for word in ['tipo', 'tipo1', 'tipo2', 'gestacional', 'prediabetes']):
-            question_type = "tipos"
-        
-        # Obtener tópicos relacionados para sugerencias
-        related_topics = knowledge_base.get_related_topics(query)
+        result = knowledge_base.search_answer(query, threshold=0.35, language=request.language,
+                                              deadline_ms=request.deadline_ms)
         
-        return {
-            "success": True,
-            "question": query,
-            "question_type": question_type,
-            "answer": result['answer'],
-            "confidence": float(result['confidence']),
-            "source": result['source'],
-            "related_topics": related_topics[:3],
-            "message": "Respuesta basada en base de datos médica"
-        }
+        return _ask_response(query, result)
     except Exception as e:
         return {
             "success": False,
@@ -288,6 +321,29 @@ def ask_question(request: NLPRequest):
             "message": "Error al procesar pregunta"
         }
 
+@app.post("/ask/batch")
+def ask_questions_batch(request: BatchQuestionRequest):
+    """
+    Responde muchas preguntas en una sola llamada (p. ej. trabajos nocturnos que arman
+    respuestas predefinidas). La búsqueda en el corpus se puntúa junta para cada bloque
+    de preguntas; las respuestas se envían como NDJSON (una línea JSON por pregunta, con
+    su índice) en el orden de entrada, a medida que se calculan.
+    """
+    def lines():
+        try:
+            answers = knowledge_base.search_answer_batch(request.questions, threshold=0.35,
+                                                         language=request.language)
+            for index, (query, result) in enumerate(zip(request.questions, answers)):
+                yield json.dumps(dict(_ask_response(query, result), index=index), ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({
+                "success": False,
+                "error": str(e),
+                "message": "Error al procesar preguntas"
+            }, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/diabetes-topics")
 def get_available_topics():
     """
@@ -306,18 +362,33 @@ def get_corpus_statistics():
     """
     Retorna estadísticas del corpus integrado
     """
+    if not CORPUS_AVAILABLE:
+        return {"success": False, "message": "Corpus integrado no disponible"}
+    
     try:
         from corpus_integration import integrated_corpus
         
+        # Estadísticas precalculadas al armar el corpus: no se recorren las filas por consulta
         stats = integrated_corpus.get_statistics()
-        breakdown = integrated_corpus.get_source_breakdown()
+        corpus_stats = stats['statistics']
         
         return {
             "success": True,
             "corpus_total": stats['total_records'],
-            "sources": breakdown,
+            "sources": corpus_stats.get('sources', {}),
             "unique_sources": stats['unique_sources'],
             "loaded_files": stats['loaded_files'],
+            "lengths": corpus_stats.get('lengths'),
+            "vocabulary": corpus_stats.get('vocabulary'),
+            "deduplication": corpus_stats.get('deduplication'),
+            "indexes": corpus_stats.get('indexes'),
+            "language_partitions": stats['language_partitions'],
+            "tiers": stats['tiers'],
+            "storage": stats['storage'],
+            "query_cache": {
+                "corpus_search": stats['query_cache'],
+                "answers": knowledge_base.answer_cache.get_statistics()
+            },
             "message": f"Corpus integrado con {stats['total_records']:,} registros de {stats['unique_sources']} fuentes"
         }
     except Exception as e:
@@ -340,6 +411,76 @@ def read_root():
 def health_check():
     return {"status": "ok", "model_trained": insulin_model.is_trained}
 
+@app.get("/ready")
+def readiness_check():
+    """
+    Progreso de carga de cada subsistema.
+    'ready' indica que el modelo está listo para recibir tráfico (/predict, /ask con
+    conocimiento local); 'fully_loaded' que además terminaron de cargar los corpus.
+    """
+    subsystems = {
+        "insulin_model": {"state": "ready" if insulin_model.is_trained else "error"}
+    }
+    # La base de conocimiento consulta el corpus integrado: su carga es la del corpus
+    if CORPUS_AVAILABLE:
+        from corpus_integration import integrated_corpus
+        subsystems["corpus"] = integrated_corpus.load_status.as_dict()
+    
+    return {
+        "ready": insulin_model.is_trained,
+        "fully_loaded": all(info["state"] == "ready" for info in subsystems.values()),
+        "subsystems": subsystems
+    }
+
+def _require_admin(token: str):
+    """
+    Los endpoints /admin exigen el encabezado X-Admin-Token igual a ADMIN_TOKEN;
+    sin ADMIN_TOKEN definido quedan deshabilitados
+    """
+    expected = os.environ.get('ADMIN_TOKEN')
+    if not expected:
+        raise HTTPException(status_code=403, detail="Endpoints de administración deshabilitados: defina ADMIN_TOKEN")
+    if not hmac.compare_digest(token or '', expected):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+@app.post("/admin/corpus/refresh")
+def refresh_corpus(wait: bool = False, x_admin_token: str = Header(None)):
+    """
+    Recarga incremental del corpus: solo se vuelven a ingerir e indexar las fuentes
+    cuyos CSV cambiaron (tamaño, fecha o contenido). El corpus nuevo reemplaza al
+    anterior de forma atómica, sin interrumpir las búsquedas en curso.
+    Con wait=false la recarga corre en segundo plano (progreso en GET /admin/corpus/refresh).
+    """
+    _require_admin(x_admin_token)
+    if not CORPUS_AVAILABLE:
+        return {"success": False, "message": "Corpus integrado no disponible"}
+    
+    from corpus_integration import integrated_corpus
+    if wait:
+        return integrated_corpus.refresh_changed_sources()
+    
+    run_in_background('corpus-refresh', integrated_corpus.refresh_changed_sources)
+    return {
+        "success": True,
+        "started": True,
+        "message": "Recarga del corpus iniciada en segundo plano"
+    }
+
+@app.get("/admin/corpus/refresh")
+def refresh_corpus_status(x_admin_token: str = Header(None)):
+    """Progreso de la recarga en curso y resultado de la última recarga"""
+    _require_admin(x_admin_token)
+    if not CORPUS_AVAILABLE:
+        return {"success": False, "message": "Corpus integrado no disponible"}
+    
+    from corpus_integration import integrated_corpus
+    return {
+        "success": True,
+        "status": integrated_corpus.refresh_status.as_dict(),
+        "last_result": integrated_corpus.last_refresh,
+        "source_fingerprints": integrated_corpus.source_fingerprints
+    }
+
 @app.post("/predict")
 def predict_insulin(data: InsulinRequest):
     """
@@ -397,19 +538,14 @@ def predict_insulin(data: InsulinRequest):
             "message": "Error al realizar la predicción"
         }
 
-@app.post("/chat")
-def chat(request: MessageRequest):
-    """Endpoint para interactuar con el chatbot"""
-    message = request.message.lower()
-    user_data = request.user_data or {}
-    
-    # Respuestas del chatbot mejoradas
-    responses = {
-        "hola": "¡Hola! Soy tu asistente de diabetes impulsado por IA. Puedo ayudarte a predecir tu dosis de insulina basándome en tus hábitos. ¿Qué necesitas?",
-        "ejercicio": "El ejercicio es crucial para el manejo de la diabetes. Reduce la necesidad de insulina. ¿Cuántos minutos de ejercicio hiciste hoy?",
-        "comida": "La alimentación es fundamental. Necesito saber carbohidratos, proteína y grasas. ¿Cuánto consumiste?",
-        "glucosa": "El nivel de glucosa es crítico. ¿Cuál es tu glucosa en sangre actual? (en mg/dl)",
-        "ayuda": """Puedo ayudarte con:
+# Respuestas del chatbot mejoradas: la primera palabra clave (en este orden) que
+# aparece en el mensaje elige la respuesta
+CHAT_RESPONSES = {
+    "hola": "¡Hola! Soy tu asistente de diabetes impulsado por IA. Puedo ayudarte a predecir tu dosis de insulina basándome en tus hábitos. ¿Qué necesitas?",
+    "ejercicio": "El ejercicio es crucial para el manejo de la diabetes. Reduce la necesidad de insulina. ¿Cuántos minutos de ejercicio hiciste hoy?",
+    "comida": "La alimentación es fundamental. Necesito saber carbohidratos, proteína y grasas. ¿Cuánto consumiste?",
+    "glucosa": "El nivel de glucosa es crítico. ¿Cuál es tu glucosa en sangre actual? (en mg/dl)",
+    "ayuda": """Puedo ayudarte con:
 1. Predicción de dosis de insulina
 2. Información sobre gestión de diabetes
 3. Consejos de alimentación y ejercicio
@@ -420,17 +556,21 @@ Para predecir dosis necesito:
 - Gramos de proteína
 - Gramos de grasas
 - Glucosa en sangre (mg/dl)""",
-        "diabetes": "La diabetes es una condición que requiere gestión cuidadosa. Factores importantes: glucosa, insulina, ejercicio, dieta y medicamentos.",
-        "insulina": "La insulina es esencial para regular glucosa. Tu dosis depende de: carbohidratos, glucosa, ejercicio y otros factores.",
-        "default": "No entendí bien. Escribe 'ayuda' para ver opciones disponibles o cuéntame tu situación para ayudarte."
-    }
+    "diabetes": "La diabetes es una condición que requiere gestión cuidadosa. Factores importantes: glucosa, insulina, ejercicio, dieta y medicamentos.",
+    "insulina": "La insulina es esencial para regular glucosa. Tu dosis depende de: carbohidratos, glucosa, ejercicio y otros factores.",
+    "default": "No entendí bien. Escribe 'ayuda' para ver opciones disponibles o cuéntame tu situación para ayudarte."
+}
+
+CHAT_INTENTS = IntentClassifier({key: [key] for key in CHAT_RESPONSES if key != "default"})
+
+@app.post("/chat")
+def chat(request: MessageRequest):
+    """Endpoint para interactuar con el chatbot"""
+    user_data = request.user_data or {}
     
     # Buscar coincidencia
-    for key, response in responses.items():
-        if key in message and key != "default":
-            return {"message": response}
-    
-    return {"message": responses["default"]}
+    intent = CHAT_INTENTS.first(request.message, default="default")
+    return {"message": CHAT_RESPONSES[intent]}
 
 # ===== ENDPOINTS RAG (RETRIEVAL-AUGMENTED GENERATION) =====
 
@@ -0,0 +1,65 @@
+"""
+Medición de memoria del proceso (RSS y memoria privada)
+Usa psutil si está instalado; si no, /proc (Linux) o el módulo resource (Unix)
+"""
+
+import os
+import sys
+from typing import Optional
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+def current_rss() -> Optional[int]:
+    """RSS actual del proceso en bytes; None si no se puede medir"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def private_memory() -> Optional[int]:
+    """
+    Bytes que solo usa este proceso (USS): excluye las páginas compartidas con otros,
+    como los snapshots mapeados por varios workers. None si no se puede medir.
+    """
+    if PSUTIL_AVAILABLE:
+        try:
+            return psutil.Process().memory_full_info().uss
+        except (psutil.Error, AttributeError):
+            pass
+    try:
+        total = 0
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    total += int(line.split()[1]) * 1024
+        return total
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    """Pico de RSS del proceso desde que arrancó, en bytes"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        if PSUTIL_AVAILABLE:
+            info = psutil.Process().memory_info()
+            return getattr(info, 'peak_wset', info.rss)
+        return None
+
+
+def to_mb(value: Optional[int]) -> Optional[float]:
+    """Bytes a MB redondeados, conservando None"""
+    return round(value / (1024 * 1024), 1) if value is not None else None
@@ -3,15 +3,22 @@ Módulo QA (Question Answering) mejorado para preguntas sobre diabetes
 Integra múltiples corpus médicos y proporciona respuestas de alta calidad
 """
 
-import pandas as pd
 import os
-from typing import List, Dict, Tuple
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from difflib import SequenceMatcher
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+from query_cache import QueryCache, normalize_query
+from language_detection import resolve_language
+from sequence_cascade import SearchInterrupted
+from text_normalization import normalize_text
+from intent_classifier import topic_classifier
 
 # Importar corpus integrado
 try:
     from corpus_integration import integrated_corpus
-    CORPUS_AVAILABLE = True
+    CORPUS_AVAILABLE = integrated_corpus is not None
 except Exception as e:
     print(f"[WARN] No se pudo cargar corpus integrado: {e}")
     CORPUS_AVAILABLE = False
@@ -213,135 +220,379 @@ class DiabetesKnowledgeBase:
         }
     }
     
-    def __init__(self):
-        self.general_data = None
-        self.medical_data = None
-        self.load_data()
+    # Palabras clave de cada tópico (las partes de su nombre), compiladas una sola vez
+    TOPICS = topic_classifier(DIABETES_KNOWLEDGE)
+    
+    # Estrategias de similitud sobre una sola fuente del corpus integrado (2 y 4) y la
+    # fuente que recorre cada una; el nombre de la estrategia es el origen de la respuesta
+    KNOWLEDGE_SOURCES = {
+        'general_csv': 'general',
+        'medical_csv': 'medical'
+    }
+    
+    # Fuente cuyas etiquetas revisa la estrategia 3
+    TAG_SOURCE = 'general'
+    
+    # Estrategias sobre el corpus, en orden de prioridad: solo se aplican si el mejor
+    # puntaje hasta el momento está por debajo de su límite, y las marcadas con True
+    # solo reemplazan al mejor si lo superan
+    STRATEGIES = {
+        'corpus': (0.8, False),
+        'general_csv': (0.8, True),
+        'tags': (0.6, False),
+        'medical_csv': (0.7, True)
+    }
+    
+    def __init__(self, corpus=None, deadline_ms: float = None, strategy_workers: int = None):
+        # Almacén compartido: data_general.csv y data_medical.csv ya están en el corpus
+        # integrado, así que se consultan ahí filtrando por fuente en lugar de cargarlos otra vez
+        self.corpus = corpus if corpus is not None else (integrated_corpus if CORPUS_AVAILABLE else None)
+        # Respuestas de search_answer; se vacía cuando el corpus integrado se recarga
+        self.answer_cache = QueryCache()
+        self._cached_corpus_version = None
+        # Presupuesto por defecto de search_answer en milisegundos: las estrategias sobre el
+        # corpus corren en paralelo y se responde con lo que haya al vencer (0 = en serie, sin límite)
+        if deadline_ms is None:
+            deadline_ms = float(os.environ.get('QA_DEADLINE_MS', '2000'))
+        self.deadline_ms = deadline_ms
+        # Hilos compartidos por todas las consultas para correr las estrategias en paralelo
+        if strategy_workers is None:
+            strategy_workers = int(os.environ.get('QA_STRATEGY_WORKERS', '8'))
+        self._strategy_pool = ThreadPoolExecutor(max_workers=strategy_workers, thread_name_prefix='qa-strategy')
+    
+    def search_answer(self, query: str, threshold: float = 0.4, language: str = None,
+                      deadline_ms: float = None) -> Dict:
+        """
+        Busca respuesta completa a una pregunta sobre diabetes.
+        En el corpus integrado solo se busca en la partición del idioma de la consulta;
+        language ('es', 'en' o 'all') reemplaza al idioma detectado.
+        deadline_ms (por defecto, el del servidor) limita el tiempo de búsqueda: al vencer
+        se responde con la mejor respuesta de las estrategias que terminaron; 'strategies'
+        indica cuáles terminaron y cuáles quedaron pendientes.
+        Las respuestas se guardan en caché por consulta normalizada, threshold e idioma;
+        'cached' indica si la respuesta salió de la caché y 'loading' si todavía
+        se están cargando los datos (solo responde la base de conocimiento local).
+        """
+        query = normalize_query(query)
+        language = resolve_language(query, language)
+        deadline_ms = self.deadline_ms if deadline_ms is None else deadline_ms
+        if not self.is_ready():
+            # Respuestas parciales: no se guardan en caché
+            result = self._search_answer(query, threshold, language, deadline_ms)
+            result.update({'cached': False, 'loading': True, 'language': language})
+            return result
         
-    def load_data(self):
-        """Carga los CSV de datos médicos"""
-        data_dir = 'data'
+        corpus_version = self.corpus.corpus_version if self.corpus is not None else None
+        if corpus_version != self._cached_corpus_version:
+            self.answer_cache.clear()
+            self._cached_corpus_version = corpus_version
         
-        try:
-            general_path = os.path.join(data_dir, 'data_general.csv')
-            if os.path.exists(general_path):
-                self.general_data = pd.read_csv(general_path)
-                print(f"[OK] Datos generales cargados: {len(self.general_data)} registros")
-            
-            medical_path = os.path.join(data_dir, 'data_medical.csv')
-            if os.path.exists(medical_path):
-                self.medical_data = pd.read_csv(medical_path)
-                print(f"[OK] Datos médicos cargados: {len(self.medical_data)} registros")
-        except Exception as e:
-            print(f"[WARN] Error cargando datos: {e}")
+        found, result = self.answer_cache.get((query, threshold, language))
+        if not found:
+            result = self._search_answer(query, threshold, language, deadline_ms)
+            # Una respuesta cortada por el plazo puede mejorar con más tiempo: no se guarda
+            if not result.get('timed_out'):
+                self.answer_cache.put((query, threshold, language), result)
+        result.update({'cached': found, 'loading': False, 'language': language})
+        return result
+    
+    # Preguntas por bloque en search_answer_batch
+    BATCH_CHUNK = 64
     
-    def search_answer(self, query: str, threshold: float = 0.4) -> Dict:
-        """Busca respuesta completa a una pregunta sobre diabetes"""
-        query_lower = query.lower()
-        best_answer = None
-        best_source = 'unknown'
-        best_score = 0.0
+    def search_answer_batch(self, queries: List[str], threshold: float = 0.4,
+                            language: str = None) -> Iterator[Dict]:
+        """
+        search_answer para muchas preguntas (sin plazo), entregadas en el orden de entrada
+        a medida que termina cada bloque de BATCH_CHUNK preguntas. La estrategia del corpus
+        de todo el bloque es una sola búsqueda vectorizada (CorpusIntegration.search_batch);
+        las demás solo corren para las preguntas que todavía las necesitan. Las respuestas
+        son las mismas que las de search_answer en serie y comparten su caché.
+        """
+        for start in range(0, len(queries), self.BATCH_CHUNK):
+            yield from self._search_answer_chunk(queries[start:start + self.BATCH_CHUNK], threshold, language)
+    
+    def _search_answer_chunk(self, queries: List[str], threshold: float, language: str = None) -> List[Dict]:
+        """Un bloque de search_answer_batch"""
+        queries = [normalize_query(query) for query in queries]
+        languages = [resolve_language(query, language) for query in queries]
+        ready = self.is_ready()
+        if ready:
+            corpus_version = self.corpus.corpus_version if self.corpus is not None else None
+            if corpus_version != self._cached_corpus_version:
+                self.answer_cache.clear()
+                self._cached_corpus_version = corpus_version
         
-        # Estrategia 0: Detectar tipo de pregunta en base de conocimiento local
-        for topic, info in self.DIABETES_KNOWLEDGE.items():
-            keywords = topic.split('_')
-            if any(keyword in query_lower for keyword in keywords):
-                best_answer = self._format_answer(info)
-                best_source = 'builtin_local'
-                best_score = 0.95
-                break
+        results = [None] * len(queries)
+        misses = []
+        for position, (query, query_language) in enumerate(zip(queries, languages)):
+            found, result = self.answer_cache.get((query, threshold, query_language)) if ready else (False, None)
+            if found:
+                results[position] = dict(result, cached=True)
+            else:
+                misses.append(position)
         
-        if best_answer and best_source == 'builtin_local':
+        # Estrategia 1 para todo el bloque (las respondidas por la base local no la usan)
+        corpus_results = {}
+        if misses and self.corpus is not None and self.corpus.load_status.is_ready:
+            pending = [position for position in misses if not self._is_builtin(queries[position])]
+            batch = self.corpus.search_batch([queries[position] for position in pending], threshold=threshold,
+                                             top_k=3, languages=[languages[position] for position in pending])
+            corpus_results = dict(zip(pending, batch))
+        
+        for position in misses:
+            query, query_language = queries[position], languages[position]
+            outcomes = (
+                {'corpus': self._corpus_outcome(query, corpus_results[position])} if position in corpus_results else None
+            )
+            result = self._search_answer(query, threshold, query_language, outcomes=outcomes)
+            if ready:
+                self.answer_cache.put((query, threshold, query_language), result)
+            results[position] = dict(result, cached=False)
+        
+        for result, query_language in zip(results, languages):
+            result.update({'loading': not ready, 'language': query_language})
+        return results
+    
+    def _is_builtin(self, query: str) -> bool:
+        """True si la estrategia 0 (base de conocimiento local) responde la consulta"""
+        return self.TOPICS.match_mask(query) != 0
+    
+    def is_ready(self) -> bool:
+        """True cuando el corpus integrado (si existe) terminó de cargar"""
+        return self.corpus is None or self.corpus.load_status.is_ready
+    
+    def _search_answer(self, query: str, threshold: float, language: str = 'all',
+                       deadline_ms: float = 0, outcomes: Dict[str, Optional[Dict]] = None) -> Dict:
+        """
+        Estrategias de búsqueda de search_answer (sin caché). La base local va primero;
+        las estrategias sobre el corpus corren en serie o, con deadline_ms > 0, en paralelo
+        hasta que vence el plazo. Con todas terminadas la respuesta es la misma en ambos modos.
+        outcomes trae resultados ya calculados de algunas estrategias (en serie, no se repiten).
+        """
+        # Estrategia 0: Detectar tipo de pregunta en base de conocimiento local
+        topic = self.TOPICS.first(query)
+        if topic is not None:
             return {
                 'found': True,
-                'answer': best_answer,
-                'confidence': best_score,
-                'source': best_source,
+                'answer': self._format_answer(self.DIABETES_KNOWLEDGE[topic]),
+                'confidence': 0.95,
+                'source': 'builtin_local',
                 'question_type': 'diabetes'
             }
         
-        # Estrategia 1: Buscar en corpus integrado
-        if CORPUS_AVAILABLE and best_score < 0.8:
-            corpus_results = integrated_corpus.search(query, threshold=threshold, top_k=3)
-            
-            if corpus_results:
-                best_result = corpus_results[0]
-                best_answer = best_result['answer']
-                best_source = f"corpus_{best_result['source']}"
-                best_score = best_result['similarity']
+        # Filas descartadas por cada etapa de la cascada en las estrategias por similitud
+        pruning = {}
+        strategies = {'completed': [], 'pending': [], 'skipped': [], 'failed': []}
+        timed_out = False
+        best = None
+        
+        # Las estrategias 1 a 4 consultan el corpus integrado, disponible al terminar la carga
+        if self.corpus is not None and self.corpus.load_status.is_ready:
+            started = time.perf_counter()
+            if deadline_ms > 0:
+                outcomes, timed_out = self._run_concurrently(query, threshold, language, deadline_ms,
+                                                             pruning, strategies)
+            else:
+                outcomes = self._run_serially(query, threshold, language, pruning, strategies, outcomes)
+            best = self._best_outcome(outcomes, threshold)
+            strategies.update({
+                'deadline_ms': deadline_ms or None,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+            })
+        
+        # Respuesta por defecto si no encuentra nada
+        if best is None:
+            best = {
+                'answer': (
+                    'No tengo información específica sobre eso. '
+                    'Por favor, consulta con tu médico o endocrinólogo para una respuesta más precisa. '
+                    'Puedo ayudarte con preguntas sobre síntomas, alimentos, ejercicio, medicamentos, etc.'
+                ),
+                'score': 0.3,
+                'source': 'default'
+            }
         
-        # Estrategia 2: Búsqueda en datos generales por similitud
-        if self.general_data is not None and best_score < 0.8:
-            for idx, row in self.general_data.iterrows():
+        return {
+            'found': True,
+            'answer': best['answer'],
+            'confidence': round(best['score'], 2),
+            'source': best['source'],
+            'question_type': 'diabetes',
+            'pruning': pruning,
+            'strategies': strategies,
+            'timed_out': timed_out
+        }
+    
+    def _run_serially(self, query: str, threshold: float, language: str, pruning: Dict, strategies: Dict,
+                      outcomes: Dict[str, Optional[Dict]] = None) -> Dict[str, Optional[Dict]]:
+        """Corre cada estrategia solo si todavía puede cambiar la respuesta, subiendo el corte"""
+        outcomes = dict(outcomes or {})
+        for name, (limit, _) in self.STRATEGIES.items():
+            if name in outcomes:
+                strategies['completed'].append(name)
+                continue
+            best = self._best_outcome(outcomes, threshold)
+            best_score = best['score'] if best else 0.0
+            if best_score >= limit:
+                strategies['skipped'].append(name)
+                continue
+            stats = {}
+            outcomes[name] = self._run_strategy(name, query, max(best_score, threshold), language, stats)
+            if stats:
+                pruning[name] = stats
+            strategies['completed'].append(name)
+        return outcomes
+    
+    def _run_concurrently(self, query: str, threshold: float, language: str, deadline_ms: float,
+                          pruning: Dict, strategies: Dict) -> Tuple[Dict[str, Optional[Dict]], bool]:
+        """
+        Corre todas las estrategias en el pool y retorna (resultados de las que terminaron,
+        si venció el plazo). Se deja de esperar en cuanto las pendientes ya no pueden cambiar
+        la respuesta; las que quedan se interrumpen entre filas.
+        """
+        deadline = time.monotonic() + deadline_ms / 1000
+        abandoned = threading.Event()
+        
+        def should_stop() -> bool:
+            return abandoned.is_set() or time.monotonic() > deadline
+        
+        stats = {name: {} for name in self.STRATEGIES}
+        futures = {
+            self._strategy_pool.submit(self._run_strategy, name, query, threshold, language,
+                                       stats[name], should_stop): name
+            for name in self.STRATEGIES
+        }
+        outcomes = {}
+        # Las que no terminaron: siguen en el pool o se interrumpieron por el plazo
+        unfinished = set()
+        pending = set(futures)
+        while pending and not self._is_decided(outcomes, threshold):
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                name = futures[future]
                 try:
-                    question = str(row.get('short_question', '')).lower()
-                    if not question:
-                        continue
-                    
-                    similarity = SequenceMatcher(None, query_lower, question).ratio()
-                    
-                    if similarity > best_score and similarity > threshold:
-                        best_score = similarity
-                        best_answer = row.get('short_answer', '')
-                        best_source = 'general_csv'
-                except:
-                    pass
+                    outcomes[name] = future.result()
+                except SearchInterrupted:
+                    unfinished.add(name)
+                    continue
+                except Exception as e:
+                    print(f"[WARN] Estrategia {name} falló: {e}")
+                    strategies['failed'].append(name)
+                    continue
+                if stats[name]:
+                    pruning[name] = stats[name]
+        
+        # Las que siguen corriendo se abandonan en la próxima fila que revisen
+        abandoned.set()
+        unfinished.update(futures[future] for future in pending)
+        decided = self._is_decided(outcomes, threshold)
+        for name in self.STRATEGIES:
+            if name in outcomes:
+                strategies['completed'].append(name)
+            elif name in unfinished:
+                strategies['skipped' if decided else 'pending'].append(name)
+        return outcomes, bool(unfinished) and not decided
+    
+    def _run_strategy(self, name: str, query: str, threshold: float, language: str, stats: Dict,
+                      should_stop: Callable[[], bool] = None) -> Optional[Dict]:
+        """Una estrategia sobre el corpus: {'answer', 'score', 'source'} o None si no encontró nada"""
+        if name == 'corpus':
+            # Estrategia 1: Buscar en corpus integrado
+            return self._corpus_outcome(
+                query, self.corpus.search(query, threshold=threshold, top_k=3, stats=stats, language=language)
+            )
+        
+        elif name in self.KNOWLEDGE_SOURCES:
+            # Estrategias 2 y 4: Similitud con las preguntas de los datos generales o médicos
+            match = self.corpus.best_match(query, threshold, sources=[self.KNOWLEDGE_SOURCES[name]],
+                                           stats=stats, should_stop=should_stop)
+            if match:
+                return {'answer': match['answer'], 'score': match['similarity'], 'source': name}
         
-        # Estrategia 3: Búsqueda por palabras clave en tags
-        if best_score < 0.6 and self.general_data is not None:
+        elif name == 'tags':
+            # Estrategia 3: Búsqueda por palabras clave en tags (consulta al índice de etiquetas);
+            # cada palabra busca su etiqueta exacta y, si ninguna fila la tiene, las que la contienen
+            # (como 'síntoma' con 'síntomas')
+            query_lower = query.lower()
             diabetes_keywords = ['diabetes', 'glucosa', 'insulina', 'azúcar', 'alimento', 
                                'comida', 'ejercicio', 'síntoma', 'medicamento', 'dieta']
             
             for keyword in diabetes_keywords:
                 if keyword in query_lower:
-                    for idx, row in self.general_data.iterrows():
-                        try:
-                            tags = str(row.get('tags', '')).lower()
-                            if keyword in tags:
-                                best_answer = row.get('short_answer', '')
-                                best_source = 'general_tags'
-                                best_score = 0.75
-                                break
-                        except:
-                            pass
-                    if best_answer:
-                        break
-        
-        # Estrategia 4: Buscar en datos médicos
-        if self.medical_data is not None and best_score < 0.7:
-            for idx, row in self.medical_data.iterrows():
-                try:
-                    question = str(row.get('input', '')).lower()
-                    if not question:
-                        continue
-                    
-                    similarity = SequenceMatcher(None, query_lower, question).ratio()
-                    
-                    if similarity > best_score and similarity > threshold:
-                        best_score = similarity
-                        best_answer = row.get('output', '')
-                        best_source = 'medical_csv'
-                except:
-                    pass
-        
-        # Respuesta por defecto si no encuentra nada
-        if not best_answer:
-            best_answer = (
-                'No tengo información específica sobre eso. '
-                'Por favor, consulta con tu médico o endocrinólogo para una respuesta más precisa. '
-                'Puedo ayudarte con preguntas sobre síntomas, alimentos, ejercicio, medicamentos, etc.'
-            )
-            best_score = 0.3
-            best_source = 'default'
+                    matches = self.corpus.search_by_tag([keyword], top_k=1, sources=[self.TAG_SOURCE],
+                                                        partial=True)
+                    if matches:
+                        return {'answer': matches[0]['answer'], 'score': 0.75, 'source': 'general_tags'}
         
+        return None
+    
+    def _corpus_outcome(self, query: str, results: List[Dict]) -> Optional[Dict]:
+        """
+        Resultado de la estrategia del corpus a partir de su búsqueda (top 3). La similitud
+        de BM25 o TF-IDF no está en la escala de los límites de STRATEGIES, así que el puntaje
+        es el ratio() de SequenceMatcher entre las claves de la consulta y de la pregunta
+        elegida, como en el modo 'sequence' y en las estrategias 2 y 4.
+        """
+        if not results:
+            return None
+        remove_stopwords = self.corpus.remove_stopwords
+        ratio = SequenceMatcher(None, normalize_text(query, remove_stopwords),
+                                normalize_text(results[0]['question'], remove_stopwords)).ratio()
         return {
-            'found': best_answer is not None,
-            'answer': best_answer,
-            'confidence': round(best_score, 2),
-            'source': best_source,
-            'question_type': 'diabetes'
+            'answer': results[0]['answer'],
+            'score': round(ratio, 2),
+            'source': f"corpus_{results[0]['source']}"
         }
     
+    def _apply_outcome(self, best: Optional[Dict], name: str, outcome: Optional[Dict],
+                       threshold: float) -> Optional[Dict]:
+        """Mejor respuesta después de aplicar el resultado de la estrategia name"""
+        limit, must_improve = self.STRATEGIES[name]
+        best_score = best['score'] if best else 0.0
+        if outcome is None or best_score >= limit:
+            return best
+        if must_improve and outcome['score'] <= max(best_score, threshold):
+            return best
+        return outcome
+    
+    def _best_outcome(self, outcomes: Dict[str, Optional[Dict]], threshold: float) -> Optional[Dict]:
+        """Aplica los resultados disponibles en orden de prioridad, como en la ejecución en serie"""
+        best = None
+        for name in self.STRATEGIES:
+            if name in outcomes:
+                best = self._apply_outcome(best, name, outcomes[name], threshold)
+        return best
+    
+    def _is_decided(self, outcomes: Dict[str, Optional[Dict]], threshold: float) -> bool:
+        """True si ninguna estrategia sin resultado puede cambiar ya la respuesta"""
+        best = None
+        for name, (limit, _) in self.STRATEGIES.items():
+            if name in outcomes:
+                best = self._apply_outcome(best, name, outcomes[name], threshold)
+            elif (best['score'] if best else 0.0) < limit:
+                return False
+        return True
+    
+    def search_by_tag(self, tags: List[str], top_k: int = 5) -> List[Dict]:
+        """
+        Respuestas de los registros con alguna de las etiquetas, de más a menos etiquetas
+        coincidentes; las etiquetas de cada fila se interpretan una sola vez al cargar
+        """
+        if self.corpus is None:
+            return []
+        return [
+            {
+                'question': result['question'],
+                'answer': result['answer'],
+                'source': result['source'],
+                'tag_matches': result['tag_matches']
+            }
+            for result in self.corpus.search_by_tag(tags, top_k)
+        ]
+    
     def _format_answer(self, info_dict: Dict) -> str:
         """Formatea la respuesta con título y contenido"""
         titulo = info_dict.get('titulo', '')
@@ -350,24 +601,25 @@ class DiabetesKnowledgeBase:
     
     def get_related_topics(self, query: str) -> List[str]:
         """Obtiene tópicos relacionados a una pregunta"""
-        query_lower = query.lower()
         related = []
         
-        for topic in self.DIABETES_KNOWLEDGE.keys():
-            keywords = topic.split('_')
-            # Si la consulta menciona keywords relacionados, agregar tópicos relacionados
-            if any(kw in query_lower for kw in keywords):
-                # Agregar tópicos relacionados pero no el mismo
-                for other_topic in self.DIABETES_KNOWLEDGE.keys():
-                    if other_topic != topic and other_topic not in related:
-                        related.append(other_topic)
+        # Por cada tópico que menciona la consulta, agregar tópicos relacionados
+        for topic in self.TOPICS.classify(query):
+            # Agregar tópicos relacionados pero no el mismo
+            for other_topic in self.DIABETES_KNOWLEDGE.keys():
+                if other_topic != topic and other_topic not in related:
+                    related.append(other_topic)
         
         return related[:3]  # Retornar máximo 3 tópicos relacionados
 
-# Instancia global del sistema QA
+# Instancia global del sistema QA, sobre el corpus integrado global (que se carga en
+# segundo plano); con CORPUS_AUTOLOAD=0 no hay corpus y responde con la base de conocimiento
 knowledge_base = DiabetesKnowledgeBase()
 
 if __name__ == '__main__':
+    if CORPUS_AVAILABLE:
+        integrated_corpus.load_status.wait()
+    
     # Test del sistema QA
     test_queries = [
         'qué síntomas tiene la diabetes',
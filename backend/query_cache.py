@@ -0,0 +1,103 @@
+"""
+Caché en memoria de resultados de consultas
+LRU con expiración (TTL) y límites de entradas y de bytes; los valores se guardan
+serializados, así cada acierto retorna una copia independiente del resultado
+"""
+
+import os
+import time
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_ENTRIES', '1024'))
+DEFAULT_MAX_BYTES = int(float(os.environ.get('QUERY_CACHE_MB', '32')) * 1024 * 1024)
+DEFAULT_TTL_SECONDS = float(os.environ.get('QUERY_CACHE_TTL', '600'))
+
+
+def normalize_query(query: str) -> str:
+    """Consulta en minúsculas y con espacios colapsados (forma usada como clave)"""
+    return ' '.join(str(query).lower().split())
+
+
+class QueryCache:
+    """Caché LRU acotada por número de entradas, bytes y antigüedad"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # clave -> (instante de expiración, valor serializado); el final es lo más reciente
+        self._entries: 'OrderedDict[Hashable, Tuple[float, bytes]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0 and self.ttl_seconds > 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Retorna (encontrado, valor); las entradas vencidas cuentan como fallo"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            payload = entry[1]
+        return True, pickle.loads(payload)
+
+    def put(self, key: Hashable, value: Any):
+        """Guarda un valor; descarta los menos usados hasta respetar los límites"""
+        if not self.enabled:
+            return
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+            self._bytes += len(payload)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def clear(self):
+        """Vacía la caché (por ejemplo, al recargar el corpus); conserva los contadores"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_statistics(self) -> Dict:
+        """Retorna tamaño, límites y contadores de aciertos y fallos"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
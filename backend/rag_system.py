@@ -7,6 +7,7 @@ import json
 import os
 from typing import List, Dict, Tuple
 from datetime import datetime
+from intent_classifier import topic_classifier
 
 class VademecumDatabase:
     """Base de datos de medicamentos y tratamientos"""
@@ -170,16 +171,17 @@ class RAGRetriever:
         }
     }
     
+    # Palabras clave de cada tópico (las partes de su nombre), compiladas una sola vez
+    TOPICS = topic_classifier(MEDICAL_KNOWLEDGE)
+    
     @classmethod
     def retrieve_relevant_info(cls, query: str) -> List[Tuple[str, Dict]]:
         """Recupera información relevante basada en la consulta"""
         results = []
-        query_lower = query.lower()
         
-        for topic, info in cls.MEDICAL_KNOWLEDGE.items():
-            # Búsqueda simple por palabras clave
-            if any(keyword in query_lower for keyword in topic.split('_')):
-                results.append((topic, info))
+        # Búsqueda simple por palabras clave, en una pasada por la consulta
+        for topic in cls.TOPICS.classify(query):
+            results.append((topic, cls.MEDICAL_KNOWLEDGE[topic]))
         
         # Ordenar por confianza
         results.sort(key=lambda x: x[1].get('confidence', 0), reverse=True)
@@ -0,0 +1,844 @@
+"""
+Índices de búsqueda para el corpus integrado
+- Índice invertido con ranking BM25 sobre las preguntas del corpus
+- Matriz TF-IDF de n-gramas de caracteres, tolerante a errores ortográficos
+- Índice de tokens a filas para contar palabras clave en preguntas y respuestas
+- Índice de etiquetas a filas (columna tags, interpretada una sola vez)
+"""
+
+import ast
+import re
+import heapq
+from operator import itemgetter
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from scipy.sparse import csc_matrix, csr_matrix, vstack
+
+from corpus_snapshot import pack_strings, unpack_strings
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Divide un texto en tokens alfanuméricos en minúsculas"""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def parse_tags(cell: str) -> List[str]:
+    """
+    Etiquetas de una celda: lista literal de Python ("['dieta', 'pain']") o, si no
+    lo es, texto separado por comas. En minúsculas, sin espacios sobrantes ni repetidas.
+    """
+    text = str(cell).strip()
+    if not text:
+        return []
+    values = None
+    if text[0] in '[(':
+        try:
+            parsed = ast.literal_eval(text)
+            if isinstance(parsed, (list, tuple, set)):
+                values = parsed
+        except (ValueError, SyntaxError):
+            pass
+    if values is None:
+        values = text.strip('[]()').split(',')
+
+    tags = []
+    for value in values:
+        tag = str(value).strip().strip('\'"').strip().lower()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def _top_k(doc_ids: np.ndarray, scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Posiciones de los top_k puntajes; los empates se resuelven por doc_id menor"""
+    if len(scores) > top_k:
+        kth_score = -np.partition(-scores, top_k - 1)[top_k - 1]
+        top = np.flatnonzero(scores >= kth_score)
+    else:
+        top = np.arange(len(scores))
+    return top[np.lexsort((doc_ids[top], -scores[top]))][:top_k]
+
+
+class PackedVocabulary(Mapping):
+    """
+    Vocabulario término -> id leído directamente de los arreglos exportados (que pueden
+    estar mapeados en memoria): no se crea un dict por proceso, así que varios workers
+    comparten las mismas páginas. order lista los ids de término ordenados por sus bytes
+    UTF-8 (el mismo orden que str) y keys los primeros 8 bytes de cada uno como entero;
+    una búsqueda es un searchsorted sobre keys y una comparación exacta del término.
+    """
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray, order: Optional[np.ndarray] = None,
+                 keys: Optional[np.ndarray] = None):
+        # Vistas ndarray (sin copiar): indexar un np.memmap elemento a elemento es más lento
+        self.buffer = np.asarray(buffer)
+        self.offsets = np.asarray(offsets)
+        self.order = np.asarray(order) if order is not None else sorted_term_order(self.buffer, self.offsets)
+        self.keys = np.asarray(keys) if keys is not None else _prefix_keys(self.buffer, self.offsets, self.order)
+
+    def _term_bytes(self, term_id: int) -> bytes:
+        return self.buffer[self.offsets[term_id]:self.offsets[term_id + 1]].tobytes()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, term: str) -> int:
+        encoded = term.encode('utf-8')
+        prefix = np.uint64(int.from_bytes(encoded[:8].ljust(8, b'\0'), 'big'))
+        for position in range(int(self.keys.searchsorted(prefix)), len(self.keys)):
+            if self.keys[position] != prefix:
+                break
+            term_id = int(self.order[position])
+            if self._term_bytes(term_id) == encoded:
+                return term_id
+        raise KeyError(term)
+
+    def __iter__(self) -> Iterator[str]:
+        """Términos en orden de id"""
+        return iter(self.terms())
+
+    def terms(self) -> List[str]:
+        return unpack_strings(self.buffer, self.offsets)
+
+
+def sorted_term_order(buffer: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Ids de término ordenados por sus bytes UTF-8"""
+    data = buffer.tobytes()
+    bounds = np.asarray(offsets).tolist()
+    terms = [data[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    return np.array(sorted(range(len(terms)), key=terms.__getitem__), dtype=np.int64)
+
+
+def _prefix_keys(buffer: np.ndarray, offsets: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """Primeros 8 bytes de cada término (en el orden de order, rellenos con ceros) como uint64 big-endian"""
+    starts = np.asarray(offsets[:-1], dtype=np.int64)[order]
+    lengths = np.asarray(offsets[1:], dtype=np.int64)[order] - starts
+    columns = np.arange(8, dtype=np.int64)
+    inside = columns < lengths[:, None]
+    prefixes = np.zeros((len(order), 8), dtype=np.uint8)
+    prefixes[inside] = np.asarray(buffer)[(starts[:, None] + columns)[inside]]
+    return prefixes.view('>u8').ravel().astype(np.uint64)
+
+
+def _terms_by_id(vocabulary: Mapping) -> List[str]:
+    """Términos de un vocabulario (dict o PackedVocabulary) en orden de id"""
+    if isinstance(vocabulary, PackedVocabulary):
+        return vocabulary.terms()
+    return sorted(vocabulary, key=vocabulary.get)
+
+
+def _vocabulary_arrays(vocabulary: Mapping, prefix: str) -> Dict[str, np.ndarray]:
+    """Vocabulario empaquetado en orden de id, con el orden y las claves de búsqueda de PackedVocabulary"""
+    if isinstance(vocabulary, PackedVocabulary):
+        packed = vocabulary
+    else:
+        packed = PackedVocabulary(*pack_strings(_terms_by_id(vocabulary)))
+    return {
+        f'{prefix}vocab_buffer': packed.buffer,
+        f'{prefix}vocab_offsets': packed.offsets,
+        f'{prefix}vocab_order': packed.order,
+        f'{prefix}vocab_keys': packed.keys
+    }
+
+
+def _packed_vocabulary(arrays: Dict[str, np.ndarray], prefix: str) -> PackedVocabulary:
+    """PackedVocabulary de los arreglos exportados; en archivos anteriores orden y claves se calculan al abrirse"""
+    return PackedVocabulary(arrays[f'{prefix}vocab_buffer'], arrays[f'{prefix}vocab_offsets'],
+                            arrays.get(f'{prefix}vocab_order'), arrays.get(f'{prefix}vocab_keys'))
+
+
+class BM25Index:
+    """Índice invertido con postings en formato CSR y ranking BM25"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Mapping = {}
+        # postings del término t: doc_ids[offsets[t]:offsets[t + 1]]
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.term_freqs = np.zeros(0, dtype=np.float32)
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        # IDF con que cuentan en el puntaje ideal los términos de la consulta fuera del vocabulario
+        self._max_idf = 0.0
+        self.avg_doc_length = 0.0
+        self._length_norms = np.zeros(0, dtype=np.float32)
+        # Términos × documentos con el factor tf/(tf + norma) de cada posting (para search_batch)
+        self._posting_matrix = None
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def num_postings(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes de postings, longitudes y vocabulario (tal como se exporta, en UTF-8)"""
+        if isinstance(self.vocabulary, PackedVocabulary):
+            vocabulary = self.vocabulary.buffer.nbytes
+        else:
+            vocabulary = sum(len(term.encode('utf-8')) for term in self.vocabulary)
+        return (self.offsets.nbytes + self.doc_ids.nbytes + self.term_freqs.nbytes
+                + self.doc_lengths.nbytes + vocabulary)
+
+    def build(self, documents: Iterable[str]) -> 'BM25Index':
+        """Tokeniza los documentos una sola vez y construye los postings"""
+        vocabulary: Dict[str, int] = {}
+        term_ids = array('i')
+        lengths = array('i')
+
+        for document in documents:
+            tokens = tokenize(document)
+            lengths.append(len(tokens))
+            term_ids.extend([vocabulary.setdefault(tok, len(vocabulary)) for tok in tokens])
+
+        num_docs = len(lengths)
+        doc_lengths = np.frombuffer(lengths, dtype=np.int32).copy()
+        terms = np.frombuffer(term_ids, dtype=np.int32).astype(np.int64)
+        docs = np.repeat(np.arange(num_docs, dtype=np.int64), doc_lengths)
+
+        # Un par (término, documento) por posting, ordenado por término y luego documento
+        keys, counts = np.unique(terms * max(num_docs, 1) + docs, return_counts=True)
+        posting_terms = keys // max(num_docs, 1)
+
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms, minlength=len(vocabulary)), out=offsets[1:])
+
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = (keys % max(num_docs, 1)).astype(np.int32)
+        self.term_freqs = counts.astype(np.float32)
+        self.doc_lengths = doc_lengths
+        self._finalize()
+        return self
+
+    def _finalize(self):
+        """Calcula IDF y normas de longitud a partir de los postings"""
+        num_docs = self.num_docs
+        doc_freqs = np.diff(self.offsets).astype(np.float64)
+        self.idf = np.log1p((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        self._max_idf = float(self.idf.max()) if len(self.idf) else 0.0
+        self.avg_doc_length = float(self.doc_lengths.mean()) if num_docs else 0.0
+        avg = self.avg_doc_length or 1.0
+        self._length_norms = (self.k1 * (1 - self.b + self.b * self.doc_lengths / avg)).astype(np.float32)
+        self._posting_matrix = None
+
+    def _query_terms(self, tokens: List[str]) -> Tuple[Counter, float]:
+        """
+        Frecuencias de los términos conocidos de la consulta y puntaje BM25 que obtendría
+        un documento idéntico a ella. Los términos fuera del vocabulario también cuentan
+        en ese puntaje ideal (con el IDF máximo): ningún documento los contiene, así que
+        una consulta con un solo término en común no llega a similitud 1.
+        """
+        avg = self.avg_doc_length or 1.0
+        norm = self.k1 * (1 - self.b + self.b * len(tokens) / avg)
+        query_counts = Counter()
+        ideal = 0.0
+        for token, qtf in Counter(tokens).items():
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                idf = self._max_idf
+            else:
+                query_counts[term_id] = qtf
+                idf = float(self.idf[term_id])
+            ideal += qtf * idf * qtf * (self.k1 + 1) / (qtf + norm)
+        return query_counts, ideal
+
+    def _similarity(self, score: float, ideal: float) -> float:
+        """
+        Puntaje relativo al de un documento idéntico a la consulta. Un documento que
+        repite un término más que la consulta puede superarlo un poco: el tope en 1
+        solo cubre ese caso (los términos desconocidos ya están en el ideal).
+        """
+        return min(1.0, score / ideal) if ideal > 0 else 0.0
+
+    def search(self, query: str, top_k: int = 5,
+               doc_range: Optional[Tuple[int, int]] = None) -> List[Tuple[int, float, float]]:
+        """
+        Retorna [(doc_id, puntaje_bm25, similitud)] ordenado por puntaje.
+        Solo se puntúan los documentos que comparten términos con la consulta;
+        la similitud normaliza el puntaje contra el de una coincidencia exacta.
+        Con doc_range=(inicio, fin) solo se recorren los postings de esos documentos
+        (los postings de cada término están ordenados por documento).
+        """
+        query_counts, ideal = self._query_terms(tokenize(query))
+        if not query_counts or top_k <= 0:
+            return []
+
+        ids_parts = []
+        score_parts = []
+        for term_id, qtf in query_counts.items():
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            if doc_range is not None:
+                start, end = start + np.searchsorted(self.doc_ids[start:end], doc_range)
+            ids = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            weight = qtf * self.idf[term_id] * (self.k1 + 1)
+            ids_parts.append(ids)
+            score_parts.append(weight * tf / (tf + self._length_norms[ids]))
+
+        if len(ids_parts) == 1:
+            candidates, scores = ids_parts[0], score_parts[0]
+        else:
+            candidates, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+
+        top = _top_k(candidates, scores, top_k)
+
+        return [
+            (int(candidates[i]), float(scores[i]), self._similarity(float(scores[i]), ideal))
+            for i in top
+        ]
+
+    def _get_posting_matrix(self) -> csr_matrix:
+        """
+        Matriz dispersa términos × documentos sobre los mismos postings (comparte
+        doc_ids y offsets); se calcula al primer search_batch
+        """
+        if self._posting_matrix is None:
+            term_freqs = np.asarray(self.term_freqs, dtype=np.float32)
+            weights = term_freqs / (term_freqs + self._length_norms[self.doc_ids])
+            self._posting_matrix = csr_matrix((weights, self.doc_ids, self.offsets),
+                                              shape=(len(self.vocabulary), self.num_docs))
+        return self._posting_matrix
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 5,
+                     doc_ranges: Sequence[Optional[Tuple[int, int]]] = None) -> List[List[Tuple[int, float, float]]]:
+        """
+        search() para muchas consultas con un solo producto de matrices dispersas:
+        pesos de las consultas (consultas × términos) por la matriz de postings
+        (términos × documentos). doc_ranges[i] limita la consulta i como doc_range.
+        Los resultados son los de search() salvo redondeo (la suma se acumula en float32).
+        """
+        rows, term_ids, weights, ideals = [], [], [], []
+        for position, query in enumerate(queries):
+            query_counts, ideal = self._query_terms(tokenize(query))
+            ideals.append(ideal)
+            for term_id, qtf in query_counts.items():
+                rows.append(position)
+                term_ids.append(term_id)
+                weights.append(qtf * float(self.idf[term_id]) * (self.k1 + 1))
+
+        query_matrix = csr_matrix(
+            (np.array(weights, dtype=np.float32), (np.array(rows, dtype=np.int64), np.array(term_ids, dtype=np.int64))),
+            shape=(len(queries), len(self.vocabulary))
+        )
+        scores = (query_matrix @ self._get_posting_matrix()).tocsr()
+
+        results = []
+        for position in range(len(queries)):
+            start, end = scores.indptr[position], scores.indptr[position + 1]
+            candidates, values = scores.indices[start:end], scores.data[start:end]
+            doc_range = doc_ranges[position] if doc_ranges is not None else None
+            if doc_range is not None:
+                keep = (candidates >= doc_range[0]) & (candidates < doc_range[1])
+                candidates, values = candidates[keep], values[keep]
+            if len(candidates) == 0 or top_k <= 0:
+                results.append([])
+                continue
+            top = _top_k(candidates, values, top_k)
+            results.append([
+                (int(candidates[i]), float(values[i]), self._similarity(float(values[i]), ideals[position]))
+                for i in top
+            ])
+        return results
+
+    @classmethod
+    def merge(cls, parts: List[Tuple['BM25Index', np.ndarray]], order: np.ndarray = None) -> 'BM25Index':
+        """
+        Une índices construidos por partes (por ejemplo, uno por archivo fuente).
+        De cada parte se conservan solo los doc_ids locales indicados (ascendentes) y se
+        numeran a continuación de la parte anterior; con order, el documento i del
+        resultado es el order[i] de esa numeración. El resultado es equivalente a build()
+        sobre esos documentos: IDF y longitud media se recalculan con el total.
+        """
+        vocabulary: Dict[str, int] = {}
+        term_parts, doc_parts, freq_parts, length_parts = [], [], [], []
+        base = 0
+        for index, kept in parts:
+            kept = np.asarray(kept, dtype=np.int64)
+            terms = _terms_by_id(index.vocabulary)
+            term_map = np.array([vocabulary.setdefault(term, len(vocabulary)) for term in terms], dtype=np.int64)
+            doc_map = np.full(index.num_docs, -1, dtype=np.int64)
+            doc_map[kept] = base + np.arange(len(kept))
+
+            docs = doc_map[index.doc_ids]
+            keep = docs >= 0
+            term_parts.append(np.repeat(term_map, np.diff(index.offsets))[keep])
+            doc_parts.append(docs[keep])
+            freq_parts.append(np.asarray(index.term_freqs)[keep])
+            length_parts.append(np.asarray(index.doc_lengths)[kept])
+            base += len(kept)
+
+        k1, b = (parts[0][0].k1, parts[0][0].b) if parts else (1.5, 0.75)
+        merged = cls(k1=k1, b=b)
+        if not parts:
+            return merged
+
+        docs = np.concatenate(doc_parts)
+        doc_lengths = np.concatenate(length_parts)
+        if order is not None:
+            positions = np.empty(len(order), dtype=np.int64)
+            positions[order] = np.arange(len(order))
+            docs = positions[docs]
+            doc_lengths = doc_lengths[order]
+
+        # Solo quedan los términos con algún documento conservado
+        used_terms, terms = np.unique(np.concatenate(term_parts), return_inverse=True)
+        postings = np.lexsort((docs, terms))
+        names = list(vocabulary)
+
+        merged.vocabulary = {names[term_id]: position for position, term_id in enumerate(used_terms.tolist())}
+        merged.offsets = np.zeros(len(used_terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(used_terms)), out=merged.offsets[1:])
+        merged.doc_ids = docs[postings].astype(np.int32)
+        merged.term_freqs = np.concatenate(freq_parts)[postings].astype(np.float32)
+        merged.doc_lengths = doc_lengths.astype(np.int32)
+        merged._finalize()
+        return merged
+
+    def shard(self, start: int, end: int) -> 'BM25Index':
+        """
+        Subíndice con los documentos [start, end), renumerados desde 0.
+        Conserva IDF y longitud media globales, así los puntajes son idénticos al índice completo.
+        """
+        posting_terms = np.repeat(np.arange(len(self.vocabulary), dtype=np.int64), np.diff(self.offsets))
+        keep = (self.doc_ids >= start) & (self.doc_ids < end)
+
+        shard = BM25Index(k1=self.k1, b=self.b)
+        shard.vocabulary = self.vocabulary
+        shard.offsets = np.zeros(len(self.offsets), dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms[keep], minlength=len(self.vocabulary)), out=shard.offsets[1:])
+        shard.doc_ids = (self.doc_ids[keep] - start).astype(np.int32)
+        shard.term_freqs = np.ascontiguousarray(self.term_freqs[keep])
+        shard.doc_lengths = np.ascontiguousarray(self.doc_lengths[start:end])
+        shard.idf = self.idf
+        shard._max_idf = self._max_idf
+        shard.avg_doc_length = self.avg_doc_length
+        shard._length_norms = np.ascontiguousarray(self._length_norms[start:end])
+        return shard
+
+    def to_arrays(self, prefix: str = 'bm25_') -> Dict[str, np.ndarray]:
+        """Exporta el índice como arreglos planos (vocabulario en orden de término)"""
+        arrays = _vocabulary_arrays(self.vocabulary, prefix)
+        arrays.update({
+            f'{prefix}offsets': self.offsets,
+            f'{prefix}doc_ids': self.doc_ids,
+            f'{prefix}term_freqs': self.term_freqs,
+            f'{prefix}doc_lengths': self.doc_lengths,
+            f'{prefix}params': np.array([self.k1, self.b], dtype=np.float64)
+        })
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], prefix: str = 'bm25_') -> 'BM25Index':
+        """Reconstruye el índice sin copiar postings ni vocabulario (admite arreglos mapeados)"""
+        k1, b = arrays[f'{prefix}params'].tolist()
+        index = cls(k1=k1, b=b)
+        index.vocabulary = _packed_vocabulary(arrays, prefix)
+        index.offsets = arrays[f'{prefix}offsets']
+        index.doc_ids = arrays[f'{prefix}doc_ids']
+        index.term_freqs = arrays[f'{prefix}term_freqs']
+        index.doc_lengths = arrays[f'{prefix}doc_lengths']
+        index._finalize()
+        return index
+
+    def get_statistics(self) -> Dict:
+        """Retorna el tamaño del índice"""
+        return {
+            'documents': self.num_docs,
+            'vocabulary': len(self.vocabulary),
+            'postings': self.num_postings,
+            'avg_doc_length': round(self.avg_doc_length, 2)
+        }
+
+
+class CharNgramIndex:
+    """Matriz TF-IDF dispersa de n-gramas de caracteres sobre las preguntas"""
+
+    def __init__(self, ngram_range: Tuple[int, int] = (3, 3), min_df: int = 2):
+        self.vectorizer = TfidfVectorizer(
+            analyzer='char_wb',
+            ngram_range=ngram_range,
+            min_df=min_df,
+            lowercase=True,
+            sublinear_tf=True,
+            dtype=np.float32
+        )
+        # Almacenada por columnas: una consulta solo toca los n-gramas que contiene
+        self.matrix = None
+
+    @property
+    def num_docs(self) -> int:
+        return self.matrix.shape[0] if self.matrix is not None else 0
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes de la matriz TF-IDF dispersa"""
+        if self.matrix is None:
+            return 0
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    def build(self, documents: Iterable[str]) -> 'CharNgramIndex':
+        """Ajusta el vocabulario de n-gramas y precalcula la matriz TF-IDF"""
+        self.matrix = self.vectorizer.fit_transform(documents).tocsc()
+        return self
+
+    def search(self, query: str, top_k: int = 5, min_score: float = 0.05,
+               doc_range: Optional[Tuple[int, int]] = None) -> List[Tuple[int, float]]:
+        """
+        Retorna [(doc_id, similitud_coseno)] ordenado por similitud.
+        El puntaje es un único producto matriz-vector disperso; las filas con
+        similitud menor que min_score se descartan antes de seleccionar el top-k.
+        Con doc_range=(inicio, fin) solo se recorren las filas de ese rango en cada
+        columna de la matriz (sus índices de fila están ordenados).
+        """
+        if self.matrix is None or top_k <= 0:
+            return []
+
+        query_vector = self.vectorizer.transform([query])
+        if query_vector.nnz == 0:
+            return []
+
+        if doc_range is None:
+            scores = self.matrix[:, query_vector.indices] @ query_vector.data
+            first = 0
+        else:
+            first, last = doc_range
+            rows, weights = [], []
+            for column, weight in zip(query_vector.indices.tolist(), query_vector.data.tolist()):
+                start, end = self.matrix.indptr[column], self.matrix.indptr[column + 1]
+                start, end = start + np.searchsorted(self.matrix.indices[start:end], doc_range)
+                rows.append(self.matrix.indices[start:end])
+                weights.append(self.matrix.data[start:end] * weight)
+            scores = np.bincount(np.concatenate(rows) - first, weights=np.concatenate(weights),
+                                 minlength=last - first)
+        candidates = np.flatnonzero(scores > min_score)
+        top = _top_k(candidates, scores[candidates], top_k)
+
+        return [(int(candidates[i]) + first, float(scores[candidates[i]])) for i in top]
+
+    def partial_counts(self, documents: Iterable[str]) -> Tuple[List[str], csr_matrix]:
+        """
+        Conteos crudos de n-gramas de una parte del corpus (vocabulario ordenado y
+        matriz CSR), sin min_df ni IDF, para unirlos después con merge()
+        """
+        counter = CountVectorizer(
+            analyzer='char_wb',
+            ngram_range=self.vectorizer.ngram_range,
+            lowercase=True,
+            dtype=np.float32
+        )
+        documents = list(documents)
+        try:
+            counts = counter.fit_transform(documents)
+        except ValueError:
+            # Ningún documento produce n-gramas
+            return [], csr_matrix((len(documents), 0), dtype=np.float32)
+        return counter.get_feature_names_out().tolist(), counts.tocsr()
+
+    @classmethod
+    def merge(cls, parts: List[Tuple[List[str], csr_matrix, np.ndarray]], ngram_range: Tuple[int, int] = (3, 3),
+              min_df: int = 2, order: np.ndarray = None) -> 'CharNgramIndex':
+        """
+        Une conteos parciales (vocabulario, conteos, filas conservadas) en un índice
+        equivalente a build() sobre las filas conservadas, en el orden de las partes
+        (o reordenadas con order, como en BM25Index.merge)
+        """
+        index = cls(ngram_range=ngram_range, min_df=min_df)
+        features = sorted(set().union(*(vocabulary for vocabulary, _, _ in parts)))
+        columns = {feature: position for position, feature in enumerate(features)}
+
+        blocks = []
+        for vocabulary, counts, kept in parts:
+            # Ambos vocabularios están ordenados: la reasignación conserva el orden de columnas
+            remap = np.array([columns[feature] for feature in vocabulary], dtype=np.int64)
+            rows = counts[np.asarray(kept, dtype=np.int64)]
+            blocks.append(csr_matrix((rows.data, remap[rows.indices], rows.indptr),
+                                     shape=(rows.shape[0], len(features))))
+        counts = vstack(blocks, format='csr', dtype=np.float32) if blocks else csr_matrix((0, 0), dtype=np.float32)
+        if order is not None:
+            counts = counts[np.asarray(order, dtype=np.int64)]
+
+        doc_freqs = np.bincount(counts.indices, minlength=len(features))
+        kept_features = np.flatnonzero(doc_freqs >= min_df)
+        counts = counts[:, kept_features]
+
+        transformer = TfidfTransformer(sublinear_tf=True).fit(counts)
+        index.vectorizer.vocabulary_ = {features[column]: position for position, column in enumerate(kept_features.tolist())}
+        index.vectorizer.idf_ = transformer.idf_
+        index.matrix = transformer.transform(counts).tocsc()
+        return index
+
+    def shard(self, start: int, end: int) -> 'CharNgramIndex':
+        """Subíndice con las filas [start, end), compartiendo el vocabulario ajustado"""
+        shard = CharNgramIndex()
+        shard.vectorizer = self.vectorizer
+        shard.matrix = self.matrix.tocsr()[start:end].tocsc()
+        return shard
+
+    def to_arrays(self, prefix: str = 'ngram_') -> Dict[str, np.ndarray]:
+        """Exporta vocabulario, IDF y la matriz CSC como arreglos planos"""
+        arrays = _vocabulary_arrays(self.vectorizer.vocabulary_, prefix)
+        arrays.update({
+            f'{prefix}idf': np.asarray(self.vectorizer.idf_, dtype=np.float64),
+            f'{prefix}data': self.matrix.data,
+            f'{prefix}indices': self.matrix.indices,
+            f'{prefix}indptr': self.matrix.indptr,
+            f'{prefix}shape': np.array(self.matrix.shape, dtype=np.int64),
+            f'{prefix}params': np.array([*self.vectorizer.ngram_range, self.vectorizer.min_df], dtype=np.int64)
+        })
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], prefix: str = 'ngram_') -> 'CharNgramIndex':
+        """Reconstruye vectorizador y matriz sin copiar los datos de la matriz ni el vocabulario"""
+        min_n, max_n, min_df = arrays[f'{prefix}params'].tolist()
+        index = cls(ngram_range=(min_n, max_n), min_df=min_df)
+        index.vectorizer.vocabulary_ = _packed_vocabulary(arrays, prefix)
+        index.vectorizer.idf_ = np.array(arrays[f'{prefix}idf'])
+        index.matrix = csc_matrix(
+            (arrays[f'{prefix}data'], arrays[f'{prefix}indices'], arrays[f'{prefix}indptr']),
+            shape=tuple(arrays[f'{prefix}shape'].tolist()),
+            copy=False
+        )
+        return index
+
+    def get_statistics(self) -> Dict:
+        """Retorna el tamaño de la matriz TF-IDF"""
+        if self.matrix is None:
+            return {'documents': 0, 'features': 0, 'nonzeros': 0}
+        return {
+            'documents': self.matrix.shape[0],
+            'features': self.matrix.shape[1],
+            'nonzeros': int(self.matrix.nnz)
+        }
+
+
+class KeywordIndex:
+    """
+    Filas en las que aparece cada token (de la pregunta o de la respuesta).
+
+    Cuenta coincidencias de subcadena ('kw in texto') de muchas palabras clave a la vez:
+    una palabra clave formada solo por caracteres de palabra aparece en un texto si y
+    solo si es subcadena de alguno de sus tokens, así que basta con buscarla en el
+    vocabulario. Las demás (varias palabras, signos) se verifican contra el texto solo
+    en las filas que contienen todos sus fragmentos.
+    """
+
+    def __init__(self):
+        self.vocabulary: List[str] = []
+        # Vocabulario unido por '\n' y posición de inicio de cada token
+        self._vocabulary_text = ''
+        self._token_starts = np.zeros(0, dtype=np.int64)
+        # Filas del término t: row_ids[offsets[t]:offsets[t + 1]], ordenadas
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.row_ids = np.zeros(0, dtype=np.int32)
+        self._columns: List[Sequence[str]] = []
+
+    @property
+    def num_rows(self) -> int:
+        return len(self._columns[0]) if self._columns else 0
+
+    def build(self, columns: Sequence[Iterable[str]]) -> 'KeywordIndex':
+        """Tokeniza cada fila (todas las columnas) una sola vez; las columnas deben admitir column[i]"""
+        self._columns = list(columns)
+        vocabulary: Dict[str, int] = {}
+        term_ids = array('i')
+        row_sizes = array('i')
+
+        for texts in zip(*self._columns):
+            tokens = set()
+            for text in texts:
+                tokens.update(tokenize(text))
+            row_sizes.append(len(tokens))
+            term_ids.extend([vocabulary.setdefault(tok, len(vocabulary)) for tok in tokens])
+
+        terms = np.frombuffer(term_ids, dtype=np.int32)
+        rows = np.repeat(np.arange(len(row_sizes), dtype=np.int32), np.frombuffer(row_sizes, dtype=np.int32))
+        # Orden estable: dentro de cada término las filas quedan en orden ascendente
+        order = np.argsort(terms, kind='stable')
+
+        self.offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=self.offsets[1:])
+        self.row_ids = rows[order]
+
+        self.vocabulary = list(vocabulary)
+        self._vocabulary_text = '\n'.join(self.vocabulary)
+        self._token_starts = np.zeros(len(self.vocabulary), dtype=np.int64)
+        if self.vocabulary:
+            np.cumsum([len(tok) + 1 for tok in self.vocabulary[:-1]], out=self._token_starts[1:])
+        return self
+
+    def _rows_with_fragment(self, fragment: str) -> np.ndarray:
+        """Filas con algún token que contiene el fragmento"""
+        positions = [match.start() for match in re.finditer(re.escape(fragment), self._vocabulary_text)]
+        term_ids = np.unique(np.searchsorted(self._token_starts, positions, side='right') - 1)
+        if len(term_ids) == 0:
+            return np.zeros(0, dtype=np.int32)
+        if len(term_ids) == 1:
+            return self.row_ids[self.offsets[term_ids[0]]:self.offsets[term_ids[0] + 1]]
+
+        # Concatena los postings de todos los términos sin recorrerlos en Python
+        starts = self.offsets[term_ids]
+        sizes = self.offsets[term_ids + 1] - starts
+        positions = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        return np.unique(self.row_ids[positions])
+
+    def _rows_containing(self, keyword: str) -> np.ndarray:
+        """Filas donde keyword (ya en minúsculas) es subcadena de alguna columna en minúsculas"""
+        fragments = TOKEN_PATTERN.findall(keyword)
+        if len(fragments) == 1 and fragments[0] == keyword:
+            return self._rows_with_fragment(keyword)
+
+        candidates = np.arange(self.num_rows, dtype=np.int32)
+        for fragment in fragments:
+            candidates = np.intersect1d(candidates, self._rows_with_fragment(fragment), assume_unique=True)
+        return np.array([
+            row for row in candidates.tolist()
+            if any(keyword in str(column[row]).lower() for column in self._columns)
+        ], dtype=np.int32)
+
+    def match_counts(self, keywords: Iterable[str], cache: Optional[Dict] = None) -> np.ndarray:
+        """
+        Número de palabras clave presentes en cada fila (una palabra repetida cuenta
+        cada vez). cache comparte las filas de cada palabra entre varias consultas.
+        """
+        cache = {} if cache is None else cache
+        parts = []
+        for keyword, repeats in Counter(str(kw).lower() for kw in keywords).items():
+            if keyword not in cache:
+                cache[keyword] = self._rows_containing(keyword)
+            parts.extend([cache[keyword]] * repeats)
+
+        if not parts:
+            return np.zeros(self.num_rows, dtype=np.int64)
+        return np.bincount(np.concatenate(parts), minlength=self.num_rows)
+
+    def search(self, keywords: Iterable[str], top_k: int = 10,
+               cache: Optional[Dict] = None) -> List[Tuple[int, int]]:
+        """
+        Retorna [(fila, coincidencias)] de mayor a menor; a igual número de
+        coincidencias, la fila más temprana. El top-k se toma con un heap.
+        """
+        counts = self.match_counts(keywords, cache)
+        hits = np.flatnonzero(counts)
+        if len(hits) == 0 or top_k <= 0:
+            return []
+
+        # Solo las filas que pueden entrar al top-k llegan al heap
+        if len(hits) > top_k:
+            kth_count = np.partition(counts[hits], len(hits) - top_k)[len(hits) - top_k]
+            hits = hits[counts[hits] >= kth_count]
+        return heapq.nlargest(top_k, zip(hits.tolist(), counts[hits].tolist()), key=itemgetter(1))
+
+    def search_batch(self, keyword_sets: Iterable[Iterable[str]], top_k: int = 10) -> List[List[Tuple[int, int]]]:
+        """search() para varios conjuntos de palabras clave; cada palabra se resuelve una sola vez"""
+        cache = {}
+        return [self.search(keywords, top_k, cache) for keywords in keyword_sets]
+
+    def get_statistics(self) -> Dict:
+        """Retorna el tamaño del índice"""
+        return {
+            'rows': self.num_rows,
+            'vocabulary': len(self.vocabulary),
+            'postings': len(self.row_ids)
+        }
+
+
+class TagIndex:
+    """
+    Filas de cada etiqueta. Las celdas se interpretan una sola vez al construir (las
+    celdas repetidas, una sola vez en total); buscar una etiqueta es una consulta al
+    diccionario y un corte de row_ids.
+    """
+
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        # Filas de la etiqueta t: row_ids[offsets[t]:offsets[t + 1]], ordenadas
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.row_ids = np.zeros(0, dtype=np.int32)
+        self.num_rows = 0
+        # Etiquetas del vocabulario que contienen cada fragmento consultado
+        self._fragment_tags: Dict[str, List[str]] = {}
+
+    def build(self, cells: Iterable[str]) -> 'TagIndex':
+        """Interpreta cada celda con parse_tags y arma los postings por etiqueta"""
+        vocabulary: Dict[str, int] = {}
+        parsed: Dict[str, List[int]] = {}
+        term_ids = array('i')
+        row_sizes = array('i')
+
+        for cell in cells:
+            if cell not in parsed:
+                parsed[cell] = [vocabulary.setdefault(tag, len(vocabulary)) for tag in parse_tags(cell)]
+            row_sizes.append(len(parsed[cell]))
+            term_ids.extend(parsed[cell])
+
+        terms = np.frombuffer(term_ids, dtype=np.int32)
+        rows = np.repeat(np.arange(len(row_sizes), dtype=np.int32), np.frombuffer(row_sizes, dtype=np.int32))
+        # Orden estable: dentro de cada etiqueta las filas quedan en orden ascendente
+        order = np.argsort(terms, kind='stable')
+
+        self.offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=self.offsets[1:])
+        self.row_ids = rows[order]
+        self.vocabulary = vocabulary
+        self.num_rows = len(row_sizes)
+        self._fragment_tags = {}
+        return self
+
+    def tags_containing(self, fragment: str) -> List[str]:
+        """
+        Etiquetas del vocabulario que contienen el fragmento (p. ej. 'síntoma' → 'síntomas'),
+        sin distinguir mayúsculas. El vocabulario de etiquetas es chico: se recorre una
+        sola vez por fragmento y el resultado queda guardado.
+        """
+        fragment = str(fragment).strip().lower()
+        if fragment not in self._fragment_tags:
+            self._fragment_tags[fragment] = [tag for tag in self.vocabulary if fragment in tag] if fragment else []
+        return self._fragment_tags[fragment]
+
+    def rows(self, tag: str) -> np.ndarray:
+        """Filas (ordenadas) con la etiqueta, sin distinguir mayúsculas"""
+        term = self.vocabulary.get(str(tag).strip().lower())
+        if term is None:
+            return np.zeros(0, dtype=np.int32)
+        return self.row_ids[self.offsets[term]:self.offsets[term + 1]]
+
+    def search(self, tags: Iterable[str], top_k: int = 10,
+               rows: Optional[np.ndarray] = None) -> List[Tuple[int, int]]:
+        """
+        Retorna [(fila, etiquetas coincidentes)] de mayor a menor; a igual número de
+        coincidencias, la fila más temprana. rows (ordenado) limita las filas candidatas.
+        """
+        parts = [self.rows(tag) for tag in dict.fromkeys(str(tag).strip().lower() for tag in tags)]
+        parts = [part for part in parts if len(part)]
+        if not parts or top_k <= 0:
+            return []
+
+        hits, counts = np.unique(np.concatenate(parts), return_counts=True)
+        if rows is not None:
+            keep = np.isin(hits, rows, assume_unique=True)
+            hits, counts = hits[keep], counts[keep]
+        top = _top_k(hits, counts, top_k)
+        return list(zip(hits[top].tolist(), counts[top].tolist()))
+
+    def get_statistics(self) -> Dict:
+        """Retorna el tamaño del índice"""
+        return {
+            'rows': self.num_rows,
+            'tags': len(self.vocabulary),
+            'postings': len(self.row_ids)
+        }
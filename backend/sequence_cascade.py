@@ -0,0 +1,202 @@
+"""
+Cascada de filtros baratos antes de SequenceMatcher
+Descarta filas que no pueden superar el umbral usando cotas superiores de
+ratio(), de modo que los resultados son idénticos a puntuar todas las filas
+"""
+
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_NUM_BUCKETS = 32
+_ROWS_PER_CHUNK = 20000
+
+
+class SearchInterrupted(Exception):
+    """La búsqueda se interrumpió porque should_stop() retornó True"""
+
+
+def _build_bucket_table() -> np.ndarray:
+    """Asigna cada carácter latino a un grupo (letra sin acento, dígito, espacio, signo)"""
+    table = np.zeros(0x250, dtype=np.int64)
+    for code in range(len(table)):
+        char = chr(code)
+        base = unicodedata.normalize('NFKD', char)[:1].lower()
+        if 'a' <= base <= 'z':
+            table[code] = ord(base) - ord('a')
+        elif char.isdigit():
+            table[code] = 26
+        elif char.isspace():
+            table[code] = 27
+        elif not char.isalnum():
+            table[code] = 28
+        else:
+            table[code] = 29 + code % 3
+    return table
+
+
+_BUCKETS = _build_bucket_table()
+
+
+def _code_points(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+def _buckets(code_points: np.ndarray) -> np.ndarray:
+    """Grupo de cada carácter; fuera del alfabeto latino se reparte por código"""
+    latin = code_points < len(_BUCKETS)
+    return np.where(latin, _BUCKETS[np.where(latin, code_points, 0)], 29 + code_points.astype(np.int64) % 3)
+
+
+def cascade_arrays(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Longitud y cuenta de caracteres por clase (en orden de columnas) de cada texto: los
+    arreglos que usan las etapas vectorizadas. Se calculan al armar el corpus y se guardan
+    en el snapshot, así que los workers los mapean en vez de recalcularlos.
+    """
+    num_rows = len(texts)
+    lengths = np.zeros(num_rows, dtype=np.int64)
+    histograms = np.zeros((num_rows, _NUM_BUCKETS), dtype=np.uint32, order='F')
+    for start in range(0, num_rows, _ROWS_PER_CHUNK):
+        end = min(start + _ROWS_PER_CHUNK, num_rows)
+        chunk = [texts[idx] for idx in range(start, end)]
+        lengths[start:end] = [len(text) for text in chunk]
+        code_points = _code_points(''.join(chunk))
+        rows = np.repeat(np.arange(end - start, dtype=np.int64), lengths[start:end])
+        counts = np.bincount(rows * _NUM_BUCKETS + _buckets(code_points),
+                             minlength=(end - start) * _NUM_BUCKETS)
+        histograms[start:end] = counts.reshape(end - start, _NUM_BUCKETS)
+    if not num_rows or lengths.max() < 2 ** 16:
+        histograms = histograms.astype(np.uint16, order='F')
+    return lengths, histograms
+
+
+def _ratio_bound(matches: np.ndarray, total_length: np.ndarray) -> np.ndarray:
+    """Misma fórmula que SequenceMatcher.ratio() aplicada a una cota de coincidencias"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total_length > 0, 2.0 * matches / total_length, 1.0)
+
+
+class SequenceMatchCascade:
+    """
+    Puntúa SequenceMatcher(None, consulta, texto).ratio() solo donde puede superar el umbral.
+
+    Etapas (cada una es una cota superior de ratio()):
+    1. length_ratio: 2*min(la, lb)/(la + lb); es exactamente real_quick_ratio(), vectorizada
+    2. qgram: conteo de q-gramas con q=1 agrupados en 32 clases de caracteres, vectorizado.
+       Es la única longitud de q-grama que acota ratio() sin pérdidas.
+    3. quick_ratio: intersección exacta de multiconjuntos de caracteres, por fila
+    """
+
+    def __init__(self, texts: Sequence[str], lengths: np.ndarray = None, histograms: np.ndarray = None,
+                 rows: np.ndarray = None):
+        """
+        texts admite cualquier secuencia indexable (p. ej. PackedStrings): solo se decodifican
+        las filas candidatas. lengths e histograms (de cascade_arrays, por fila de texts) pueden
+        venir precalculados y mapeados. Con rows la cascada cubre solo esas filas de texts,
+        en ese orden, sin copiar sus arreglos; las posiciones devueltas son índices de rows.
+        """
+        self.texts = texts
+        if lengths is None or histograms is None:
+            lengths, histograms = cascade_arrays(texts)
+        self.lengths = lengths
+        self.histograms = histograms
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows) if self.rows is not None else len(self.lengths)
+
+    def _text_rows(self, positions):
+        """Filas de texts de las posiciones de la cascada"""
+        return self.rows[positions] if self.rows is not None else positions
+
+    def _candidates(self, query: str, cutoff: float, stats: Dict,
+                    row_range: Optional[Tuple[int, int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Etapas vectorizadas (solo sobre row_range, si se indica): filas sobrevivientes y su cota qgram"""
+        first, last = row_range if row_range is not None else (0, len(self))
+        lengths = self.lengths[first:last] if self.rows is None else self.lengths[self.rows[first:last]]
+        total_length = lengths + len(query)
+        nonempty = lengths > 0
+
+        length_bound = _ratio_bound(np.minimum(lengths, len(query)), total_length)
+        candidates = np.flatnonzero(nonempty & (length_bound > cutoff)) + first
+        stats['length_ratio'] = int(nonempty.sum()) - len(candidates)
+
+        query_hist = np.bincount(_buckets(_code_points(query)), minlength=_NUM_BUCKETS)
+        used = np.flatnonzero(query_hist)
+        candidate_rows = self._text_rows(candidates)
+        shared = np.zeros(len(candidates), dtype=np.int64)
+        for bucket in used:
+            shared += np.minimum(self.histograms[candidate_rows, bucket], query_hist[bucket])
+        qgram_bound = _ratio_bound(shared, total_length[candidates - first])
+        keep = qgram_bound > cutoff
+        stats['qgram'] = int(len(candidates) - keep.sum())
+        return candidates[keep], qgram_bound[keep]
+
+    def _quick_bound(self, query_counts: Counter, query_length: int, idx: int) -> float:
+        """Equivalente a quick_ratio(): intersección de multiconjuntos de caracteres"""
+        text = self.texts[int(self._text_rows(idx))]
+        text_counts = Counter(text)
+        matches = sum(min(count, text_counts[char]) for char, count in query_counts.items())
+        total = query_length + len(text)
+        return 2.0 * matches / total if total else 1.0
+
+    def matches(self, query: str, threshold: float, stats: Dict = None,
+                row_range: Optional[Tuple[int, int]] = None) -> List[Tuple[int, float]]:
+        """Todas las filas (de row_range, si se indica) con ratio() > threshold, en orden de fila"""
+        stats = {} if stats is None else stats
+        first, last = row_range if row_range is not None else (0, len(self))
+        stats.update({'rows': last - first, 'quick_ratio': 0, 'scored': 0})
+        candidates, _ = self._candidates(query, threshold, stats, row_range)
+        query_counts = Counter(query)
+
+        results = []
+        for idx in candidates.tolist():
+            if self._quick_bound(query_counts, len(query), idx) <= threshold:
+                stats['quick_ratio'] += 1
+                continue
+            stats['scored'] += 1
+            ratio = SequenceMatcher(None, query, self.texts[int(self._text_rows(idx))]).ratio()
+            if ratio > threshold:
+                results.append((idx, ratio))
+        return results
+
+    def best_match(self, query: str, threshold: float, stats: Dict = None,
+                   row_range: Optional[Tuple[int, int]] = None,
+                   should_stop: Callable[[], bool] = None) -> Optional[Tuple[int, float]]:
+        """
+        Primera fila con el ratio() máximo, si supera threshold; equivale a recorrer
+        las filas en orden quedándose con la que mejora estrictamente el mejor puntaje.
+        Las filas se evalúan de mayor a menor cota para subir el corte cuanto antes.
+        should_stop se consulta antes de cada fila candidata; si retorna True la
+        búsqueda se abandona con SearchInterrupted (p. ej. al vencer un plazo).
+        """
+        stats = {} if stats is None else stats
+        first, last = row_range if row_range is not None else (0, len(self))
+        stats.update({'rows': last - first, 'quick_ratio': 0, 'scored': 0})
+        candidates, bounds = self._candidates(query, threshold, stats, row_range)
+        query_counts = Counter(query)
+
+        best_idx, best_ratio = None, threshold
+        for position in np.lexsort((candidates, -bounds)).tolist():
+            if should_stop is not None and should_stop():
+                raise SearchInterrupted()
+            idx = int(candidates[position])
+            if bounds[position] < best_ratio or (bounds[position] == best_ratio and best_idx is not None and idx > best_idx):
+                stats['qgram'] += 1
+                continue
+            quick = self._quick_bound(query_counts, len(query), idx)
+            if quick < best_ratio or (quick == best_ratio and (best_idx is None or idx > best_idx)):
+                stats['quick_ratio'] += 1
+                continue
+            stats['scored'] += 1
+            ratio = SequenceMatcher(None, query, self.texts[int(self._text_rows(idx))]).ratio()
+            if ratio > best_ratio or (ratio == best_ratio and best_idx is not None and idx < best_idx):
+                best_idx, best_ratio = idx, ratio
+
+        if best_idx is None:
+            return None
+        return best_idx, best_ratio
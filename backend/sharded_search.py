@@ -0,0 +1,167 @@
+"""
+Búsqueda del corpus repartida en procesos
+Cada proceso mantiene residente un fragmento contiguo del corpus con sus índices;
+una consulta se envía a los fragmentos que cortan su rango de filas (todos, si no
+se indica) y los top-k parciales se combinan con un heap
+"""
+
+import heapq
+import itertools
+import threading
+import multiprocessing as mp
+from typing import Dict, List, Optional, Tuple
+
+from search_index import BM25Index, CharNgramIndex
+from sequence_cascade import SequenceMatchCascade
+
+
+class CorpusShard:
+    """Filas [start, end) del corpus y los índices necesarios para buscarlas"""
+
+    def __init__(self, start: int, texts: List[str], bm25: Optional[BM25Index] = None,
+                 ngrams: Optional[CharNgramIndex] = None):
+        self.start = start
+        self.texts = texts
+        self.bm25 = bm25
+        self.ngrams = ngrams
+        self.cascade = None
+
+    def prepare(self):
+        """Precalcula la cascada de SequenceMatcher dentro del proceso del fragmento"""
+        self.cascade = SequenceMatchCascade(self.texts)
+
+    def search(self, mode: str, query: str, threshold: float, top_k: int,
+               row_range: Optional[Tuple[int, int]] = None) -> Tuple[List[Tuple], Dict]:
+        """
+        Top-k local como [(clave_de_orden, fila_global, similitud, puntaje)] y estadísticas.
+        row_range (filas globales) limita la búsqueda a su intersección con el fragmento.
+        """
+        stats = {}
+        local_range = None
+        if row_range is not None:
+            local_range = (max(row_range[0] - self.start, 0), min(row_range[1] - self.start, len(self.texts)))
+            if local_range[0] >= local_range[1]:
+                return [], stats
+        if mode == 'bm25':
+            hits = [
+                (score, self.start + doc_id, similarity, score)
+                for doc_id, score, similarity in self.bm25.search(query, top_k=top_k, doc_range=local_range)
+                if similarity > threshold
+            ]
+        elif mode == 'tfidf':
+            hits = [
+                (similarity, self.start + doc_id, similarity, similarity)
+                for doc_id, similarity in self.ngrams.search(query, top_k=top_k, min_score=threshold,
+                                                             doc_range=local_range)
+            ]
+        else:
+            # Mismo orden que la búsqueda secuencial: similitud redondeada y luego fila
+            hits = [
+                (round(similarity, 2), self.start + idx, similarity, similarity)
+                for idx, similarity in self.cascade.matches(query.lower(), threshold, stats, local_range)
+            ]
+        return heapq.nsmallest(top_k, hits, key=_rank_key), stats
+
+
+def _rank_key(hit: Tuple) -> Tuple:
+    """Mayor clave primero; a igual clave, la fila más temprana del corpus"""
+    return -hit[0], hit[1]
+
+
+def _shard_worker(connection, shard: CorpusShard):
+    """Bucle del proceso: recibe consultas hasta que llega None"""
+    try:
+        shard.prepare()
+        connection.send(('ready', None))
+    except Exception as e:
+        connection.send(('error', str(e)))
+        return
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        try:
+            connection.send(('ok', shard.search(*request)))
+        except Exception as e:
+            connection.send(('error', str(e)))
+    connection.close()
+
+
+class ShardedSearch:
+    """Reparte el corpus entre num_workers procesos persistentes"""
+
+    MODES = ('bm25', 'tfidf', 'sequence')
+
+    def __init__(self, questions: List[str], num_workers: int, bm25: Optional[BM25Index] = None,
+                 ngrams: Optional[CharNgramIndex] = None):
+        self.num_workers = max(1, num_workers)
+        self.num_rows = len(questions)
+        self.modes = {'sequence'} | ({'bm25'} if bm25 is not None else set()) | ({'tfidf'} if ngrams is not None else set())
+        self._lock = threading.Lock()
+        self._connections = []
+        self._processes = []
+
+        bounds = [self.num_rows * i // self.num_workers for i in range(self.num_workers + 1)]
+        self._bounds = list(zip(bounds[:-1], bounds[1:]))
+        texts = [str(question).lower() for question in questions]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            shard = CorpusShard(
+                start,
+                texts[start:end],
+                bm25.shard(start, end) if bm25 is not None else None,
+                ngrams.shard(start, end) if ngrams is not None else None
+            )
+            parent_end, child_end = mp.Pipe()
+            process = mp.Process(target=_shard_worker, args=(child_end, shard), daemon=True)
+            process.start()
+            child_end.close()
+            self._connections.append(parent_end)
+            self._processes.append(process)
+
+        for connection in self._connections:
+            status, error = connection.recv()
+            if status != 'ready':
+                self.close()
+                raise RuntimeError(f"No se pudo iniciar un fragmento del corpus: {error}")
+
+    def search(self, mode: str, query: str, threshold: float, top_k: int, stats: Dict = None,
+               row_range: Optional[Tuple[int, int]] = None) -> List[Tuple[int, float, float]]:
+        """
+        Retorna [(fila, similitud, puntaje)] combinando el top-k de cada fragmento.
+        Con row_range solo se consultan los fragmentos que cortan ese rango de filas.
+        """
+        with self._lock:
+            connections = [
+                connection for connection, (start, end) in zip(self._connections, self._bounds)
+                if row_range is None or (start < row_range[1] and row_range[0] < end)
+            ]
+            for connection in connections:
+                connection.send((mode, query, threshold, top_k, row_range))
+            replies = [connection.recv() for connection in connections]
+
+        partial_hits = []
+        for status, payload in replies:
+            if status != 'ok':
+                raise RuntimeError(f"Error en fragmento del corpus: {payload}")
+            hits, shard_stats = payload
+            partial_hits.append(hits)
+            if stats is not None:
+                for stage, count in shard_stats.items():
+                    stats[stage] = stats.get(stage, 0) + count
+
+        merged = heapq.merge(*partial_hits, key=_rank_key)
+        return [(row, similarity, score) for _, row, similarity, score in itertools.islice(merged, top_k)]
+
+    def close(self):
+        """Detiene los procesos de los fragmentos"""
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.send(None)
+                    connection.close()
+                except (OSError, EOFError):
+                    pass
+            for process in self._processes:
+                process.join(timeout=5)
+            self._connections = []
+            self._processes = []
@@ -0,0 +1,70 @@
+"""
+Endpoints de preguntas con CORPUS_AUTOLOAD=0: sin corpus integrado responden con la
+base de conocimiento local. Se llaman las funciones de los endpoints directamente.
+
+    cd backend && python -m pytest -q test_main_autoload.py
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope='module')
+def main(tmp_path_factory):
+    """Importa main sin corpus; el modelo y la base de datos se crean en un directorio temporal"""
+    previous_dir = os.getcwd()
+    previous_autoload = os.environ.get('CORPUS_AUTOLOAD')
+    os.environ['CORPUS_AUTOLOAD'] = '0'
+    os.chdir(tmp_path_factory.mktemp('autoload_off'))
+    sys.path.insert(0, BACKEND_DIR)
+    try:
+        yield importlib.import_module('main')
+    finally:
+        os.chdir(previous_dir)
+        if previous_autoload is None:
+            os.environ.pop('CORPUS_AUTOLOAD', None)
+        else:
+            os.environ['CORPUS_AUTOLOAD'] = previous_autoload
+
+
+def _ndjson(response):
+    """Líneas de una StreamingResponse NDJSON"""
+    async def collect():
+        return [chunk async for chunk in response.body_iterator]
+    body = ''.join(chunk if isinstance(chunk, str) else chunk.decode('utf-8') for chunk in asyncio.run(collect()))
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_knowledge_base_without_corpus(main):
+    assert not main.CORPUS_AVAILABLE
+    assert main.knowledge_base is not None
+    assert main.knowledge_base.corpus is None
+
+
+def test_ask(main):
+    response = main.ask_question(main.NLPRequest(description='qué síntomas tiene la diabetes'))
+    assert response['success']
+    assert response['source'] == 'builtin_local'
+    assert response['answer']
+
+
+def test_ask_batch(main):
+    questions = ['tipos de insulina', 'qué es la hipoglucemia']
+    lines = _ndjson(main.ask_questions_batch(main.BatchQuestionRequest(questions=questions)))
+    assert [line['index'] for line in lines] == [0, 1]
+    assert all(line['success'] for line in lines)
+    assert [line['question'] for line in lines] == questions
+
+
+def test_topics_and_corpus_stats(main):
+    topics = main.get_available_topics()
+    assert topics['success'] and topics['total_topics'] > 0
+    stats = main.get_corpus_statistics()
+    assert stats['success'] is False
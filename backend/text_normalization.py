@@ -0,0 +1,51 @@
+"""
+Normalización de textos para búsqueda
+La misma función produce las claves del corpus (calculadas una sola vez al ingerir)
+y normaliza las consultas: minúsculas, sin acentos (NFKD), signos de puntuación
+convertidos en espacios, espacios colapsados y, opcionalmente, sin palabras vacías.
+Así "azucar" coincide con "azúcar" sin trabajo extra por consulta.
+"""
+
+import os
+import re
+import unicodedata
+from typing import Dict
+
+# Aumentar al cambiar la normalización: invalida claves guardadas en snapshots
+NORMALIZATION_VERSION = 1
+
+# Con SEARCH_REMOVE_STOPWORDS=1 las claves y las consultas se guardan sin palabras vacías
+REMOVE_STOPWORDS = os.environ.get('SEARCH_REMOVE_STOPWORDS', '0') == '1'
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+# Palabras vacías en español e inglés, ya sin acentos (se comparan después de normalizar)
+STOPWORDS = frozenset("""
+    a al algo como con de del el ella ellas ellos en es esa ese eso esta este esto
+    la las le les lo los me mi mis muy no nos o para pero por que se si sin sobre
+    su sus te tu un una unas uno unos y ya yo
+    a an and are as at be but by do does for from has have how i if in is it its
+    me my of on or so than that the their them there these they this to was what
+    when where which who why will with you your
+""".split())
+
+
+def strip_accents(text: str) -> str:
+    """Descompone en NFKD y quita las marcas diacríticas"""
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize_text(text: str, remove_stopwords: bool = REMOVE_STOPWORDS) -> str:
+    """Clave de búsqueda de un texto (se aplica igual a filas y a consultas)"""
+    tokens = _NON_WORD.sub(' ', strip_accents(str(text).lower())).split()
+    if remove_stopwords:
+        tokens = [token for token in tokens if token not in STOPWORDS]
+    return ' '.join(tokens)
+
+
+def normalization_signature(remove_stopwords: bool = REMOVE_STOPWORDS) -> Dict:
+    """Identifica la normalización con que se calcularon unas claves guardadas"""
+    return {'version': NORMALIZATION_VERSION, 'stopwords': bool(remove_stopwords)}